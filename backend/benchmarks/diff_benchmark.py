@@ -0,0 +1,320 @@
+"""
+Benchmark for DocumentDiffService and TableDiffService on synthetic and recorded corpora
+
+Run from the backend directory:
+
+    python -m benchmarks.diff_benchmark                       # full suite, compared with the baseline
+    python -m benchmarks.diff_benchmark --quick               # 1k-100k words, 10-1k rows
+    python -m benchmarks.diff_benchmark --save-baseline       # record the current timings as the baseline
+    python -m benchmarks.diff_benchmark --corpus path/to/dir  # also diff recorded NAME.original.* / NAME.revised.* pairs
+
+Every case reports the best of --repeat runs, throughput and the peak memory of
+one traced run. Cases slower than the baseline by more than --tolerance are
+listed as regressions and make the script exit with status 1. Baselines are
+machine specific; record one on the machine you compare on.
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.diff_service import DocumentDiffService  # noqa: E402
+from services.table_diff_service import TableDiffService  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'diff_baseline.json')
+
+TEXT_SIZES = (1000, 10000, 100000, 1000000)
+TABLE_SIZES = (10, 100, 1000, 10000)
+QUICK_TEXT_SIZES = (1000, 10000, 100000)
+QUICK_TABLE_SIZES = (10, 100, 1000)
+PATTERNS = ('scattered', 'block_move', 'rewrite')
+
+TABLE_SECTION = 'model_risk_issues'
+TABLE_FIELDS = ['title', 'description', 'category', 'importance']
+CATEGORIES = ['Operational Risk', 'Market Risk', 'Credit Risk']
+IMPORTANCE = ['Critical', 'High', 'Low']
+
+SYLLABLES = ['ra', 'ti', 'mo', 'del', 'ex', 'po', 'sure', 'val', 'id', 'at', 'ion', 'risk', 'cal', 'i', 'br', 'ate', 'ing', 'da', 'ta', 'pro', 'cess']
+
+
+def make_vocabulary(rng: random.Random, size: int = 4000) -> tuple:
+    """Pseudo-words with Zipf-like weights, so common words repeat the way they do in prose"""
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 4))))
+    words = sorted(words)
+    rng.shuffle(words)
+    return words, [1.0 / rank for rank in range(1, size + 1)]
+
+
+def make_document(word_count: int, seed: int) -> list:
+    """A document as a list of (words, ends_paragraph) sentences"""
+    rng = random.Random(seed)
+    vocabulary, weights = make_vocabulary(rng)
+    words = rng.choices(vocabulary, weights, k=word_count)
+    sentences = []
+    position = 0
+    while position < word_count:
+        length = rng.randint(8, 25)
+        sentences.append((words[position:position + length], rng.random() < 0.15))
+        position += length
+    return sentences
+
+
+def render_document(sentences: list) -> str:
+    parts = []
+    for words, ends_paragraph in sentences:
+        parts.append(' '.join(words).capitalize() + '.')
+        parts.append('\n\n' if ends_paragraph else ' ')
+    return ''.join(parts).strip()
+
+
+def edit_document(sentences: list, pattern: str, seed: int) -> list:
+    """Apply one edit pattern: scattered word edits, moved blocks of sentences, or a full rewrite"""
+    rng = random.Random(seed)
+    if pattern == 'rewrite':
+        return make_document(sum(len(words) for words, _ in sentences), seed + 1)
+
+    edited = [(list(words), ends_paragraph) for words, ends_paragraph in sentences]
+    if pattern == 'scattered':
+        vocabulary, weights = make_vocabulary(random.Random(seed + 2), 500)
+        # About 1% of words replaced, deleted or inserted
+        for _ in range(max(1, sum(len(words) for words, _ in edited) // 100)):
+            words = edited[rng.randrange(len(edited))][0]
+            index = rng.randrange(len(words))
+            action = rng.random()
+            if action < 0.7:
+                words[index] = rng.choices(vocabulary, weights)[0]
+            elif action < 0.85 and len(words) > 1:
+                del words[index]
+            else:
+                words.insert(index, rng.choices(vocabulary, weights)[0])
+    elif pattern == 'block_move':
+        # Three blocks of about 2% of the sentences each move elsewhere
+        block = max(1, len(edited) // 50)
+        for _ in range(3):
+            start = rng.randrange(max(1, len(edited) - block))
+            moved = edited[start:start + block]
+            del edited[start:start + block]
+            target = rng.randrange(len(edited) + 1)
+            edited[target:target] = moved
+    else:
+        raise ValueError(f"Unknown edit pattern '{pattern}'")
+    return edited
+
+
+def make_rows(row_count: int, seed: int) -> list:
+    rng = random.Random(seed)
+    vocabulary, weights = make_vocabulary(rng, 2000)
+    return [
+        {
+            'title': f"Issue {index + 1}: " + ' '.join(rng.choices(vocabulary, weights, k=3)).capitalize(),
+            'description': ' '.join(rng.choices(vocabulary, weights, k=rng.randint(15, 40))).capitalize() + '.',
+            'category': rng.choice(CATEGORIES),
+            'importance': rng.choice(IMPORTANCE)
+        }
+        for index in range(row_count)
+    ]
+
+
+def edit_rows(rows: list, pattern: str, seed: int) -> list:
+    """Apply one edit pattern: edited cells in a few rows, moved blocks of rows, or all new rows"""
+    rng = random.Random(seed)
+    if pattern == 'rewrite':
+        return make_rows(len(rows), seed + 1)
+
+    edited = [dict(row) for row in rows]
+    if pattern == 'scattered':
+        vocabulary, weights = make_vocabulary(random.Random(seed + 2), 500)
+        for row in rng.sample(edited, max(1, len(edited) // 20)):
+            words = row['description'].split()
+            words[rng.randrange(len(words))] = rng.choices(vocabulary, weights)[0]
+            row['description'] = ' '.join(words)
+            if rng.random() < 0.2:
+                row['category'] = rng.choice(CATEGORIES)
+    elif pattern == 'block_move':
+        block = max(1, len(edited) // 20)
+        for _ in range(3):
+            start = rng.randrange(max(1, len(edited) - block))
+            moved = edited[start:start + block]
+            del edited[start:start + block]
+            target = rng.randrange(len(edited) + 1)
+            edited[target:target] = moved
+    else:
+        raise ValueError(f"Unknown edit pattern '{pattern}'")
+    return edited
+
+
+def render_table(table_service: TableDiffService, rows: list) -> str:
+    """Pretty-print rows in the {"rows": [...]} layout the review endpoints diff"""
+    lines = [table_service._format_row(row, TABLE_FIELDS, index < len(rows) - 1) for index, row in enumerate(rows)]
+    return '{\n  "rows": [\n' + ''.join(lines) + '  ]\n}'
+
+
+def measure(function, repeat: int, trace_memory: bool) -> tuple:
+    """(best seconds, peak bytes of one traced run or None, last return value)"""
+    best = float('inf')
+    value = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        value = function()
+        best = min(best, time.perf_counter() - start)
+
+    peak = None
+    if trace_memory:
+        gc.collect()
+        tracemalloc.start()
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return best, peak, value
+
+
+def run_text_cases(service: DocumentDiffService, sizes, patterns, repeat, trace_memory):
+    for size in sizes:
+        original_sentences = make_document(size, seed=size)
+        original = render_document(original_sentences)
+        for pattern in patterns:
+            revised = render_document(edit_document(original_sentences, pattern, seed=size + 7))
+            name = f"text/{pattern}/{size}"
+
+            seconds, peak, result = measure(lambda: service.compute_document_diff(original, revised), repeat, trace_memory)
+            yield name + '/diff', size, 'words', seconds, peak, {'granularity': result.granularity, 'segments': len(result)}
+
+            # Stats are collected during the diff; this times reading them out
+            seconds, peak, _ = measure(lambda: service.compute_diff_summary(result), repeat, False)
+            yield name + '/summary', size, 'words', seconds, peak, {}
+
+            # Segment encoding for the wire (merging happens while segments are added)
+            seconds, peak, _ = measure(lambda: result.to_compact(), repeat, False)
+            yield name + '/compact', size, 'words', seconds, peak, {}
+
+
+def run_table_cases(service: DocumentDiffService, sizes, patterns, repeat, trace_memory):
+    table_service = TableDiffService(service)
+    for size in sizes:
+        original_rows = make_rows(size, seed=size)
+        original = render_table(table_service, original_rows)
+        for pattern in patterns:
+            revised_rows = edit_rows(original_rows, pattern, seed=size + 7)
+            revised = render_table(table_service, revised_rows)
+            name = f"table/{pattern}/{size}"
+
+            seconds, peak, result = measure(lambda: service.compute_document_diff(original, revised), repeat, trace_memory)
+            yield name + '/text_diff', size, 'rows', seconds, peak, {'granularity': result.granularity, 'segments': len(result)}
+
+            def structural():
+                table_diff = table_service.compute_table_diff(original_rows, revised_rows, TABLE_SECTION, TABLE_FIELDS)
+                return table_service.to_diff_segments(table_diff, TABLE_FIELDS), table_diff['summary']
+
+            seconds, peak, (result, summary) = measure(structural, repeat, trace_memory)
+            yield name + '/table_diff', size, 'rows', seconds, peak, {'segments': len(result), 'rows_changed': size - summary['rows_unchanged']}
+
+
+def run_corpus_cases(service: DocumentDiffService, corpus_dir: str, repeat, trace_memory):
+    """Diff every NAME.original.EXT / NAME.revised.EXT pair found in a directory"""
+    for filename in sorted(os.listdir(corpus_dir)):
+        stem, _, extension = filename.partition('.original.')
+        if not extension:
+            continue
+        revised_path = os.path.join(corpus_dir, f"{stem}.revised.{extension}")
+        if not os.path.exists(revised_path):
+            continue
+        with open(os.path.join(corpus_dir, filename), encoding='utf-8') as fh:
+            original = fh.read()
+        with open(revised_path, encoding='utf-8') as fh:
+            revised = fh.read()
+        size = max(len(original.split()), len(revised.split()))
+        seconds, peak, result = measure(lambda: service.compute_document_diff(original, revised), repeat, trace_memory)
+        yield f"corpus/{stem}/diff", size, 'words', seconds, peak, {'granularity': result.granularity, 'segments': len(result)}
+
+
+def format_row(name, size, unit, seconds, peak, details, baseline_seconds):
+    throughput = f"{size / seconds:,.0f} {unit}/s" if seconds > 0 else '-'
+    memory = f"{peak / 1048576:.1f} MB" if peak is not None else ''
+    change = f"{(seconds / baseline_seconds - 1) * 100:+.0f}%" if baseline_seconds else ''
+    extra = ' '.join(f"{key}={value}" for key, value in details.items())
+    return f"{name:<36} {seconds * 1000:>10.2f} ms {throughput:>20} {memory:>10} {change:>7}  {extra}"
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--quick', action='store_true', help='skip the 1M word and 10k row cases')
+    parser.add_argument('--sizes', help='comma-separated document sizes in words')
+    parser.add_argument('--rows', help='comma-separated table sizes in rows')
+    parser.add_argument('--patterns', default=','.join(PATTERNS), help='comma-separated edit patterns')
+    parser.add_argument('--algorithm', help='diff engine (default: DIFF_ALGORITHM or histogram)')
+    parser.add_argument('--time-budget', type=float, help='seconds per granularity attempt (default: DIFF_TIME_BUDGET_MS)')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per case; the best is reported')
+    parser.add_argument('--no-memory', action='store_true', help='skip the traced run that measures peak memory')
+    parser.add_argument('--corpus', help='directory of recorded NAME.original.* / NAME.revised.* pairs')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='baseline file to compare with or save to')
+    parser.add_argument('--save-baseline', action='store_true', help='write the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown against the baseline')
+    args = parser.parse_args(argv)
+
+    text_sizes = [int(size) for size in args.sizes.split(',')] if args.sizes else (QUICK_TEXT_SIZES if args.quick else TEXT_SIZES)
+    table_sizes = [int(size) for size in args.rows.split(',')] if args.rows else (QUICK_TABLE_SIZES if args.quick else TABLE_SIZES)
+    patterns = [pattern for pattern in args.patterns.split(',') if pattern]
+
+    # No result cache: every run must compute its diff
+    service = DocumentDiffService(algorithm=args.algorithm)
+    if args.time_budget is not None:
+        service.TIME_BUDGET = args.time_budget
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as fh:
+            baseline = json.load(fh).get('cases', {})
+
+    print(f"engine={service.engine.name} time_budget={service.TIME_BUDGET}s repeat={args.repeat} python={platform.python_version()}")
+    print(f"{'case':<36} {'best':>13} {'throughput':>20} {'peak mem':>10} {'vs base':>7}")
+
+    cases = [
+        run_text_cases(service, text_sizes, patterns, args.repeat, not args.no_memory),
+        run_table_cases(service, table_sizes, patterns, args.repeat, not args.no_memory)
+    ]
+    if args.corpus:
+        cases.append(run_corpus_cases(service, args.corpus, args.repeat, not args.no_memory))
+
+    results = {}
+    regressions = []
+    for case in cases:
+        for name, size, unit, seconds, peak, details in case:
+            baseline_seconds = baseline.get(name, {}).get('seconds')
+            print(format_row(name, size, unit, seconds, peak, details, baseline_seconds), flush=True)
+            results[name] = {'seconds': round(seconds, 6), 'peak_bytes': peak, **details}
+            # Sub-millisecond cases are too noisy to flag
+            if baseline_seconds and seconds > baseline_seconds * (1 + args.tolerance) and seconds - baseline_seconds > 0.001:
+                regressions.append((name, baseline_seconds, seconds))
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as fh:
+            json.dump({
+                'engine': service.engine.name,
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'cases': results
+            }, fh, indent=2, sort_keys=True)
+            fh.write('\n')
+        print(f"Saved baseline to {args.baseline}")
+
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) over {args.tolerance:.0%} tolerance:")
+        for name, before, after in regressions:
+            print(f"  {name}: {before * 1000:.2f} ms -> {after * 1000:.2f} ms")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,261 @@
+"""
+Benchmark for DocxTemplate.patch_xml and cold and warm renders on synthetic and recorded templates
+
+Run from the backend directory:
+
+    python -m benchmarks.template_benchmark                       # full suite, compared with the baseline
+    python -m benchmarks.template_benchmark --quick               # 10 and 100 table templates only
+    python -m benchmarks.template_benchmark --save-baseline       # record the current timings and outputs
+    python -m benchmarks.template_benchmark --corpus path/to/dir  # also run every .docx template in a directory
+
+Besides timings, the baseline records a digest of every patch_xml output
+(the golden corpus). A case whose input is unchanged but whose patched XML
+differs from the baseline is reported as a mismatch and makes the script
+exit with status 1, as do cases slower than the baseline by more than
+--tolerance. Timings are machine specific; digests are not, as long as the
+installed python-docx produces the same template XML.
+"""
+
+import argparse
+import gc
+import hashlib
+import io
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from docx import Document  # noqa: E402
+
+from services.template_service import create_default_template  # noqa: E402
+from template import DocxTemplate  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'template_baseline.json')
+
+TABLE_COUNTS = (10, 100, 500)
+QUICK_TABLE_COUNTS = (10, 100)
+# 'loops': row loops and placeholders only, like the default template;
+# 'directives': also cellbg, colspan, vm, hm, {%p}, {{r}}, {%- -%} and comments
+VARIANTS = ('loops', 'directives')
+COLUMNS = 4
+
+
+def add_runs(paragraph, text: str, rng: random.Random, pieces: int = 3) -> None:
+    """Split text over several runs at random points, as Word does while a template is edited"""
+    cuts = sorted(rng.sample(range(1, len(text)), min(pieces, len(text) - 1)))
+    start = 0
+    for cut in cuts + [len(text)]:
+        run = paragraph.add_run(text[start:cut])
+        run.bold = rng.random() < 0.3
+        start = cut
+
+
+def make_template(table_count: int, variant: str, seed: int) -> bytes:
+    rng = random.Random(seed)
+    directives = variant == 'directives'
+    document = Document()
+    for index in range(table_count):
+        document.add_heading(f"Section {index}", level=1)
+        add_runs(document.add_paragraph(), f"Summary: {{{{ summary_{index} }}}} as “{{{{ title_{index} }}}}”.", rng)
+        if directives:
+            add_runs(document.add_paragraph(), f"{{%p if show_{index} %}}", rng)
+            add_runs(document.add_paragraph(), f"Shown when {{{{ limit_{index} }}}} &lt; 10", rng)
+            add_runs(document.add_paragraph(), "{%p endif %}", rng)
+
+        table = document.add_table(rows=4, cols=COLUMNS)
+        table.cell(0, 0).text = f"{{%tr for row in rows_{index} %}}"
+        for column in range(COLUMNS):
+            text = f"{{{{ row.col{column} }}}}"
+            if directives and column == 1:
+                text = '{% cellbg row.color %}' + text
+            elif directives and column == 2:
+                text = '{% colspan row.span %}' + text
+            elif directives and column == 3 and index % 2:
+                text = '{% vm %}' + text
+            add_runs(table.cell(1, column).paragraphs[0], text, rng, pieces=1)
+        table.cell(2, 0).text = '{%tr endfor %}'
+        if directives:
+            table.cell(3, 0).text = f"{{{{r rich_{index} }}}} then {{%- if flag -%}} inline {{% endif %}}"
+            if index % 3 == 0:
+                merged = document.add_table(rows=1, cols=3)
+                merged.cell(0, 0).text = '{%tc for column in columns %}'
+                merged.cell(0, 1).text = '{% hm %}{{ column }}'
+                merged.cell(0, 2).text = '{%tc endfor %}'
+            add_runs(document.add_paragraph(), '{#p reviewer note #}', rng)
+
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+def make_context(table_count: int) -> dict:
+    rows = [
+        {'col0': 'Alpha', 'col1': 'Beta', 'col2': 'Gamma', 'col3': 'Delta', 'color': 'FF0000', 'span': 1}
+        for _ in range(5)
+    ]
+    context = {'columns': ['A', 'B'], 'flag': True}
+    for index in range(table_count):
+        context.update({
+            f"summary_{index}": 'Text',
+            f"title_{index}": 'Title',
+            f"show_{index}": True,
+            f"limit_{index}": 3,
+            f"rows_{index}": rows,
+            f"rich_{index}": 'Rich'
+        })
+    return context
+
+
+def default_context() -> dict:
+    rows = [
+        {'id': index + 1, 'title': 'Issue', 'description': 'Description', 'category': 'Market Risk', 'importance': 'High'}
+        for index in range(20)
+    ]
+    return {'background': 'Background', 'product': 'Product', 'usage': 'Usage', 'model_risk_issues': rows, 'model_limitations': rows}
+
+
+def measure(function, repeat: int) -> tuple:
+    """(best seconds, last return value)"""
+    best = float('inf')
+    value = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        value = function()
+        best = min(best, time.perf_counter() - start)
+    return best, value
+
+
+def digest(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def run_template(name: str, content: bytes, context: dict, repeat: int):
+    template = DocxTemplate(io.BytesIO(content))
+    template.init_docx()
+    xml = template.get_xml()
+    size = len(xml)
+
+    seconds, patched = measure(lambda: template.patch_xml(xml), repeat)
+    yield name + '/patch_xml', size, seconds, {'input_sha256': digest(xml), 'output_sha256': digest(patched)}
+
+    def render(cold: bool = True):
+        # Cold render: the caches would otherwise skip opening the package and patch_xml
+        if cold:
+            DocxTemplate.compiled_parts.clear()
+            DocxTemplate.packages.clear()
+        document = DocxTemplate(io.BytesIO(content))
+        document.render(context)
+        return document
+
+    seconds, _ = measure(render, repeat)
+    yield name + '/render', size, seconds, {}
+
+    # Warm render, as for every export after the first from a template
+    render()
+    seconds, _ = measure(lambda: render(cold=False), repeat)
+    yield name + '/warm_render', size, seconds, {}
+
+
+def run_synthetic_cases(table_counts, variants, repeat):
+    for table_count in table_counts:
+        for variant in variants:
+            content = make_template(table_count, variant, seed=table_count)
+            yield from run_template(f"synthetic/{variant}/{table_count}", content, make_context(table_count), repeat)
+
+
+def run_corpus_cases(corpus_dir: str, repeat):
+    """Patch and render every .docx template in a directory (rendered with an empty context)"""
+    for filename in sorted(os.listdir(corpus_dir)):
+        if not filename.endswith('.docx'):
+            continue
+        with open(os.path.join(corpus_dir, filename), 'rb') as fh:
+            content = fh.read()
+        yield from run_template(f"corpus/{filename[:-5]}", content, {}, repeat)
+
+
+def format_row(name, size, seconds, baseline_seconds, status):
+    throughput = f"{size / seconds / 1048576:,.1f} MB/s" if seconds > 0 else '-'
+    change = f"{(seconds / baseline_seconds - 1) * 100:+.0f}%" if baseline_seconds else ''
+    return f"{name:<36} {size:>10,} {seconds * 1000:>10.2f} ms {throughput:>12} {change:>7}  {status}"
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--quick', action='store_true', help='skip the 500 table templates')
+    parser.add_argument('--tables', help='comma-separated table counts of the synthetic templates')
+    parser.add_argument('--variants', default=','.join(VARIANTS), help='comma-separated template variants')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per case; the best is reported')
+    parser.add_argument('--corpus', help='directory of .docx templates')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='baseline file to compare with or save to')
+    parser.add_argument('--save-baseline', action='store_true', help='write the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown against the baseline')
+    args = parser.parse_args(argv)
+
+    table_counts = [int(count) for count in args.tables.split(',')] if args.tables else (QUICK_TABLE_COUNTS if args.quick else TABLE_COUNTS)
+    variants = [variant for variant in args.variants.split(',') if variant]
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as fh:
+            baseline = json.load(fh).get('cases', {})
+
+    print(f"repeat={args.repeat} python={platform.python_version()}")
+    print(f"{'case':<36} {'xml chars':>10} {'best':>13} {'throughput':>12} {'vs base':>7}")
+
+    cases = [
+        run_template('default', create_default_template().getvalue(), default_context(), args.repeat),
+        run_synthetic_cases(table_counts, variants, args.repeat)
+    ]
+    if args.corpus:
+        cases.append(run_corpus_cases(args.corpus, args.repeat))
+
+    results = {}
+    regressions = []
+    mismatches = []
+    for case in cases:
+        for name, size, seconds, details in case:
+            expected = baseline.get(name, {})
+            baseline_seconds = expected.get('seconds')
+            status = ''
+            if 'output_sha256' in expected:
+                if expected.get('input_sha256') != details['input_sha256']:
+                    status = 'input changed, output not compared'
+                elif expected['output_sha256'] != details['output_sha256']:
+                    status = 'OUTPUT MISMATCH'
+                    mismatches.append(name)
+                else:
+                    status = 'output identical'
+            print(format_row(name, size, seconds, baseline_seconds, status), flush=True)
+            results[name] = {'seconds': round(seconds, 6), 'xml_chars': size, **details}
+            # Sub-millisecond cases are too noisy to flag
+            if baseline_seconds and seconds > baseline_seconds * (1 + args.tolerance) and seconds - baseline_seconds > 0.001:
+                regressions.append((name, baseline_seconds, seconds))
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as fh:
+            json.dump({
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'cases': results
+            }, fh, indent=2, sort_keys=True)
+            fh.write('\n')
+        print(f"Saved baseline to {args.baseline}")
+
+    if mismatches:
+        print(f"\n{len(mismatches)} case(s) patch the template differently from the baseline:")
+        for name in mismatches:
+            print(f"  {name}")
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) over {args.tolerance:.0%} tolerance:")
+        for name, before, after in regressions:
+            print(f"  {name}: {before * 1000:.2f} ms -> {after * 1000:.2f} ms")
+    return 1 if mismatches or regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -25,6 +25,15 @@ Notes: {notes}
 Outline: {outline}
 
 Generate the section content:
+""",
+        "outline_draft": """
+Write content for the {section_name} section based on the following notes.
+First plan a structured outline that will achieve the objectives in the guidelines below,
+then write the section content following that outline.
+
+Notes: {notes}
+
+Return the outline and the complete section content in the structured response fields:
 """,
         "review": """
 Review and analyze the following {section_name} section content. Provide specific, constructive feedback.
@@ -72,6 +81,7 @@ Generate the revised content:
                 action_map = {
                     'outline': 'the final content (create an outline that will achieve these goals)',
                     'draft': 'writing the content', 
+                    'outline_draft': 'planning and writing the content',
                     'review': 'providing feedback',
                     'revision': 'revising the content'
                 }
@@ -1,4 +1,5 @@
 import tornado.ioloop
+import tornado.iostream
 import tornado.web
 from datetime import datetime
 import json
@@ -14,8 +15,11 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 HOST = getenv('HOST', '0.0.0.0')
 PORT = int(getenv('PORT', 8888))
 
-from services.generation_service import GenerationService
+from services.service_registry import ServiceRegistry
+from services.generation_errors import GenerationError
+from services.diff_service import DiffResult
 from services.document_generation_service import DocumentGenerationService
+from template import DocxTemplate
 from services.review_data_service import get_raw_review_data
 
 # In-memory storage for uploaded templates
@@ -23,6 +27,9 @@ uploaded_templates = {}
 
 
 class ServiceHandler(tornado.web.RequestHandler):
+    # Scheduler lane for LLM calls made by this handler: interactive, normal or bulk
+    PRIORITY = 'normal'
+    
     def set_default_headers(self):
         self.set_header("Access-Control-Allow-Origin", "*")
         self.set_header("Access-Control-Allow-Headers", "Content-Type")
@@ -32,6 +39,66 @@ class ServiceHandler(tornado.web.RequestHandler):
     def options(self):
         self.set_status(204)
         self.finish()
+    
+    def get_generation_service(self, body):
+        """Get the shared generation service for the request's model with per-request options applied"""
+        generation_service = ServiceRegistry.get_generation_service(body.get('modelId', None))
+        return generation_service.with_options(
+            use_cache=not body.get('bypassCache', False),
+            priority=self.PRIORITY
+        )
+    
+    def encode_diff(self, result, body):
+        """Serialize result['diff_segments'] as segment dicts, or in the compact format when diffFormat is 'compact'"""
+        diff = result.get('diff_segments')
+        if not isinstance(diff, DiffResult):
+            return result
+        if body.get('diffFormat') == 'compact':
+            # Reference texts the client already has (request fields or other response fields) instead of resending them
+            known_texts = {}
+            for prefix, values in (('request.', body), ('', result)):
+                for key, value in values.items():
+                    if isinstance(value, str):
+                        known_texts.setdefault(value, prefix + key)
+            result['diff_segments'] = diff.to_compact(
+                original_ref=known_texts.get(diff.original),
+                revised_ref=known_texts.get(diff.revised)
+            )
+        else:
+            result['diff_segments'] = diff.to_dicts()
+        return result
+
+
+class StreamingHandler(ServiceHandler):
+    """Base handler for server-sent-event responses written as chunked output"""
+    
+    def start_event_stream(self):
+        self.set_header("Content-Type", "text/event-stream")
+        self.set_header("Cache-Control", "no-cache")
+        # Stop reverse proxies from buffering the stream
+        self.set_header("X-Accel-Buffering", "no")
+    
+    async def send_event(self, event, data):
+        """Write one SSE event and flush it; returns False once the client has disconnected"""
+        try:
+            self.write(f"event: {event}\ndata: {json.dumps(data)}\n\n")
+            await self.flush()
+            return True
+        except tornado.iostream.StreamClosedError:
+            return False
+    
+    async def stream_events(self, events):
+        """Forward (event, data) tuples from an async generator until it ends or the client leaves"""
+        self.start_event_stream()
+        try:
+            async for event, data in events:
+                if not await self.send_event(event, data):
+                    break
+        except Exception as e:
+            # Headers are already flushed, so failures must travel as an event
+            await self.send_event("error", {"error": str(e)})
+        finally:
+            await events.aclose()
 
 
 class HelloHandler(ServiceHandler):
@@ -46,6 +113,24 @@ class HelloHandler(ServiceHandler):
         self.write(json.dumps(response))
 
 
+class MetricsHandler(ServiceHandler):
+    def get(self):
+        response = {
+            "result": {
+                "response_cache": ServiceRegistry.get_response_cache().get_stats(),
+                "diff_cache": ServiceRegistry.get_diff_cache().get_stats(),
+                "cpu_pool": ServiceRegistry.get_cpu_pool().get_stats(),
+                "template_cache": DocxTemplate.compiled_parts.get_stats(),
+                "template_packages": DocxTemplate.packages.get_stats(),
+                "single_flight": ServiceRegistry.get_single_flight().get_stats(),
+                "scheduler": ServiceRegistry.get_scheduler().get_stats(),
+                "models": ServiceRegistry.get_service_stats()
+            }
+        }
+        self.set_header("Content-Type", "application/json")
+        self.write(json.dumps(response))
+
+
 class ReviewLookupHandler(ServiceHandler):
     # Field mapping from internal names to display-friendly names for frontend
     DISPLAY_FIELD_MAPPING = {
@@ -110,26 +195,76 @@ class GenerateDraftFromNotesHandler(ServiceHandler):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
-    def post(self):
+    async def post(self):
         try:
             body = json.loads(self.request.body)
             notes = body.get('notes', '')
             section_name = body.get('sectionName', 'Section')
             section_type = body.get('sectionType', 'default')
             guidelines = body.get('guidelines', None)
-            model_id = body.get('modelId', None)
+            draft_mode = body.get('draftMode', None)
             
-            # Create generation service with specified model
-            generation_service = GenerationService(model_id)
+            # Get the shared generation service for the specified model
+            generation_service = self.get_generation_service(body)
             
             # Use combined generation service method
-            draft = generation_service.generate_draft_from_notes(
-                notes, section_name, section_type, guidelines
+            draft = await generation_service.generate_draft_from_notes(
+                notes, section_name, section_type, guidelines, draft_mode
             )
             
             response = {"result": draft}
             self.set_header("Content-Type", "application/json")
             self.write(json.dumps(response))
+        except GenerationError as e:
+            self.set_status(e.status_code)
+            self.write(json.dumps({"error": str(e)}))
+        except Exception as e:
+            self.set_status(500)
+            self.write(json.dumps({"error": str(e)}))
+
+
+class GenerateDraftFromNotesStreamHandler(StreamingHandler):
+    async def post(self):
+        try:
+            body = json.loads(self.request.body)
+            notes = body.get('notes', '')
+            section_name = body.get('sectionName', 'Section')
+            section_type = body.get('sectionType', 'default')
+            guidelines = body.get('guidelines', None)
+            
+            # Get the shared generation service for the specified model
+            generation_service = self.get_generation_service(body)
+            
+            # Stream outline then draft tokens as they arrive
+            await self.stream_events(generation_service.stream_draft_from_notes(
+                notes, section_name, section_type, guidelines
+            ))
+        except Exception as e:
+            self.set_status(500)
+            self.write(json.dumps({"error": str(e)}))
+
+
+class GenerateDraftsBatchHandler(StreamingHandler):
+    PRIORITY = 'bulk'
+    
+    async def post(self):
+        try:
+            body = json.loads(self.request.body)
+            sections = body.get('sections', [])
+            max_concurrency = body.get('maxConcurrency', None)
+            
+            if not sections:
+                self.set_status(400)
+                self.write(json.dumps({"error": "At least one section is required"}))
+                return
+            
+            # Get the shared generation service for the specified model
+            generation_service = self.get_generation_service(body)
+            
+            # Stream each section's draft as soon as its pipeline finishes
+            await self.stream_events(generation_service.generate_drafts_for_sections(
+                sections, max_concurrency
+            ))
         except Exception as e:
             self.set_status(500)
             self.write(json.dumps({"error": str(e)}))
@@ -139,7 +274,7 @@ class GenerateDraftFromReviewWithDiffHandler(ServiceHandler):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
-    def post(self):
+    async def post(self):
         try:
             body = json.loads(self.request.body)
             draft = body.get('draft', '')
@@ -148,10 +283,9 @@ class GenerateDraftFromReviewWithDiffHandler(ServiceHandler):
             section_type = body.get('sectionType', 'default')
             guidelines = body.get('guidelines', None)
             draft_guidelines = body.get('draftGuidelines', None)
-            model_id = body.get('modelId', None)
             
-            # Create generation service with specified model
-            generation_service = GenerationService(model_id)
+            # Get the shared generation service for the specified model
+            generation_service = self.get_generation_service(body)
             
             # Combine guidelines if both are provided
             combined_guidelines = guidelines
@@ -161,7 +295,7 @@ class GenerateDraftFromReviewWithDiffHandler(ServiceHandler):
                 combined_guidelines = f"Revise this draft while maintaining the original requirements:\n{draft_guidelines}"
             
             # Use enhanced generation service method with diff computation
-            result = generation_service.apply_review_notes_with_diff(
+            result = await generation_service.apply_review_notes_with_diff(
                 draft, review_notes, section_name, section_type, combined_guidelines
             )
             
@@ -171,9 +305,12 @@ class GenerateDraftFromReviewWithDiffHandler(ServiceHandler):
                 self.write(json.dumps({"error": result["error"]}))
                 return
             
-            response = {"result": result}
+            response = {"result": self.encode_diff(result, body)}
             self.set_header("Content-Type", "application/json")
             self.write(json.dumps(response))
+        except GenerationError as e:
+            self.set_status(e.status_code)
+            self.write(json.dumps({"error": str(e)}))
         except Exception as e:
             self.set_status(500)
             self.write(json.dumps({"error": str(e)}))
@@ -183,7 +320,7 @@ class GenerateRowFromReviewWithDiffHandler(ServiceHandler):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
-    def post(self):
+    async def post(self):
         try:
             body = json.loads(self.request.body)
             row_data = body.get('rowData', {})
@@ -195,10 +332,9 @@ class GenerateRowFromReviewWithDiffHandler(ServiceHandler):
             guidelines = body.get('guidelines', None)
             draft_guidelines = body.get('draftGuidelines', None)
             full_table_data = body.get('fullTableData', None)
-            model_id = body.get('modelId', None)
             
-            # Create generation service with specified model
-            generation_service = GenerationService(model_id)
+            # Get the shared generation service for the specified model
+            generation_service = self.get_generation_service(body)
             
             # Combine guidelines if both are provided
             combined_guidelines = guidelines
@@ -208,7 +344,7 @@ class GenerateRowFromReviewWithDiffHandler(ServiceHandler):
                 combined_guidelines = draft_guidelines
             
             # Use row review service method
-            result = generation_service.review_table_row_with_diff(
+            result = await generation_service.review_table_row_with_diff(
                 row_data, review_notes, columns, section_name, section_type, combined_guidelines, full_table_data
             )
             
@@ -218,19 +354,24 @@ class GenerateRowFromReviewWithDiffHandler(ServiceHandler):
                 self.write(json.dumps({"error": result["error"]}))
                 return
             
-            response = {"result": result}
+            response = {"result": self.encode_diff(result, body)}
             self.set_header("Content-Type", "application/json")
             self.write(json.dumps(response))
+        except GenerationError as e:
+            self.set_status(e.status_code)
+            self.write(json.dumps({"error": str(e)}))
         except Exception as e:
             self.set_status(500)
             self.write(json.dumps({"error": str(e)}))
 
 
 class GenerateTableFromReviewWithDiffHandler(ServiceHandler):
+    PRIORITY = 'bulk'
+    
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
-    def post(self):
+    async def post(self):
         try:
             body = json.loads(self.request.body)
             draft = body.get('draft', '')
@@ -239,10 +380,9 @@ class GenerateTableFromReviewWithDiffHandler(ServiceHandler):
             section_type = body.get('sectionType', None)
             guidelines = body.get('guidelines', None)
             draft_guidelines = body.get('draftGuidelines', None)
-            model_id = body.get('modelId', None)
             
-            # Create generation service with specified model
-            generation_service = GenerationService(model_id)
+            # Get the shared generation service for the specified model
+            generation_service = self.get_generation_service(body)
             
             # Combine guidelines if both are provided
             combined_guidelines = guidelines
@@ -252,7 +392,7 @@ class GenerateTableFromReviewWithDiffHandler(ServiceHandler):
                 combined_guidelines = draft_guidelines
             
             # Use table review service method
-            result = generation_service.review_table_with_diff(
+            result = await generation_service.review_table_with_diff(
                 draft, review_notes, section_name, section_type, combined_guidelines
             )
             
@@ -262,9 +402,12 @@ class GenerateTableFromReviewWithDiffHandler(ServiceHandler):
                 self.write(json.dumps({"error": result["error"]}))
                 return
             
-            response = {"result": result}
+            response = {"result": self.encode_diff(result, body)}
             self.set_header("Content-Type", "application/json")
             self.write(json.dumps(response))
+        except GenerationError as e:
+            self.set_status(e.status_code)
+            self.write(json.dumps({"error": str(e)}))
         except Exception as e:
             self.set_status(500)
             self.write(json.dumps({"error": str(e)}))
@@ -274,7 +417,7 @@ class GenerateReviewHandler(ServiceHandler):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
-    def post(self):
+    async def post(self):
         try:
             body = json.loads(self.request.body)
             draft = body.get('draft', '')
@@ -282,10 +425,9 @@ class GenerateReviewHandler(ServiceHandler):
             section_type = body.get('sectionType', 'default')
             guidelines = body.get('guidelines', None)
             draft_guidelines = body.get('draftGuidelines', None)
-            model_id = body.get('modelId', None)
             
-            # Create generation service with specified model
-            generation_service = GenerationService(model_id)
+            # Get the shared generation service for the specified model
+            generation_service = self.get_generation_service(body)
             
             # Combine guidelines if both are provided
             combined_guidelines = guidelines
@@ -295,13 +437,45 @@ class GenerateReviewHandler(ServiceHandler):
                 combined_guidelines = f"Review this draft based on the original requirements:\n{draft_guidelines}"
             
             # Use generation service with section context
-            review = generation_service.generate_review_suggestions(
+            review = await generation_service.generate_review_suggestions(
                 draft, section_name, section_type, combined_guidelines
             )
             
             response = {"result": review}
             self.set_header("Content-Type", "application/json")
             self.write(json.dumps(response))
+        except GenerationError as e:
+            self.set_status(e.status_code)
+            self.write(json.dumps({"error": str(e)}))
+        except Exception as e:
+            self.set_status(500)
+            self.write(json.dumps({"error": str(e)}))
+
+
+class GenerateReviewStreamHandler(StreamingHandler):
+    async def post(self):
+        try:
+            body = json.loads(self.request.body)
+            draft = body.get('draft', '')
+            section_name = body.get('sectionName', 'Section')
+            section_type = body.get('sectionType', 'default')
+            guidelines = body.get('guidelines', None)
+            draft_guidelines = body.get('draftGuidelines', None)
+            
+            # Get the shared generation service for the specified model
+            generation_service = self.get_generation_service(body)
+            
+            # Combine guidelines if both are provided
+            combined_guidelines = guidelines
+            if draft_guidelines and guidelines:
+                combined_guidelines = f"Original Draft Requirements:\n{draft_guidelines}\n\nReview Guidelines:\n{guidelines}"
+            elif draft_guidelines and not guidelines:
+                combined_guidelines = f"Review this draft based on the original requirements:\n{draft_guidelines}"
+            
+            # Stream review tokens as they arrive
+            await self.stream_events(generation_service.stream_review_suggestions(
+                draft, section_name, section_type, combined_guidelines
+            ))
         except Exception as e:
             self.set_status(500)
             self.write(json.dumps({"error": str(e)}))
@@ -402,10 +576,12 @@ class UploadTemplateHandler(ServiceHandler):
 
 
 class GenerateReviewForSelectionHandler(ServiceHandler):
+    PRIORITY = 'interactive'
+    
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
-    def post(self):
+    async def post(self):
         try:
             body = json.loads(self.request.body)
             selected_text = body.get('selectedText', '')
@@ -414,10 +590,11 @@ class GenerateReviewForSelectionHandler(ServiceHandler):
             guidelines = body.get('guidelines', None)
             draft_guidelines = body.get('draftGuidelines', None)
             full_draft = body.get('fullDraft', None)
-            model_id = body.get('modelId', None)
+            selection_start = body.get('selectionStart', None)
+            selection_end = body.get('selectionEnd', None)
             
-            # Create generation service with specified model
-            generation_service = GenerationService(model_id)
+            # Get the shared generation service for the specified model
+            generation_service = self.get_generation_service(body)
             
             # Combine guidelines if both are provided
             combined_guidelines = guidelines
@@ -427,29 +604,29 @@ class GenerateReviewForSelectionHandler(ServiceHandler):
                 combined_guidelines = f"Review this selection based on the original requirements:\n{draft_guidelines}"
             
             # Use selection review service method (without context parameters)
-            result = generation_service.review_text_selection(
-                selected_text, section_name, section_type, combined_guidelines, full_draft
+            result = await generation_service.review_text_selection(
+                selected_text, section_name, section_type, combined_guidelines, full_draft,
+                selection_start, selection_end
             )
             
-            # Check for errors
-            if result.startswith("Error"):
-                self.set_status(500)
-                self.write(json.dumps({"error": result}))
-                return
-            
             response = {"result": result}
             self.set_header("Content-Type", "application/json")
             self.write(json.dumps(response))
+        except GenerationError as e:
+            self.set_status(e.status_code)
+            self.write(json.dumps({"error": str(e)}))
         except Exception as e:
             self.set_status(500)
             self.write(json.dumps({"error": str(e)}))
 
 
 class ApplyReviewToSelectionWithDiffHandler(ServiceHandler):
+    PRIORITY = 'interactive'
+    
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
-    def post(self):
+    async def post(self):
         try:
             body = json.loads(self.request.body)
             full_draft = body.get('fullDraft', '')
@@ -461,10 +638,9 @@ class ApplyReviewToSelectionWithDiffHandler(ServiceHandler):
             section_type = body.get('sectionType', 'default')
             guidelines = body.get('guidelines', None)
             draft_guidelines = body.get('draftGuidelines', None)
-            model_id = body.get('modelId', None)
             
-            # Create generation service with specified model
-            generation_service = GenerationService(model_id)
+            # Get the shared generation service for the specified model
+            generation_service = self.get_generation_service(body)
             
             # Combine guidelines if both are provided
             combined_guidelines = guidelines
@@ -474,7 +650,7 @@ class ApplyReviewToSelectionWithDiffHandler(ServiceHandler):
                 combined_guidelines = f"Revise this selection while maintaining the original requirements:\n{draft_guidelines}"
             
             # Use selection application service method
-            result = generation_service.apply_review_to_selection_with_diff(
+            result = await generation_service.apply_review_to_selection_with_diff(
                 full_draft, selected_text, selection_start, selection_end, 
                 review_notes, section_name, section_type, combined_guidelines
             )
@@ -485,7 +661,39 @@ class ApplyReviewToSelectionWithDiffHandler(ServiceHandler):
                 self.write(json.dumps({"error": result["error"]}))
                 return
             
-            response = {"result": result}
+            response = {"result": self.encode_diff(result, body)}
+            self.set_header("Content-Type", "application/json")
+            self.write(json.dumps(response))
+        except GenerationError as e:
+            self.set_status(e.status_code)
+            self.write(json.dumps({"error": str(e)}))
+        except Exception as e:
+            self.set_status(500)
+            self.write(json.dumps({"error": str(e)}))
+
+
+class RebaseDraftHandler(ServiceHandler):
+    PRIORITY = 'interactive'
+    
+    async def post(self):
+        try:
+            body = json.loads(self.request.body)
+            base_draft = body.get('baseDraft', '')
+            edited_draft = body.get('editedDraft', '')
+            latest_draft = body.get('latestDraft', '')
+            prefer = body.get('prefer', 'latest')
+            
+            generation_service = self.get_generation_service(body)
+            
+            # Merge the edit made against baseDraft into latestDraft
+            result = await generation_service.rebase_draft(base_draft, edited_draft, latest_draft, prefer)
+            
+            if "error" in result:
+                self.set_status(400)
+                self.write(json.dumps({"error": result["error"]}))
+                return
+            
+            response = {"result": self.encode_diff(result, body)}
             self.set_header("Content-Type", "application/json")
             self.write(json.dumps(response))
         except Exception as e:
@@ -496,14 +704,19 @@ class ApplyReviewToSelectionWithDiffHandler(ServiceHandler):
 def make_app():
     return tornado.web.Application([
         (r"/api/hello", HelloHandler),
+        (r"/api/metrics", MetricsHandler),
         (r"/api/review-lookup", ReviewLookupHandler),
         (r"/api/generate-draft-from-notes", GenerateDraftFromNotesHandler),
+        (r"/api/generate-draft-from-notes-stream", GenerateDraftFromNotesStreamHandler),
+        (r"/api/generate-drafts-batch", GenerateDraftsBatchHandler),
         (r"/api/generate-draft-from-review-with-diff", GenerateDraftFromReviewWithDiffHandler),
         (r"/api/generate-row-from-review-with-diff", GenerateRowFromReviewWithDiffHandler),
         (r"/api/generate-table-from-review-with-diff", GenerateTableFromReviewWithDiffHandler),
         (r"/api/generate-review", GenerateReviewHandler),
+        (r"/api/generate-review-stream", GenerateReviewStreamHandler),
         (r"/api/generate-review-for-selection", GenerateReviewForSelectionHandler),
         (r"/api/apply-review-to-selection-with-diff", ApplyReviewToSelectionWithDiffHandler),
+        (r"/api/rebase-draft", RebaseDraftHandler),
         (r"/api/generate-document", GenerateDocumentHandler),
         (r"/api/upload-template", UploadTemplateHandler),
     ])
@@ -0,0 +1,113 @@
+"""
+Token-bounded document context around a text selection for selection review/apply prompts
+"""
+
+import re
+from os import getenv
+
+try:
+    import tiktoken
+except ImportError:
+    # Optional dependency: fall back to a character-based estimate
+    tiktoken = None
+
+
+class ContextBuilder:
+    """Keeps a configurable token window around a selection plus the document's section headings"""
+
+    # Markdown headings ("## Scope") and numbered headings ("2.1 Model Scope")
+    HEADING_PATTERN = re.compile(r'^(#{1,6}\s+\S.*|\d+(?:\.\d+)*\.?\s+[A-Z].{0,80})$', re.MULTILINE)
+
+    # Characters per token used when no tokenizer is installed
+    CHARS_PER_TOKEN = 4
+
+    def __init__(self, window_tokens: int = None, encoding_name: str = 'o200k_base'):
+        self.window_tokens = window_tokens or int(getenv('SELECTION_CONTEXT_TOKENS', 2000))
+        self.encoding = None
+        if tiktoken is not None:
+            try:
+                self.encoding = tiktoken.get_encoding(encoding_name)
+            except Exception as e:
+                print(f"Warning: Could not load tokenizer {encoding_name}, estimating tokens from length: {e}")
+
+    def count_tokens(self, text: str) -> int:
+        """Count tokens with the local tokenizer, or estimate them from the text length"""
+        if self.encoding is not None:
+            return len(self.encoding.encode(text, disallowed_special=()))
+        return (len(text) + self.CHARS_PER_TOKEN - 1) // self.CHARS_PER_TOKEN
+
+    def locate_selection(self, full_draft: str, selected_text: str, selection_start: int = None, selection_end: int = None) -> tuple:
+        """Resolve selection offsets, falling back to searching for the selected text"""
+        if selection_start is not None and selection_end is not None and 0 <= selection_start <= selection_end <= len(full_draft):
+            return selection_start, selection_end
+        position = full_draft.find(selected_text)
+        if position < 0:
+            return None, None
+        return position, position + len(selected_text)
+
+    def build_selection_context(self, full_draft: str, selection_start: int, selection_end: int) -> tuple:
+        """Return (context, trimmed) where context covers the window around [selection_start, selection_end)
+
+        Drafts that already fit in the window are returned unchanged. Otherwise the
+        text before and after the selection is cut to half the window each, snapped
+        to line or word boundaries, and headings from the omitted parts are listed
+        so the model still sees the document's structure.
+        """
+        if selection_start is None or self.count_tokens(full_draft) <= self.window_tokens:
+            return full_draft, False
+
+        selection_tokens = self.count_tokens(full_draft[selection_start:selection_end])
+        side_budget = max(0, (self.window_tokens - selection_tokens) // 2)
+
+        before_start = selection_start - self._chars_for_tokens(full_draft[:selection_start], side_budget, from_end=True)
+        after_end = selection_end + self._chars_for_tokens(full_draft[selection_end:], side_budget, from_end=False)
+        before_start = self._snap_forward(full_draft, before_start, selection_start)
+        after_end = self._snap_backward(full_draft, after_end, selection_end)
+
+        parts = []
+        headings = self.HEADING_PATTERN.findall(full_draft[:before_start]) + self.HEADING_PATTERN.findall(full_draft[after_end:])
+        if headings:
+            parts.append("Section headings in this document:\n" + "\n".join(heading.strip() for heading in headings) + "\n")
+        if before_start > 0:
+            parts.append("[... earlier text omitted ...]")
+        parts.append(full_draft[before_start:after_end])
+        if after_end < len(full_draft):
+            parts.append("[... later text omitted ...]")
+        return "\n".join(parts), True
+
+    def _chars_for_tokens(self, text: str, tokens: int, from_end: bool) -> int:
+        """Number of characters at the start (or end) of text that fit in the token budget"""
+        if tokens <= 0 or not text:
+            return 0
+        if self.encoding is None:
+            return min(len(text), tokens * self.CHARS_PER_TOKEN)
+        # Only tokenize a bounded slice; tokens rarely span more than ~8 characters
+        span = min(len(text), tokens * 8)
+        sample = text[-span:] if from_end else text[:span]
+        encoded = self.encoding.encode(sample, disallowed_special=())
+        if len(encoded) <= tokens:
+            return len(sample)
+        kept = encoded[-tokens:] if from_end else encoded[:tokens]
+        return len(self.encoding.decode(kept))
+
+    @staticmethod
+    def _snap_forward(text: str, position: int, limit: int) -> int:
+        """Move a window start forward to the next line (or word) boundary so it never cuts a word"""
+        if position <= 0:
+            return 0
+        newline = text.find('\n', position, limit)
+        if newline >= 0:
+            return newline + 1
+        space = text.find(' ', position, limit)
+        return space + 1 if space >= 0 else position
+
+    @staticmethod
+    def _snap_backward(text: str, position: int, limit: int) -> int:
+        """Move a window end back to the previous line (or word) boundary"""
+        if position >= len(text):
+            return len(text)
+        newline = text.rfind('\n', limit, position)
+        if newline >= 0:
+            return newline
+        space = text.rfind(' ', limit, position)
+        return space if space >= 0 else position
@@ -0,0 +1,103 @@
+"""
+Bounded worker pool for CPU-heavy post-processing (diffing, JSON formatting) off the IOLoop
+"""
+
+import asyncio
+import functools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from os import getenv
+
+from services.resilience import LatencyTracker
+
+
+class CpuPool:
+    """Runs large CPU-bound jobs on a few worker threads; small ones stay inline
+    
+    A 2-second diff run inline stalls every other connection on the IOLoop.
+    Offloaded jobs still share the GIL, but the interpreter switches threads
+    every few milliseconds, so the loop keeps serving requests meanwhile.
+    Threads rather than processes because the jobs use the shared diff cache
+    and return DiffResults holding both texts, which would have to be pickled.
+    """
+    
+    def __init__(self, max_workers: int = None, min_size: int = 20000):
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        # Inputs smaller than this (in characters) run inline: a thread hop costs more than the work
+        self.min_size = min_size
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='cpu')
+        self._lock = threading.Lock()
+        self.wait_latency = LatencyTracker(min_samples=1)
+        self.stats = {
+            'inline': 0,
+            'offloaded': 0,
+            'queue_depth': 0,
+            'max_queue_depth': 0,
+            'running': 0,
+            'total_wait': 0.0,
+            'max_wait': 0.0,
+            'total_run': 0.0
+        }
+    
+    @classmethod
+    def from_env(cls) -> 'CpuPool':
+        """Build a pool from CPU_POOL_WORKERS and CPU_OFFLOAD_MIN_SIZE"""
+        return cls(
+            max_workers=int(getenv('CPU_POOL_WORKERS', 0)) or None,
+            min_size=int(getenv('CPU_OFFLOAD_MIN_SIZE', 20000))
+        )
+    
+    async def run(self, function, *args, size: int = None, **kwargs):
+        """
+        Run function(*args, **kwargs), on a worker thread when size reaches min_size
+        
+        Args:
+            size: Input size in characters; None always offloads
+        """
+        if size is not None and size < self.min_size:
+            with self._lock:
+                self.stats['inline'] += 1
+            return function(*args, **kwargs)
+        
+        submitted = time.monotonic()
+        with self._lock:
+            self.stats['offloaded'] += 1
+            self.stats['queue_depth'] += 1
+            self.stats['max_queue_depth'] = max(self.stats['max_queue_depth'], self.stats['queue_depth'])
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(self._execute, function, args, kwargs, submitted))
+    
+    def _execute(self, function, args, kwargs, submitted: float):
+        started = time.monotonic()
+        wait = started - submitted
+        with self._lock:
+            self.stats['queue_depth'] -= 1
+            self.stats['running'] += 1
+            self.stats['total_wait'] += wait
+            self.stats['max_wait'] = max(self.stats['max_wait'], wait)
+            self.wait_latency.record(wait)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            with self._lock:
+                self.stats['running'] -= 1
+                self.stats['total_run'] += time.monotonic() - started
+    
+    def get_stats(self) -> dict:
+        """Queue depth, inline/offloaded counts and queue wait times"""
+        with self._lock:
+            stats = dict(self.stats)
+            wait = self.wait_latency.get_stats()
+        offloaded = stats['offloaded']
+        stats['avg_wait'] = stats.pop('total_wait') / offloaded if offloaded else 0.0
+        stats['avg_run'] = stats.pop('total_run') / offloaded if offloaded else 0.0
+        stats['wait_p50'] = wait['p50']
+        stats['wait_p95'] = wait['p95']
+        stats['max_workers'] = self.max_workers
+        stats['min_size'] = self.min_size
+        return stats
+    
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,101 @@
+"""
+Content-addressed cache of computed diffs, bounded by estimated memory use
+"""
+
+import hashlib
+import sys
+import threading
+from collections import OrderedDict
+from os import getenv
+
+
+class DiffCache:
+    """LRU cache of DiffResults keyed by (hash(original), hash(revised), mode)
+    
+    Reopening a comparison or retrying an apply diffs the same pair of texts
+    again; a hit returns the earlier result, including its collected stats.
+    Cached results are shared between callers and must not be modified.
+    """
+    
+    # Rough per-segment footprint (DiffSegment with five slots plus list entry)
+    SEGMENT_BYTES = 120
+    
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'writes': 0,
+            'evictions': 0,
+            'skipped': 0
+        }
+    
+    @classmethod
+    def from_env(cls) -> 'DiffCache':
+        """Build a cache from DIFF_CACHE_MAX_BYTES (0 disables caching)"""
+        return cls(max_bytes=int(getenv('DIFF_CACHE_MAX_BYTES', 64 * 1024 * 1024)))
+    
+    @staticmethod
+    def make_key(original: str, revised: str, mode: tuple) -> tuple:
+        """Key a comparison by content digests of both texts and the diff mode"""
+        return (
+            hashlib.blake2b(original.encode('utf-8'), digest_size=16).digest(),
+            hashlib.blake2b(revised.encode('utf-8'), digest_size=16).digest(),
+            mode
+        )
+    
+    def get(self, key: tuple):
+        """Return the cached DiffResult for a key, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return entry[1]
+    
+    def set(self, key: tuple, result) -> None:
+        """Store a DiffResult, evicting least recently used entries to stay within max_bytes"""
+        size = self.estimate_size(result)
+        with self._lock:
+            if size > self.max_bytes:
+                # Larger than the whole budget (or caching disabled)
+                self.stats['skipped'] += 1
+                return
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.current_bytes -= previous[0]
+            self._entries[key] = (size, result)
+            self.current_bytes += size
+            self.stats['writes'] += 1
+            while self.current_bytes > self.max_bytes:
+                _, (evicted_size, _) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.stats['evictions'] += 1
+    
+    def clear(self) -> None:
+        """Drop every cached diff"""
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+    
+    def get_stats(self) -> dict:
+        """Hit/miss counters plus current size and hit rate"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = self.current_bytes
+        stats['max_bytes'] = self.max_bytes
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+    
+    @classmethod
+    def estimate_size(cls, result) -> int:
+        """Approximate memory held by a DiffResult: both texts plus its segments"""
+        return sys.getsizeof(result.original) + sys.getsizeof(result.revised) + cls.SEGMENT_BYTES * len(result.segments)
+
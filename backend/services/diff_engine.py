@@ -0,0 +1,423 @@
+"""
+Pluggable sequence diff engines (Myers, histogram, patience) used by DocumentDiffService
+"""
+
+import difflib
+import re
+import time
+from collections import Counter
+from itertools import chain
+from os import getenv
+from typing import List, Tuple, Sequence
+
+# (tag, orig_start, orig_end, rev_start, rev_end) with difflib.SequenceMatcher.get_opcodes() semantics
+Opcode = Tuple[str, int, int, int, int]
+
+
+def tokenize_words(text: str) -> Tuple[str, ...]:
+    """Split text into words and whitespace runs"""
+    return tuple(word for word in re.split(r'(\s+)', text.strip()) if word)
+
+
+def tokenize_lines(text: str) -> Tuple[str, ...]:
+    """Split text into lines keeping line endings"""
+    return tuple(text.splitlines(keepends=True))
+
+
+def tokenize_sentences(text: str) -> Tuple[str, ...]:
+    """Split text into sentences and the whitespace runs after them"""
+    return tuple(sentence for sentence in re.split(r'((?<=[.!?])\s+|\n\s*)', text.strip()) if sentence)
+
+
+def tokenize_chars(text: str) -> Tuple[str, ...]:
+    """Split text into characters, leading/trailing whitespace removed like tokenize_words"""
+    return tuple(text.strip())
+
+
+class DiffTimeout(Exception):
+    """Raised when an engine passes the deadline given to get_opcodes"""
+
+
+class DiffEngine:
+    """Base engine: interns tokens, trims the common prefix/suffix and turns matching blocks into opcodes
+
+    Subclasses implement _match_region, appending (orig_index, rev_index, size)
+    matching blocks for a[a_lo:a_hi] vs b[b_lo:b_hi] in any order.
+    """
+
+    name = 'base'
+
+    def get_opcodes(self, original: Sequence[str], revised: Sequence[str], deadline: float = None) -> List[Opcode]:
+        """Diff two token sequences
+
+        Raises DiffTimeout once time.monotonic() passes `deadline` (if given).
+        """
+        a, b = self._intern(original, revised)
+        matches = []
+        self._match_region(a, b, 0, len(a), 0, len(b), matches, deadline)
+        return self._to_opcodes(matches, len(a), len(b))
+
+    @staticmethod
+    def _check_deadline(deadline: float) -> None:
+        if deadline is not None and time.monotonic() > deadline:
+            raise DiffTimeout()
+
+    @staticmethod
+    def _intern(original: Sequence[str], revised: Sequence[str]) -> tuple:
+        """Map tokens to small ints so the inner loops compare ints instead of strings"""
+        ids = {token: index for index, token in enumerate(dict.fromkeys(chain(original, revised)))}
+        return list(map(ids.__getitem__, original)), list(map(ids.__getitem__, revised))
+
+    @staticmethod
+    def _common_run(a, b, a_start, b_start, limit, step) -> int:
+        """Length of the common run walking from (a_start, b_start) by step (+1 or -1), at most limit
+
+        Compares growing slices (in C) and binary-searches the first mismatch, so
+        long equal stretches cost a handful of slice comparisons, not a Python loop.
+        """
+        def equal(low, high):
+            # Compare only offsets [low, high) of the run
+            if step > 0:
+                return a[a_start + low:a_start + high] == b[b_start + low:b_start + high]
+            return a[a_start - high + 1:a_start - low + 1] == b[b_start - high + 1:b_start - low + 1]
+
+        low, chunk = 0, 8
+        while low < limit:
+            high = min(limit, low + chunk)
+            if not equal(low, high):
+                break
+            low = high
+            chunk *= 2
+        else:
+            return limit
+        # First mismatch lies in [low, high)
+        while high - low > 1:
+            middle = (low + high) // 2
+            if equal(low, middle):
+                low = middle
+            else:
+                high = middle
+        return low
+
+    @classmethod
+    def _trim(cls, a, b, a_lo, a_hi, b_lo, b_hi, matches) -> tuple:
+        """Record the common prefix and suffix of a region as matches and return the remaining region"""
+        prefix = cls._common_run(a, b, a_lo, b_lo, min(a_hi - a_lo, b_hi - b_lo), 1)
+        if prefix:
+            matches.append((a_lo, b_lo, prefix))
+            a_lo += prefix
+            b_lo += prefix
+        suffix = cls._common_run(a, b, a_hi - 1, b_hi - 1, min(a_hi - a_lo, b_hi - b_lo), -1)
+        if suffix:
+            a_hi -= suffix
+            b_hi -= suffix
+            matches.append((a_hi, b_hi, suffix))
+        return a_lo, a_hi, b_lo, b_hi
+
+    def _match_region(self, a, b, a_lo, a_hi, b_lo, b_hi, matches, deadline=None) -> None:
+        raise NotImplementedError
+
+    @staticmethod
+    def _to_opcodes(matches: list, n: int, m: int) -> List[Opcode]:
+        """Convert unordered matching blocks into difflib-style opcodes"""
+        matches.sort()
+        opcodes = []
+        i = j = 0
+        # Coalesce touching blocks so equal runs come out as single opcodes
+        blocks = []
+        for block in matches:
+            if blocks and blocks[-1][0] + blocks[-1][2] == block[0] and blocks[-1][1] + blocks[-1][2] == block[1]:
+                blocks[-1] = (blocks[-1][0], blocks[-1][1], blocks[-1][2] + block[2])
+            elif block[2]:
+                blocks.append(block)
+        blocks.append((n, m, 0))
+
+        for orig_start, rev_start, size in blocks:
+            if i < orig_start and j < rev_start:
+                opcodes.append(('replace', i, orig_start, j, rev_start))
+            elif i < orig_start:
+                opcodes.append(('delete', i, orig_start, j, rev_start))
+            elif j < rev_start:
+                opcodes.append(('insert', i, orig_start, j, rev_start))
+            i, j = orig_start + size, rev_start + size
+            if size:
+                opcodes.append(('equal', orig_start, i, rev_start, j))
+        return opcodes
+
+
+class MyersDiffEngine(DiffEngine):
+    """Myers O(ND) diff with linear-space middle-snake bisection
+
+    Like xdiff, a bisection that exceeds MAX_COST edit steps stops searching and
+    splits at the furthest-reaching path instead, which bounds the cost on
+    heavily rewritten text at the price of a possibly non-minimal diff there.
+    """
+
+    name = 'myers'
+
+    MAX_COST = 256
+
+    def _match_region(self, a, b, a_lo, a_hi, b_lo, b_hi, matches, deadline=None) -> None:
+        # Explicit stack instead of recursion so long documents cannot hit the recursion limit
+        stack = [(a_lo, a_hi, b_lo, b_hi)]
+        while stack:
+            self._check_deadline(deadline)
+            a_lo, a_hi, b_lo, b_hi = self._trim(a, b, *stack.pop(), matches)
+            if a_lo == a_hi or b_lo == b_hi:
+                continue
+            split = self._bisect(a, b, a_lo, a_hi, b_lo, b_hi, deadline)
+            if split is None:
+                # Nothing in common: the whole region is a replacement
+                continue
+            x, y = split
+            stack.append((x, a_hi, y, b_hi))
+            stack.append((a_lo, x, b_lo, y))
+
+    @classmethod
+    def _bisect(cls, a, b, a_lo, a_hi, b_lo, b_hi, deadline=None):
+        """Find the middle snake of the region, returning an (orig, rev) split point or None"""
+        common_run = cls._common_run
+        n = a_hi - a_lo
+        m = b_hi - b_lo
+        max_d = (n + m + 1) // 2
+        offset = max_d
+        size = 2 * max_d + 2
+        forward = [-1] * size
+        backward = [-1] * size
+        forward[offset + 1] = 0
+        backward[offset + 1] = 0
+        delta = n - m
+        # When delta is odd the forward path detects the overlap, otherwise the reverse path does
+        front = delta % 2 != 0
+        k1_start = k1_end = k2_start = k2_end = 0
+
+        for d in range(min(max_d, cls.MAX_COST)):
+            if d % 16 == 15:
+                cls._check_deadline(deadline)
+            for k1 in range(-d + k1_start, d + 1 - k1_end, 2):
+                k1_offset = offset + k1
+                if k1 == -d or (k1 != d and forward[k1_offset - 1] < forward[k1_offset + 1]):
+                    x1 = forward[k1_offset + 1]
+                else:
+                    x1 = forward[k1_offset - 1] + 1
+                y1 = x1 - k1
+                if x1 < n and y1 < m and a[a_lo + x1] == b[b_lo + y1]:
+                    snake = common_run(a, b, a_lo + x1, b_lo + y1, min(n - x1, m - y1), 1)
+                    x1 += snake
+                    y1 += snake
+                forward[k1_offset] = x1
+                if x1 > n:
+                    k1_end += 2
+                elif y1 > m:
+                    k1_start += 2
+                elif front:
+                    k2_offset = offset + delta - k1
+                    if 0 <= k2_offset < size and backward[k2_offset] != -1:
+                        if x1 >= n - backward[k2_offset]:
+                            return a_lo + x1, b_lo + y1
+
+            for k2 in range(-d + k2_start, d + 1 - k2_end, 2):
+                k2_offset = offset + k2
+                if k2 == -d or (k2 != d and backward[k2_offset - 1] < backward[k2_offset + 1]):
+                    x2 = backward[k2_offset + 1]
+                else:
+                    x2 = backward[k2_offset - 1] + 1
+                y2 = x2 - k2
+                if x2 < n and y2 < m and a[a_hi - x2 - 1] == b[b_hi - y2 - 1]:
+                    snake = common_run(a, b, a_hi - x2 - 1, b_hi - y2 - 1, min(n - x2, m - y2), -1)
+                    x2 += snake
+                    y2 += snake
+                backward[k2_offset] = x2
+                if x2 > n:
+                    k2_end += 2
+                elif y2 > m:
+                    k2_start += 2
+                elif not front:
+                    k1_offset = offset + delta - k2
+                    if 0 <= k1_offset < size and forward[k1_offset] != -1:
+                        x1 = forward[k1_offset]
+                        y1 = offset + x1 - k1_offset
+                        if x1 >= n - x2:
+                            return a_lo + x1, b_lo + y1
+
+        if max_d <= cls.MAX_COST:
+            # Searched every edit distance: nothing in common
+            return None
+        return cls._furthest_split(forward, backward, offset, n, m, a_lo, b_lo)
+
+    @staticmethod
+    def _furthest_split(forward, backward, offset, n, m, a_lo, b_lo):
+        """Split at whichever explored forward/backward path got furthest, or None if neither moved"""
+        best, split = 0, None
+        for index, x in enumerate(forward):
+            y = x - (index - offset)
+            if x >= 0 and 0 <= y <= m and x <= n and best < x + y < n + m:
+                best, split = x + y, (a_lo + x, b_lo + y)
+        for index, x in enumerate(backward):
+            y = x - (index - offset)
+            if x >= 0 and 0 <= y <= m and x <= n and best < x + y < n + m:
+                best, split = x + y, (a_lo + n - x, b_lo + m - y)
+        return split
+
+
+class PatienceDiffEngine(MyersDiffEngine):
+    """Patience diff: align tokens unique to both sides by longest increasing subsequence"""
+
+    name = 'patience'
+
+    def _match_region(self, a, b, a_lo, a_hi, b_lo, b_hi, matches, deadline=None) -> None:
+        stack = [(a_lo, a_hi, b_lo, b_hi)]
+        while stack:
+            self._check_deadline(deadline)
+            a_lo, a_hi, b_lo, b_hi = self._trim(a, b, *stack.pop(), matches)
+            if a_lo == a_hi or b_lo == b_hi:
+                continue
+            anchors = self._unique_anchors(a, b, a_lo, a_hi, b_lo, b_hi)
+            if not anchors:
+                MyersDiffEngine._match_region(self, a, b, a_lo, a_hi, b_lo, b_hi, matches, deadline)
+                continue
+            self._push_gaps(anchors, a_lo, a_hi, b_lo, b_hi, stack, matches)
+
+    @staticmethod
+    def _push_gaps(anchors, a_lo, a_hi, b_lo, b_hi, stack, matches) -> None:
+        """Record anchors as matches and queue the regions between consecutive anchors"""
+        prev_a, prev_b = a_lo, b_lo
+        for i, j in anchors:
+            stack.append((prev_a, i, prev_b, j))
+            matches.append((i, j, 1))
+            prev_a, prev_b = i + 1, j + 1
+        stack.append((prev_a, a_hi, prev_b, b_hi))
+
+    @staticmethod
+    def _unique_anchors(a, b, a_lo, a_hi, b_lo, b_hi) -> list:
+        """(i, j) pairs of tokens occurring exactly once on each side, in longest increasing order"""
+        a_tokens = a[a_lo:a_hi]
+        b_tokens = b[b_lo:b_hi]
+        a_counts = Counter(a_tokens)
+        b_counts = Counter(b_tokens)
+        a_index = {token: i for i, token in enumerate(a_tokens, a_lo)}
+        # (j, i) pairs in b order
+        pairs = [
+            (j, a_index[token]) for j, token in enumerate(b_tokens, b_lo)
+            if b_counts[token] == 1 and a_counts.get(token) == 1
+        ]
+
+        # Patience sorting over a-positions in b order gives the longest increasing subsequence
+        tails = []
+        tail_indices = []
+        previous = [-1] * len(pairs)
+        for index, (_, i) in enumerate(pairs):
+            low, high = 0, len(tails)
+            while low < high:
+                middle = (low + high) // 2
+                if tails[middle] < i:
+                    low = middle + 1
+                else:
+                    high = middle
+            if low == len(tails):
+                tails.append(i)
+                tail_indices.append(index)
+            else:
+                tails[low] = i
+                tail_indices[low] = index
+            previous[index] = tail_indices[low - 1] if low else -1
+
+        anchors = []
+        index = tail_indices[-1] if tail_indices else -1
+        while index != -1:
+            j, i = pairs[index]
+            anchors.append((i, j))
+            index = previous[index]
+        anchors.reverse()
+        return anchors
+
+
+class HistogramDiffEngine(PatienceDiffEngine):
+    """Histogram diff: patience anchors first, then the rarest common token of each gap, then Myers
+
+    Like git's histogram diff this extends patience to regions whose common
+    tokens all occur more than once (whitespace, frequent words).
+    """
+
+    name = 'histogram'
+
+    # Tokens occurring more often than this in a region are never used as anchors
+    MAX_CHAIN = 64
+
+    def _match_region(self, a, b, a_lo, a_hi, b_lo, b_hi, matches, deadline=None) -> None:
+        stack = [(a_lo, a_hi, b_lo, b_hi)]
+        while stack:
+            self._check_deadline(deadline)
+            a_lo, a_hi, b_lo, b_hi = self._trim(a, b, *stack.pop(), matches)
+            if a_lo == a_hi or b_lo == b_hi:
+                continue
+            anchors = self._unique_anchors(a, b, a_lo, a_hi, b_lo, b_hi)
+            if anchors:
+                self._push_gaps(anchors, a_lo, a_hi, b_lo, b_hi, stack, matches)
+                continue
+            anchor = self._find_anchor(a, b, a_lo, a_hi, b_lo, b_hi)
+            if anchor is None:
+                # Only frequent tokens in common (or none at all): let Myers align them
+                MyersDiffEngine._match_region(self, a, b, a_lo, a_hi, b_lo, b_hi, matches, deadline)
+                continue
+            start_a, end_a, start_b, end_b = anchor
+            matches.append((start_a, start_b, end_a - start_a))
+            stack.append((end_a, a_hi, end_b, b_hi))
+            stack.append((a_lo, start_a, b_lo, start_b))
+
+    def _find_anchor(self, a, b, a_lo, a_hi, b_lo, b_hi):
+        """Longest common run around the least frequent shared token, as (a_start, a_end, b_start, b_end)"""
+        positions = {}
+        for i in range(a_lo, a_hi):
+            positions.setdefault(a[i], []).append(i)
+
+        best = None
+        best_count = self.MAX_CHAIN + 1
+        best_length = 0
+        j = b_lo
+        while j < b_hi:
+            next_j = j + 1
+            occurrences = positions.get(b[j])
+            if occurrences is not None and len(occurrences) <= best_count:
+                for i in occurrences:
+                    start_a, start_b = i, j
+                    while start_a > a_lo and start_b > b_lo and a[start_a - 1] == b[start_b - 1]:
+                        start_a -= 1
+                        start_b -= 1
+                    end_a, end_b = i + 1, j + 1
+                    while end_a < a_hi and end_b < b_hi and a[end_a] == b[end_b]:
+                        end_a += 1
+                        end_b += 1
+                    length = end_a - start_a
+                    if len(occurrences) < best_count or length > best_length:
+                        best = (start_a, end_a, start_b, end_b)
+                        best_count = len(occurrences)
+                        best_length = length
+                    next_j = max(next_j, end_b)
+            j = next_j
+        return best
+
+
+class DifflibDiffEngine(DiffEngine):
+    """difflib.SequenceMatcher, kept for comparison and benchmarking"""
+
+    name = 'difflib'
+
+    def get_opcodes(self, original: Sequence[str], revised: Sequence[str], deadline: float = None) -> List[Opcode]:
+        # SequenceMatcher cannot be interrupted; the deadline is only checked before starting
+        self._check_deadline(deadline)
+        return difflib.SequenceMatcher(None, original, revised).get_opcodes()
+
+
+DIFF_ENGINES = {
+    engine.name: engine
+    for engine in (MyersDiffEngine, HistogramDiffEngine, PatienceDiffEngine, DifflibDiffEngine)
+}
+
+
+def get_diff_engine(algorithm: str = None) -> DiffEngine:
+    """Create the engine named by `algorithm` or DIFF_ALGORITHM (default: histogram)"""
+    algorithm = (algorithm or getenv('DIFF_ALGORITHM', 'histogram')).lower()
+    if algorithm not in DIFF_ENGINES:
+        raise ValueError(f"Unknown diff algorithm '{algorithm}'. Available: {', '.join(sorted(DIFF_ENGINES))}")
+    return DIFF_ENGINES[algorithm]()
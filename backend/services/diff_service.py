@@ -3,243 +3,560 @@ Document diff computation service for highlighting changes between text versions
 """
 
 import re
-import difflib
-from typing import List, Dict, Any
+import time
+from bisect import bisect_left
+from collections import Counter
+from itertools import accumulate
+from os import getenv
+from typing import List, Dict, Any, Sequence
+
+from services.diff_cache import DiffCache
+from services.diff_engine import (
+    DiffEngine, DiffTimeout, get_diff_engine, tokenize_chars, tokenize_lines, tokenize_sentences, tokenize_words
+)
+
+
+class DiffSegment:
+    """One diff span stored as offsets into the original and revised texts instead of copied strings"""
+    
+    __slots__ = ('type', 'original_start', 'original_end', 'revised_start', 'revised_end')
+    
+    def __init__(self, segment_type: str, original_start: int, original_end: int, revised_start: int, revised_end: int):
+        self.type = segment_type
+        self.original_start = original_start
+        self.original_end = original_end
+        self.revised_start = revised_start
+        self.revised_end = revised_end
+
+
+class DiffStats:
+    """Word, line and character counts of a diff
+    
+    Lines count the lines each span touches, so a line edited in place counts
+    once as removed and once as added. change_ratio is the share of characters
+    (over both texts) that are part of a change.
+    """
+    
+    __slots__ = (
+        'words_added', 'words_removed', 'words_unchanged',
+        'lines_added', 'lines_removed', 'lines_unchanged',
+        'chars_added', 'chars_removed', 'chars_unchanged'
+    )
+    
+    def __init__(self):
+        for name in self.__slots__:
+            setattr(self, name, 0)
+    
+    def add(self, segment_type: str, words: int, lines: int, chars: int) -> None:
+        """Count one span of the given type"""
+        if segment_type == 'added':
+            self.words_added += words
+            self.lines_added += lines
+            self.chars_added += chars
+        elif segment_type == 'removed':
+            self.words_removed += words
+            self.lines_removed += lines
+            self.chars_removed += chars
+        else:
+            self.words_unchanged += words
+            self.lines_unchanged += lines
+            self.chars_unchanged += chars
+    
+    def add_text(self, segment_type: str, text: str) -> None:
+        """Count a span by scanning its text (for diffs not built from token boundaries)"""
+        if text:
+            self.add(segment_type, len(text.split()), text.count('\n') + (not text.endswith('\n')), len(text))
+    
+    def merge(self, other: 'DiffStats') -> None:
+        """Add the counts of another diff's stats (e.g. a window diff inside a larger one)"""
+        for name in self.__slots__:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+    
+    @property
+    def change_ratio(self) -> float:
+        changed = self.chars_added + self.chars_removed
+        total = changed + 2 * self.chars_unchanged
+        return changed / total if total else 0.0
+    
+    def to_dict(self) -> Dict[str, Any]:
+        stats = {name: getattr(self, name) for name in self.__slots__}
+        stats['change_ratio'] = round(self.change_ratio, 4)
+        return stats
+
+
+class DiffResult:
+    """Diff segments together with the two texts their offsets point into
+    
+    Unchanged and removed spans index the original text, added spans index the
+    revised text. to_dicts() produces the classic segment dicts; to_compact()
+    produces the compact wire format read by the frontend DiffViewer.
+    """
+    
+    # Single-character op codes of the compact wire format
+    OP_CODES = {'unchanged': '=', 'removed': '-', 'added': '+'}
+    
+    # Characters outside the Basic Multilingual Plane take two UTF-16 code units
+    ASTRAL_PATTERN = re.compile('[\U00010000-\U0010FFFF]')
+    
+    __slots__ = ('original', 'revised', 'segments', 'granularity', '_stats')
+    
+    def __init__(self, original: str, revised: str, granularity: str = None, stats: DiffStats = None):
+        self.original = original
+        self.revised = revised
+        self.segments = []
+        # Token level the diff was computed at (char, word, sentence, line or rewrite)
+        self.granularity = granularity
+        # Filled in while the segments are built; otherwise counted on first access
+        self._stats = stats
+    
+    def __len__(self) -> int:
+        return len(self.segments)
+    
+    def __iter__(self):
+        return iter(self.segments)
+    
+    def add(self, segment_type: str, original_start: int, original_end: int, revised_start: int, revised_end: int) -> None:
+        """Append a segment, extending the previous one when it has the same type and is contiguous"""
+        if self.segments:
+            last = self.segments[-1]
+            if last.type == segment_type and last.original_end == original_start and last.revised_end == revised_start:
+                last.original_end = original_end
+                last.revised_end = revised_end
+                return
+        self.segments.append(DiffSegment(segment_type, original_start, original_end, revised_start, revised_end))
+    
+    def extend(self, other: 'DiffResult', original_offset: int, revised_offset: int) -> None:
+        """Append the segments of a diff computed over slices starting at the given offsets"""
+        for segment in other.segments:
+            self.add(
+                segment.type,
+                segment.original_start + original_offset, segment.original_end + original_offset,
+                segment.revised_start + revised_offset, segment.revised_end + revised_offset
+            )
+    
+    @property
+    def stats(self) -> DiffStats:
+        """Word/line/character counts, scanning the segment texts only if the builder did not collect them"""
+        if self._stats is None:
+            self._stats = DiffStats()
+            for segment in self.segments:
+                self._stats.add_text(segment.type, self.text(segment))
+        return self._stats
+    
+    def text(self, segment: DiffSegment) -> str:
+        """Text of a segment (added spans come from the revised text, the rest from the original)"""
+        if segment.type == 'added':
+            return self.revised[segment.revised_start:segment.revised_end]
+        return self.original[segment.original_start:segment.original_end]
+    
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        """Classic segment dicts with type, text, original and revised"""
+        segments = []
+        for segment in self.segments:
+            text = self.text(segment)
+            segments.append({
+                'type': segment.type,
+                'text': text,
+                'original': text if segment.type != 'added' else '',
+                'revised': text if segment.type != 'removed' else ''
+            })
+        return segments
+    
+    def to_compact(self, original_ref: str = None, revised_ref: str = None) -> Dict[str, Any]:
+        """
+        Compact wire format: one op code per segment plus a flat list of [start, end) ranges
+        
+        Unchanged and removed ranges index the original text, added ranges the revised
+        text. Ranges count UTF-16 code units (JavaScript string indices), so characters
+        such as emoji advance them by two. A text the client already has is sent as a
+        reference (original_ref / revised_ref naming where to find it) instead of
+        being repeated.
+        """
+        original_offset = self._utf16_offset(self.original)
+        revised_offset = self._utf16_offset(self.revised)
+        ranges = []
+        for segment in self.segments:
+            if segment.type == 'added':
+                ranges.extend((revised_offset(segment.revised_start), revised_offset(segment.revised_end)))
+            else:
+                ranges.extend((original_offset(segment.original_start), original_offset(segment.original_end)))
+        compact = {
+            'format': 'compact',
+            'ops': ''.join(self.OP_CODES[segment.type] for segment in self.segments),
+            'ranges': ranges
+        }
+        if self.granularity:
+            compact['granularity'] = self.granularity
+        if original_ref:
+            compact['original_ref'] = original_ref
+        else:
+            compact['original'] = self.original
+        if revised_ref:
+            compact['revised_ref'] = revised_ref
+        else:
+            compact['revised'] = self.revised
+        return compact
+    
+    @classmethod
+    def _utf16_offset(cls, text: str):
+        """Function mapping a code-point offset in text to its UTF-16 code-unit offset"""
+        astral = [] if text.isascii() else [match.start() for match in cls.ASTRAL_PATTERN.finditer(text)]
+        if not astral:
+            return lambda offset: offset
+        # Every astral character before the offset adds one extra code unit
+        return lambda offset: offset + bisect_left(astral, offset)
 
 
 class DocumentDiffService:
     """Service for computing document-level diffs optimized for readability"""
     
-    def compute_document_diff(self, original: str, revised: str) -> List[Dict[str, Any]]:
+    # Finest to coarsest; a diff that runs out of time is retried one level coarser
+    GRANULARITIES = ('char', 'word', 'sentence', 'line')
+    
+    # Time allowed per granularity attempt before falling back to a coarser one
+    TIME_BUDGET = float(getenv('DIFF_TIME_BUDGET_MS', 500)) / 1000
+    
+    # Below this upper bound on word similarity the texts are reported as fully rewritten
+    REWRITE_THRESHOLD = float(getenv('DIFF_REWRITE_THRESHOLD', 0.2))
+    
+    # Size limits for automatic granularity selection
+    CHAR_MAX_LENGTH = int(getenv('DIFF_CHAR_MAX_LENGTH', 40))
+    WORD_MAX_WORDS = int(getenv('DIFF_WORD_MAX_WORDS', 100000))
+    SENTENCE_MAX_WORDS = int(getenv('DIFF_SENTENCE_MAX_WORDS', 500000))
+    
+    def __init__(self, engine: DiffEngine = None, algorithm: str = None, cache: DiffCache = None):
+        # Myers/histogram/patience engine; DIFF_ALGORITHM selects the default
+        self.engine = engine or get_diff_engine(algorithm)
+        # Optional content-addressed cache of results (disabled when its budget is 0)
+        self.cache = cache if cache is not None and cache.max_bytes > 0 else None
+    
+    def compute_document_diff(self, original: str, revised: str, granularity: str = 'auto') -> DiffResult:
         """
         Compute diff between two document texts, optimized for document content
         
+        In auto mode, texts whose word overlap cannot reach REWRITE_THRESHOLD come
+        back as one removed + one added segment without running the engine, and the
+        granularity is picked from the text size (JSON always uses lines). Each
+        attempt gets TIME_BUDGET; on timeout the diff is retried one level coarser,
+        ending in the fully rewritten result.
+        
+        With a cache, results (and their stats) are reused for identical text pairs.
+        Results degraded by a timeout are not cached, so a later call with more
+        time to spare can still produce the finer diff.
+        
         Args:
             original: Original text content
             revised: Revised text content
-            
+            granularity: 'auto', 'char', 'word', 'sentence' or 'line'
+        
         Returns:
-            List of diff segments with change type and content
+            DiffResult whose segments carry change type and offsets into both texts
         """
         if not original.strip() or not revised.strip():
             return self._handle_empty_content(original, revised)
         
+        if self.cache is None:
+            return self._compute_adaptive_diff(original, revised, granularity)[0]
+        key = self.cache.make_key(original, revised, (self.engine.name, granularity))
+        result = self.cache.get(key)
+        if result is None:
+            result, degraded = self._compute_adaptive_diff(original, revised, granularity)
+            if not degraded:
+                self.cache.set(key, result)
+        return result
+    
+    def _compute_adaptive_diff(self, original: str, revised: str, granularity: str) -> tuple:
+        """Pick the granularity (or the rewrite shortcut) and diff with coarser fallbacks on timeout
+        
+        Returns (result, degraded) where degraded tells that an attempt timed out
+        and the result comes from a coarser fallback.
+        """
+        if granularity == 'auto':
+            original_words = original.split()
+            revised_words = revised.split()
+            similarity = self.similarity_bound(original_words, revised_words)
+            if similarity < self.REWRITE_THRESHOLD:
+                return self._rewrite_result(original, revised), False
+            granularity = self._choose_granularity(original, revised, max(len(original_words), len(revised_words)), similarity)
+        elif granularity not in self.GRANULARITIES:
+            raise ValueError(f"Unknown diff granularity '{granularity}'. Available: auto, {', '.join(self.GRANULARITIES)}")
+        
+        degraded = False
+        for level in self.GRANULARITIES[self.GRANULARITIES.index(granularity):]:
+            try:
+                return self._compute_granular_diff(original, revised, level, time.monotonic() + self.TIME_BUDGET), degraded
+            except DiffTimeout:
+                degraded = True
+        return self._rewrite_result(original, revised), True
+    
+    @classmethod
+    def similarity_bound(cls, original_words: Sequence[str], revised_words: Sequence[str]) -> float:
+        """
+        Upper bound on the share of words a word diff can keep unchanged
+        
+        Dice coefficient of the two word multisets: no alignment can match more
+        words than the sides have in common, and it costs one Counter per side.
+        """
+        total = len(original_words) + len(revised_words)
+        if not total:
+            return 1.0
+        # Lengths alone bound the overlap; skip counting when that already rules out a diff
+        length_bound = 2 * min(len(original_words), len(revised_words)) / total
+        if length_bound < cls.REWRITE_THRESHOLD:
+            return length_bound
+        shared = sum((Counter(original_words) & Counter(revised_words)).values())
+        return 2 * shared / total
+    
+    def _choose_granularity(self, original: str, revised: str, word_count: int, similarity: float) -> str:
+        """Pick the finest granularity whose size limit the larger text fits in"""
         # Check if content looks like JSON (starts with { or [)
         is_json_like = (original.strip().startswith('{') or original.strip().startswith('[')) and (revised.strip().startswith('{') or revised.strip().startswith('['))
-        
         if is_json_like:
             # For JSON content, use line-based diffing to preserve structure
-            return self._compute_line_based_diff(original, revised)
+            return 'line'
+        if max(len(original), len(revised)) <= self.CHAR_MAX_LENGTH and similarity >= 0.75:
+            # Short, mostly unchanged values such as titles and table cells show exact character edits
+            return 'char'
+        if word_count <= self.WORD_MAX_WORDS:
+            return 'word'
+        if word_count <= self.SENTENCE_MAX_WORDS:
+            return 'sentence'
+        return 'line'
+    
+    def _compute_granular_diff(self, original: str, revised: str, granularity: str, deadline: float = None) -> DiffResult:
+        """Diff at one granularity, raising DiffTimeout once the deadline passes"""
+        if granularity == 'line':
+            result = self._compute_line_based_diff(original, revised, deadline)
+        else:
+            tokenize = {'char': tokenize_chars, 'word': tokenize_words, 'sentence': tokenize_sentences}[granularity]
+            # Tokens come from the stripped text, so offsets start after any leading whitespace
+            original_lead = len(original) - len(original.lstrip())
+            revised_lead = len(revised) - len(revised.lstrip())
+            result = self._build_result(original, revised, tokenize(original), tokenize(revised), original_lead, revised_lead, granularity, deadline)
+        return result
+    
+    def _rewrite_result(self, original: str, revised: str, granularity: str = 'rewrite') -> DiffResult:
+        """The whole original removed and the whole revised text added, as one replacement
+        
+        Leading or trailing whitespace that is the same on both sides stays
+        unchanged; any other whitespace is part of the replacement, so the
+        segments still rebuild both texts.
+        """
+        result = DiffResult(original, revised, granularity, DiffStats())
+        original_start, original_end = self._margins(original)
+        revised_start, revised_end = self._margins(revised)
+        if original[:original_start] != revised[:revised_start]:
+            original_start = revised_start = 0
+        if original[original_end:] != revised[revised_end:]:
+            original_end, revised_end = len(original), len(revised)
+        
+        self._add_whitespace(result, 0, original_start, 0, revised_start)
+        if original_start < original_end:
+            result.add('removed', original_start, original_end, revised_start, revised_start)
+            result.stats.add_text('removed', original[original_start:original_end])
+        if revised_start < revised_end:
+            result.add('added', original_end, original_end, revised_start, revised_end)
+            result.stats.add_text('added', revised[revised_start:revised_end])
+        self._add_whitespace(result, original_end, len(original), revised_end, len(revised))
+        return result
+    
+    @staticmethod
+    def _margins(text: str) -> tuple:
+        """Offsets where the text after leading whitespace starts and trailing whitespace starts"""
+        start = len(text) - len(text.lstrip())
+        return start, max(start, len(text.rstrip()))
+    
+    @staticmethod
+    def _add_whitespace(result: DiffResult, original_start: int, original_end: int, revised_start: int, revised_end: int) -> None:
+        """Emit a whitespace span the tokens leave out: unchanged if both sides match, else removed and added"""
+        original_text = result.original[original_start:original_end]
+        revised_text = result.revised[revised_start:revised_end]
+        if original_text == revised_text:
+            if original_text:
+                result.add('unchanged', original_start, original_end, revised_start, revised_end)
+                result.stats.add_text('unchanged', original_text)
+            return
+        if original_text:
+            result.add('removed', original_start, original_end, revised_start, revised_start)
+            result.stats.add_text('removed', original_text)
+        if revised_text:
+            result.add('added', original_end, original_end, revised_start, revised_end)
+            result.stats.add_text('added', revised_text)
+    
+    def compute_window_diff(self, original: str, revised: str, window_start: int, original_end: int, revised_end: int) -> DiffResult:
+        """
+        Compute diff for an edit confined to one window, e.g. a replaced text selection
+        
+        Only original[window_start:original_end] -> revised[window_start:revised_end]
+        is diffed; the shared prefix and suffix are emitted as pre-built unchanged
+        segments, so the cost follows the window size rather than the document size.
+        
+        Args:
+            original: Original text content
+            revised: Revised text content (original with the window replaced)
+            window_start: Start offset of the window in both texts
+            original_end: End offset of the window in the original text
+            revised_end: End offset of the window in the revised text
+        
+        Returns:
+            DiffResult whose segments carry change type and offsets into both texts
+        """
+        suffix_length = len(original) - original_end
+        if (not 0 <= window_start <= original_end <= len(original)
+                or revised_end - window_start < 0
+                or len(revised) - revised_end != suffix_length
+                or original.lstrip()[:1] in ('{', '[')):
+            # Not a plain windowed edit (or structured content): diff the whole text
+            return self.compute_document_diff(original, revised)
+        
+        # Widen the window to word boundaries so no word is split between prefix, window and suffix
+        while window_start > 0 and not original[window_start - 1].isspace():
+            window_start -= 1
+        while original_end < len(original) and not original[original_end].isspace():
+            original_end += 1
+            revised_end += 1
+        
+        original_window = original[window_start:original_end]
+        revised_window = revised[window_start:revised_end]
+        if not original_window.strip() or not revised_window.strip():
+            window_diff = self._handle_empty_content(original_window, revised_window)
         else:
-            # For regular text, use word-level diffing
-            return self._compute_word_based_diff(original, revised)
+            window_diff = self._compute_word_based_diff(original_window, revised_window)
+        
+        # The untouched prefix and suffix become single unchanged segments
+        result = DiffResult(original, revised, stats=DiffStats())
+        if window_start:
+            result.add('unchanged', 0, window_start, 0, window_start)
+            result.stats.add_text('unchanged', original[:window_start])
+        result.extend(window_diff, window_start, window_start)
+        result.stats.merge(window_diff.stats)
+        if original_end < len(original):
+            result.add('unchanged', original_end, len(original), revised_end, len(revised))
+            result.stats.add_text('unchanged', original[original_end:])
+        return result
     
-    def _compute_line_based_diff(self, original: str, revised: str) -> List[Dict[str, Any]]:
+    def _compute_line_based_diff(self, original: str, revised: str, deadline: float = None) -> DiffResult:
         """Compute diff using line-based comparison for structured content like JSON"""
-        original_lines = original.splitlines(keepends=True)
-        revised_lines = revised.splitlines(keepends=True)
-        
-        matcher = difflib.SequenceMatcher(None, original_lines, revised_lines)
-        diff_segments = []
-        
-        for operation, orig_start, orig_end, rev_start, rev_end in matcher.get_opcodes():
-            if operation == 'equal':
-                # Unchanged lines
-                text = ''.join(original_lines[orig_start:orig_end])
-                if text.strip():
-                    diff_segments.append({
-                        'type': 'unchanged',
-                        'text': text,
-                        'original': text,
-                        'revised': text
-                    })
-                    
-            elif operation == 'delete':
-                # Removed lines
-                text = ''.join(original_lines[orig_start:orig_end])
-                if text.strip():
-                    diff_segments.append({
-                        'type': 'removed',
-                        'text': text,
-                        'original': text,
-                        'revised': ''
-                    })
-                    
-            elif operation == 'insert':
-                # Added lines
-                text = ''.join(revised_lines[rev_start:rev_end])
-                if text.strip():
-                    diff_segments.append({
-                        'type': 'added',
-                        'text': text,
-                        'original': '',
-                        'revised': text
-                    })
-                    
-            elif operation == 'replace':
-                # Modified lines - show both removed and added
-                orig_text = ''.join(original_lines[orig_start:orig_end])
-                rev_text = ''.join(revised_lines[rev_start:rev_end])
-                
-                if orig_text.strip():
-                    diff_segments.append({
-                        'type': 'removed',
-                        'text': orig_text,
-                        'original': orig_text,
-                        'revised': ''
-                    })
-                
-                if rev_text.strip():
-                    diff_segments.append({
-                        'type': 'added',
-                        'text': rev_text,
-                        'original': '',
-                        'revised': rev_text
-                    })
-        
-        return diff_segments
-    
-    def _compute_word_based_diff(self, original: str, revised: str) -> List[Dict[str, Any]]:
+        original_lines = tokenize_lines(original)
+        revised_lines = tokenize_lines(revised)
+        return self._build_result(original, revised, original_lines, revised_lines, 0, 0, 'line', deadline)
+    
+    def _compute_word_based_diff(self, original: str, revised: str) -> DiffResult:
         """Compute diff using word-based comparison for regular text"""
         # For documents, we'll work with word-level diffing for natural readability
-        original_words = self._split_into_words(original)
-        revised_words = self._split_into_words(revised)
-        
-        # Use SequenceMatcher to find differences
-        matcher = difflib.SequenceMatcher(None, original_words, revised_words)
+        return self._compute_granular_diff(original, revised, 'word')
+    
+    def _build_result(self, original: str, revised: str, original_tokens: Sequence[str], revised_tokens: Sequence[str], original_lead: int, revised_lead: int, granularity: str, deadline: float = None) -> DiffResult:
+        """
+        Walk the engine's opcodes once, turning token ranges into character offsets and stats
         
-        diff_segments = []
+        Consecutive changes are collected into one removed and one added span. Except
+        in line mode, a lone whitespace token between two changes joins the change,
+        so "a b" -> "x y" reads as one replacement instead of interleaved fragments.
+        Whitespace-only changes are kept as segments, and so is whitespace the
+        tokenizer stripped from either end, so the segments rebuild both texts.
+        """
+        absorb_whitespace = granularity != 'line'
+        # Character offset and word count at every token boundary
+        original_side = self._token_bounds(original, original_tokens, original_lead, granularity)
+        revised_side = self._token_bounds(revised, revised_tokens, revised_lead, granularity)
+        original_bounds = original_side[1]
+        revised_bounds = revised_side[1]
+        opcodes = self.engine.get_opcodes(original_tokens, revised_tokens, deadline)
         
-        for operation, orig_start, orig_end, rev_start, rev_end in matcher.get_opcodes():
-            if operation == 'equal':
+        result = DiffResult(original, revised, granularity, DiffStats())
+        stats = result.stats
+        self._add_whitespace(result, 0, original_lead, 0, revised_lead)
+        pending = None
+        last = len(opcodes) - 1
+        for index, (operation, orig_start, orig_end, rev_start, rev_end) in enumerate(opcodes):
+            if operation == 'equal' and not (
+                absorb_whitespace and pending is not None and index < last
+                and orig_end - orig_start == 1 and original_tokens[orig_start].isspace()
+            ):
+                if pending is not None:
+                    self._flush_change(result, pending, original_side, revised_side)
+                    pending = None
                 # Unchanged text
-                text = ' '.join(original_words[orig_start:orig_end])
-                if text.strip():
-                    diff_segments.append({
-                        'type': 'unchanged',
-                        'text': text,
-                        'original': text,
-                        'revised': text
-                    })
-                    
-            elif operation == 'delete':
-                # Removed text
-                text = ' '.join(original_words[orig_start:orig_end])
-                if text.strip():
-                    diff_segments.append({
-                        'type': 'removed',
-                        'text': text,
-                        'original': text,
-                        'revised': ''
-                    })
-                    
-            elif operation == 'insert':
-                # Added text
-                text = ' '.join(revised_words[rev_start:rev_end])
-                if text.strip():
-                    diff_segments.append({
-                        'type': 'added',
-                        'text': text,
-                        'original': '',
-                        'revised': text
-                    })
-                    
-            elif operation == 'replace':
-                # Modified text - show both removed and added
-                orig_text = ' '.join(original_words[orig_start:orig_end])
-                rev_text = ' '.join(revised_words[rev_start:rev_end])
-                
-                if orig_text.strip():
-                    diff_segments.append({
-                        'type': 'removed',
-                        'text': orig_text,
-                        'original': orig_text,
-                        'revised': ''
-                    })
-                
-                if rev_text.strip():
-                    diff_segments.append({
-                        'type': 'added',
-                        'text': rev_text,
-                        'original': '',
-                        'revised': rev_text
-                    })
-        
-        return self._merge_adjacent_segments(diff_segments)
-    
-    def _split_into_words(self, text: str) -> List[str]:
+                result.add('unchanged', original_bounds[orig_start], original_bounds[orig_end], revised_bounds[rev_start], revised_bounds[rev_end])
+                stats.add('unchanged', *self._span_counts(original_side, orig_start, orig_end))
+            elif pending is None:
+                # Start of a change (delete, insert or replace)
+                pending = [orig_start, orig_end, rev_start, rev_end]
+            else:
+                pending[1] = orig_end
+                pending[3] = rev_end
+        
+        if pending is not None:
+            self._flush_change(result, pending, original_side, revised_side)
+        self._add_whitespace(result, original_bounds[-1], len(original), revised_bounds[-1], len(revised))
+        return result
+    
+    @staticmethod
+    def _token_bounds(text: str, tokens: Sequence[str], lead: int, granularity: str) -> tuple:
+        """(text, char offsets, word counts) at every token boundary
+        
+        Word tokens alternate word, whitespace, word, ... so their word counts
+        follow from the index alone and no table is built (None).
+        """
+        if granularity == 'word':
+            word_bounds = None
+        elif granularity == 'char':
+            # A word is counted at its first character
+            word_bounds = list(accumulate((not token.isspace() and (index == 0 or tokens[index - 1].isspace()) for index, token in enumerate(tokens)), initial=0))
+        else:
+            word_bounds = list(accumulate(map(len, map(str.split, tokens)), initial=0))
+        return text, list(accumulate(map(len, tokens), initial=lead)), word_bounds
+    
+    @staticmethod
+    def _span_counts(side: tuple, token_start: int, token_end: int) -> tuple:
+        """(words, lines, chars) of a token range, read off the boundary tables of one side"""
+        text, char_bounds, word_bounds = side
+        start, end = char_bounds[token_start], char_bounds[token_end]
+        if start == end:
+            return 0, 0, 0
+        if word_bounds is None:
+            words = (token_end + 1) // 2 - (token_start + 1) // 2
+        else:
+            words = word_bounds[token_end] - word_bounds[token_start]
+        # Spans tile the text, so counting line breaks per span scans it once in total
+        return words, text.count('\n', start, end) + (text[end - 1] != '\n'), end - start
+    
+    def _flush_change(self, result: DiffResult, change: list, original_side: tuple, revised_side: tuple) -> None:
+        """Emit a collected change as a removed span followed by an added span"""
+        orig_start, orig_end, rev_start, rev_end = change
+        original_start, original_end = original_side[1][orig_start], original_side[1][orig_end]
+        revised_start, revised_end = revised_side[1][rev_start], revised_side[1][rev_end]
+        if original_start < original_end:
+            result.add('removed', original_start, original_end, revised_start, revised_start)
+            result.stats.add('removed', *self._span_counts(original_side, orig_start, orig_end))
+        if revised_start < revised_end:
+            result.add('added', original_end, original_end, revised_start, revised_end)
+            result.stats.add('added', *self._span_counts(revised_side, rev_start, rev_end))
+    
+    def _split_into_words(self, text: str) -> Sequence[str]:
         """Split text into words while preserving whitespace and punctuation context"""
         # Split on whitespace but keep the separators
-        words = re.split(r'(\s+)', text.strip())
-        # Filter out empty strings
-        return [word for word in words if word]
+        return tokenize_words(text)
     
-    def _handle_empty_content(self, original: str, revised: str) -> List[Dict[str, Any]]:
-        """Handle cases where one or both texts are empty"""
-        segments = []
-        
-        if original.strip() and not revised.strip():
-            # Everything was removed
-            segments.append({
-                'type': 'removed',
-                'text': original.strip(),
-                'original': original.strip(),
-                'revised': ''
-            })
-        elif not original.strip() and revised.strip():
-            # Everything was added
-            segments.append({
-                'type': 'added',
-                'text': revised.strip(),
-                'original': '',
-                'revised': revised.strip()
-            })
-        
-        return segments
+    def _handle_empty_content(self, original: str, revised: str) -> DiffResult:
+        """Handle cases where one or both texts are empty (or only whitespace)"""
+        # Whatever text one side has is removed or added as a whole
+        return self._rewrite_result(original, revised, granularity=None)
     
-    def _merge_adjacent_segments(self, segments: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """Merge adjacent segments of the same type for better readability"""
-        if not segments:
-            return segments
-        
-        merged = []
-        current = segments[0].copy()
-        
-        for segment in segments[1:]:
-            if (segment['type'] == current['type'] and 
-                segment['type'] in ['unchanged', 'added', 'removed']):
-                # Merge with current segment
-                current['text'] += ' ' + segment['text']
-                if segment['type'] == 'unchanged':
-                    current['original'] += ' ' + segment['original']
-                    current['revised'] += ' ' + segment['revised']
-                elif segment['type'] == 'added':
-                    current['revised'] += ' ' + segment['revised']
-                elif segment['type'] == 'removed':
-                    current['original'] += ' ' + segment['original']
-            else:
-                # Different type, save current and start new
-                merged.append(current)
-                current = segment.copy()
-        
-        merged.append(current)
-        return merged
-    
-    def compute_diff_summary(self, diff_segments: List[Dict[str, Any]]) -> Dict[str, int]:
-        """Compute summary statistics for the diff"""
-        stats = {
-            'words_added': 0,
-            'words_removed': 0,
-            'words_unchanged': 0
-        }
-        
-        for segment in diff_segments:
-            word_count = len(segment['text'].split())
-            if segment['type'] == 'added':
-                stats['words_added'] += word_count
-            elif segment['type'] == 'removed':
-                stats['words_removed'] += word_count
-            elif segment['type'] == 'unchanged':
-                stats['words_unchanged'] += word_count
+    def compute_diff_stats(self, original: str, revised: str, granularity: str = 'auto') -> Dict[str, Any]:
+        """
+        Statistics of the diff between two texts, for callers that do not need the segments
         
-        return stats
\ No newline at end of file
+        Returns:
+            Word/line/character counts (added, removed, unchanged) and change_ratio
+        """
+        if original == revised:
+            stats = DiffStats()
+            stats.add_text('unchanged', original.strip())
+            return stats.to_dict()
+        return self.compute_document_diff(original, revised, granularity).stats.to_dict()
+    
+    def compute_diff_summary(self, diff: DiffResult) -> Dict[str, Any]:
+        """Compute summary statistics for the diff (collected while the diff was built)"""
+        return diff.stats.to_dict()
@@ -8,7 +8,7 @@ import json
 from template import DocxTemplate
 import io
 from .review_data_service import get_raw_review_data
-from .template_service import create_default_template
+from .template_service import default_template_content
 
 
 class DocumentGenerationService:
@@ -53,9 +53,8 @@ class DocumentGenerationService:
                 if not template_found:
                     return None
             else:
-                # Create default template programmatically (no file system dependency)
-                template_buffer = create_default_template()
-                doc = DocxTemplate(template_buffer)
+                # Default template built programmatically (no file system dependency), once per process
+                doc = DocxTemplate(io.BytesIO(default_template_content()))
             
             # Create context dictionary with template tags
             context = {}
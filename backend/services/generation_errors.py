@@ -0,0 +1,33 @@
+"""
+Typed errors raised by the generation pipeline, each carrying the HTTP status handlers should return
+"""
+
+
+class GenerationError(Exception):
+    """Base class for failures while generating content"""
+    status_code = 500
+
+
+class InvalidGenerationRequestError(GenerationError):
+    """The request is missing input needed to generate anything"""
+    status_code = 400
+
+
+class RateLimitedError(GenerationError):
+    """The provider kept rate limiting the request after all retries"""
+    status_code = 429
+
+
+class ProviderError(GenerationError):
+    """The provider returned an error or could not be reached"""
+    status_code = 502
+
+
+class ProviderUnavailableError(GenerationError):
+    """The circuit breaker is open for this model, so the call failed fast"""
+    status_code = 503
+
+
+class GenerationTimeoutError(GenerationError):
+    """The operation did not finish within its deadline"""
+    status_code = 504
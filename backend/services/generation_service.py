@@ -3,10 +3,36 @@ Document generation service with section-aware processing
 """
 
 import json
+import asyncio
+import copy
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from os import getenv
 from services.openai_tools import create_azure_openai_client
 from prompts.section_prompts import SectionPrompts
 from services.diff_service import DocumentDiffService
+from services.table_diff_service import TableDiffService
+from services.merge_service import MergeService
 from services.json_schema_service import JsonSchemaService
+from services.response_cache import ResponseCache
+from services.single_flight import SingleFlight
+from services.llm_scheduler import LLMScheduler, get_retry_after, estimate_tokens
+from services.context_builder import ContextBuilder
+from services.cpu_pool import CpuPool
+from services.generation_errors import (
+    GenerationError, InvalidGenerationRequestError, RateLimitedError,
+    ProviderError, ProviderUnavailableError, GenerationTimeoutError
+)
+from services.resilience import (
+    CircuitBreaker, LatencyTracker, is_transient_error, backoff_delay, first_successful
+)
+
+# The OpenAI SDK client is blocking, so completions run on a dedicated thread pool
+# and are awaited from the IOLoop instead of stalling it for every other request
+LLM_MAX_WORKERS = int(getenv('LLM_MAX_WORKERS', 64))
+_llm_executor = ThreadPoolExecutor(max_workers=LLM_MAX_WORKERS, thread_name_prefix='llm')
 
 
 class GenerationService:
@@ -26,139 +52,571 @@ class GenerationService:
         'revision': "You are an expert writer. Revise documents based on feedback while maintaining the original intent."
     }
     
-    def __init__(self, model_id: str = None):
-        self.prompts = SectionPrompts()
-        self.client = create_azure_openai_client()
+    DEFAULT_MODEL = 'gpt-4.1-2025-04-14'
+    
+    # Default number of sections drafted in parallel by generate_drafts_for_sections
+    BATCH_MAX_CONCURRENCY = int(getenv('BATCH_MAX_CONCURRENCY', 4))
+    
+    # Section types drafted with one outline+draft completion instead of two sequential calls
+    SINGLE_CALL_DRAFT_SECTIONS = {
+        section_type.strip() for section_type in getenv('SINGLE_CALL_DRAFT_SECTIONS', '').split(',') if section_type.strip()
+    }
+    
+    # Models sampled at temperature 1.0; their responses are never served from cache
+    NON_DETERMINISTIC_MODELS = {'o4-mini-2025-04-16'}
+    
+    # Completion tokens budgeted per request before the provider reports real usage
+    OUTPUT_TOKEN_ALLOWANCE = int(getenv('LLM_OUTPUT_TOKEN_ALLOWANCE', 1000))
+    
+    # How many times a request re-queues after the provider answers 429
+    RATE_LIMIT_RETRIES = int(getenv('LLM_RATE_LIMIT_RETRIES', 3))
+    
+    # Deadline in seconds per operation, covering queueing, retries and hedges (override with LLM_TIMEOUT_<OPERATION>)
+    OPERATION_TIMEOUTS = {
+        'outline': 90,
+        'draft': 180,
+        'outline_draft': 240,
+        'review': 120,
+        'revision': 180,
+        'row_update': 90,
+        'table_update': 240
+    }
+    DEFAULT_TIMEOUT = float(getenv('LLM_DEFAULT_TIMEOUT', 120))
+    
+    # Retries for transient failures (connection errors, timeouts, 5xx responses)
+    MAX_RETRIES = int(getenv('LLM_MAX_RETRIES', 2))
+    
+    # Send a duplicate request once the first outlives this latency percentile (0 disables hedging)
+    HEDGE_PERCENTILE = float(getenv('LLM_HEDGE_PERCENTILE', 0))
+    
+    # Consecutive transient failures that open a model's circuit breaker, and its cool-down in seconds
+    CIRCUIT_FAILURE_THRESHOLD = int(getenv('LLM_CIRCUIT_FAILURE_THRESHOLD', 5))
+    CIRCUIT_RESET_TIMEOUT = float(getenv('LLM_CIRCUIT_RESET_TIMEOUT', 30))
+    # A half-open trial call not heard back from after this many seconds is treated as lost
+    CIRCUIT_TRIAL_TIMEOUT = float(getenv('LLM_CIRCUIT_TRIAL_TIMEOUT', max(OPERATION_TIMEOUTS.values())))
+    
+    def __init__(self, model_id: str = None, client=None, prompts: SectionPrompts = None, diff_service: DocumentDiffService = None, response_cache: ResponseCache = None, single_flight: SingleFlight = None, scheduler: LLMScheduler = None, context_builder: ContextBuilder = None, cpu_pool: CpuPool = None):
+        # Shared collaborators are injected by ServiceRegistry; standalone use builds its own
+        self.prompts = prompts or SectionPrompts()
+        self.client = client or create_azure_openai_client()
         # Use provided model ID or fallback to default
-        self.model = model_id or 'gpt-4.1-2025-04-14'
-        self.diff_service = DocumentDiffService()
+        self.model = model_id or self.DEFAULT_MODEL
+        self.diff_service = diff_service or DocumentDiffService()
+        self.table_diff_service = TableDiffService(self.diff_service)
+        self.merge_service = MergeService(self.diff_service)
+        self.response_cache = response_cache
+        self.single_flight = single_flight or SingleFlight()
+        self.scheduler = scheduler
+        self.context_builder = context_builder or ContextBuilder()
+        # Large diffs and table formatting run here instead of on the IOLoop
+        self.cpu_pool = cpu_pool or CpuPool.from_env()
+        # Per-model health state, shared by the per-request copies from with_options()
+        self.circuit_breaker = CircuitBreaker(self.CIRCUIT_FAILURE_THRESHOLD, self.CIRCUIT_RESET_TIMEOUT, self.CIRCUIT_TRIAL_TIMEOUT)
+        self.latency = LatencyTracker()
+        self.resilience_stats = {'retries': 0, 'hedges': 0, 'timeouts': 0}
+        self.use_cache = True
+        self.priority = 'normal'
     
-    def _generate_content(self, operation: str, section_type: str, section_name: str, guidelines: str = None, prompt_override: str = None, **prompt_kwargs) -> str:
-        """Unified content generation method for all operations"""
+    def with_options(self, use_cache: bool = None, priority: str = None) -> 'GenerationService':
+        """Return a lightweight per-request copy sharing this service's client and collaborators"""
+        service = copy.copy(self)
+        if use_cache is not None:
+            service.use_cache = use_cache
+        if priority is not None:
+            service.priority = priority
+        return service
+    
+    def is_deterministic(self) -> bool:
+        """Whether this model runs at temperature 0 and may therefore be cached"""
+        return self.model not in self.NON_DETERMINISTIC_MODELS
+    
+    def _cache_key(self, request: dict):
+        """Cache key for a completion request, or None when caching does not apply"""
+        if not (self.use_cache and self.response_cache and self.is_deterministic()):
+            return None
+        # Streaming and blocking calls share entries, so the stream flag is not part of the key
+        return ResponseCache.make_key({k: v for k, v in request.items() if k != 'stream'})
+    
+    def _build_completion_request(self, system_prompt: str, prompt: str, response_format: dict = None, **options) -> dict:
+        """Build chat completion parameters shared by blocking and streaming calls"""
+        # Set temperature based on model
+        temperature = 0.0 if self.is_deterministic() else 1.0
+        
+        request = {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": prompt}
+            ],
+            "temperature": temperature,
+            **options
+        }
+        if response_format:
+            request["response_format"] = response_format
+        return request
+    
+    def get_stats(self) -> dict:
+        """Health and latency metrics for this model"""
+        return {
+            'circuit_breaker': self.circuit_breaker.get_stats(),
+            'latency': self.latency.get_stats(),
+            **self.resilience_stats
+        }
+    
+    def _operation_timeout(self, operation: str) -> float:
+        default = self.OPERATION_TIMEOUTS.get(operation, self.DEFAULT_TIMEOUT)
+        return float(getenv(f'LLM_TIMEOUT_{operation.upper()}', default))
+    
+    async def _create_completion(self, system_prompt: str, prompt: str, response_format: dict = None, operation: str = 'default') -> str:
+        """Run a chat completion within the operation's deadline and return the stripped message content"""
+        request = self._build_completion_request(system_prompt, prompt, response_format)
+        cache_key = self._cache_key(request)
+        if cache_key:
+            cached = await self.response_cache.get_async(cache_key)
+            if cached is not None:
+                return cached
+        
+        async def execute():
+            timeout = self._operation_timeout(operation)
+            deadline = time.monotonic() + timeout
+            try:
+                response = await asyncio.wait_for(self._call_completion_api(request, deadline), timeout)
+            except asyncio.TimeoutError:
+                self.resilience_stats['timeouts'] += 1
+                raise GenerationTimeoutError(
+                    f"The {operation} request to {self.model} did not finish within {timeout:g} seconds. Please try again."
+                )
+            content = response.choices[0].message.content.strip()
+            if cache_key:
+                await self.response_cache.set_async(cache_key, content)
+            return content
+        
+        # Identical requests already in flight share one upstream completion
+        return await self.single_flight.do(SingleFlight.make_key(request), execute)
+    
+    def _estimate_request_tokens(self, request: dict) -> int:
+        """Token budget for a request: prompt estimate plus the completion allowance"""
+        prompt_tokens = sum(estimate_tokens(message['content']) for message in request['messages'])
+        return prompt_tokens + self.OUTPUT_TOKEN_ALLOWANCE
+    
+    async def _schedule(self, estimated_tokens: int) -> None:
+        """Wait for the model's rate-limit budget in this request's priority lane"""
+        if self.scheduler:
+            await self.scheduler.acquire(self.model, estimated_tokens, self.priority)
+    
+    def _check_circuit(self) -> None:
+        if not self.circuit_breaker.allow_request():
+            raise ProviderUnavailableError(
+                f"{self.model} is failing repeatedly, so requests are paused for up to "
+                f"{self.CIRCUIT_RESET_TIMEOUT:g} seconds. Please try again shortly."
+            )
+    
+    async def _call_completion_api(self, request: dict, deadline: float):
+        """Call the provider with circuit breaking, bounded retries and retry-after handling"""
+        estimated_tokens = self._estimate_request_tokens(request)
+        attempt = 0
+        rate_limited = 0
+        while True:
+            self._check_circuit()
+            try:
+                response = await self._hedged_call(request, estimated_tokens, deadline)
+            except asyncio.CancelledError:
+                # The deadline passed (wait_for cancels us) or the caller went away;
+                # CancelledError is not an Exception, so it must release the breaker here
+                self.circuit_breaker.record_abandoned()
+                raise
+            except Exception as e:
+                retry_after = get_retry_after(e)
+                if retry_after is not None:
+                    # Rate limits say nothing about provider health
+                    self.circuit_breaker.record_neutral()
+                    if rate_limited >= self.RATE_LIMIT_RETRIES:
+                        raise RateLimitedError(f"{self.model} is rate limited. Please try again in a few seconds.") from e
+                    rate_limited += 1
+                    self.resilience_stats['retries'] += 1
+                    if self.scheduler:
+                        # Pause the whole model lane and re-queue behind the pause
+                        self.scheduler.on_rate_limited(self.model, retry_after)
+                    else:
+                        await asyncio.sleep(retry_after)
+                    continue
+                if not is_transient_error(e):
+                    self.circuit_breaker.record_neutral()
+                    raise ProviderError(f"{self.model} rejected the request: {str(e)}") from e
+                
+                self.circuit_breaker.record_failure()
+                if attempt >= self.MAX_RETRIES:
+                    raise ProviderError(f"{self.model} failed after {attempt + 1} attempts: {str(e)}") from e
+                self.resilience_stats['retries'] += 1
+                await asyncio.sleep(backoff_delay(attempt))
+                attempt += 1
+                continue
+            
+            self.circuit_breaker.record_success()
+            return response
+    
+    async def _hedged_call(self, request: dict, estimated_tokens: int, deadline: float):
+        """Run one attempt, racing a duplicate request if it outlives the configured latency percentile"""
+        hedge_delay = self.latency.percentile(self.HEDGE_PERCENTILE) if self.HEDGE_PERCENTILE else None
+        primary = asyncio.ensure_future(self._execute_request(request, estimated_tokens, deadline))
+        if hedge_delay is None:
+            return await primary
+        
         try:
-            # Use override prompt or generate using unified method
-            if prompt_override:
-                prompt = prompt_override
-            else:
-                prompt = self.prompts.get_prompt(operation, section_type, section_name, guidelines, **prompt_kwargs)
-            
-            # Determine content type and system prompt
-            is_table_section = JsonSchemaService.is_table_section(section_type)
-            requires_json = is_table_section and operation in ['draft', 'revision']
-            
-            if requires_json:
-                system_prompt = self.SYSTEM_PROMPTS['json']
-                response_format = JsonSchemaService.get_structured_output_format(section_type)
-            elif operation == 'review':
-                system_prompt = self.SYSTEM_PROMPTS['review']
-                response_format = None
-            elif operation == 'revision':
-                system_prompt = self.SYSTEM_PROMPTS['revision']
-                response_format = None
-            else:
-                system_prompt = self.SYSTEM_PROMPTS['text']
-                response_format = None
-            
-            # For override prompts, determine the type of operation
-            if prompt_override:
-                # Check if this is a text selection operation
-                if "SELECTION START" in prompt_override and "SELECTION END" in prompt_override:
-                    system_prompt = "You are a precise text editor. You must return ONLY the improved version of the selected text, without adding ANY text before or after it. The returned text must be a direct replacement for the selection - no more, no less."
-                else:
-                    # Table data or other operations
-                    system_prompt = "You are an expert at improving table data based on feedback. Return data in the same format as provided."
-            
-            # Set temperature based on model
-            temperature = 1.0 if self.model == 'o4-mini-2025-04-16' else 0.0
-            
-            # Make API call with direct parameters
-            if response_format:
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": prompt}
-                    ],
-                    temperature=temperature,
-                    response_format=response_format
+            done, _ = await asyncio.wait({primary}, timeout=hedge_delay)
+        except asyncio.CancelledError:
+            primary.cancel()
+            raise
+        if done:
+            return primary.result()
+        
+        self.resilience_stats['hedges'] += 1
+        hedge = asyncio.ensure_future(self._execute_request(request, estimated_tokens, deadline))
+        return await first_successful([primary, hedge])
+    
+    async def _execute_request(self, request: dict, estimated_tokens: int, deadline: float):
+        """Admit one request through the scheduler and run it on the LLM thread pool"""
+        await self._schedule(estimated_tokens)
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        # The SDK timeout bounds the worker thread too, since it cannot be cancelled from here
+        timeout = max(1.0, deadline - started)
+        response = await loop.run_in_executor(
+            _llm_executor, functools.partial(self.client.chat.completions.create, **request, timeout=timeout)
+        )
+        self.latency.record(time.monotonic() - started)
+        
+        usage = getattr(response, 'usage', None)
+        if self.scheduler and usage is not None:
+            self.scheduler.record_usage(self.model, estimated_tokens, usage.total_tokens)
+        return response
+    
+    async def _stream_completion(self, system_prompt: str, prompt: str, response_format: dict = None, operation: str = 'default'):
+        """Stream a chat completion within the operation's deadline, yielding content deltas as the worker thread receives them"""
+        request = self._build_completion_request(system_prompt, prompt, response_format, stream=True)
+        cache_key = self._cache_key(request)
+        if cache_key:
+            cached = await self.response_cache.get_async(cache_key)
+            if cached is not None:
+                yield cached
+                return
+        
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        done = object()
+        cancelled = threading.Event()
+        timeout = self._operation_timeout(operation)
+        deadline = time.monotonic() + timeout
+        
+        def consume():
+            try:
+                # The SDK timeout bounds a stalled read, which the worker thread cannot be cancelled out of
+                stream = self.client.chat.completions.create(**request, timeout=max(1.0, deadline - time.monotonic()))
+                for chunk in stream:
+                    if cancelled.is_set():
+                        # Caller went away (e.g. browser closed), stop paying for tokens
+                        stream.close()
+                        break
+                    # Azure sends content-filter chunks without choices
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        loop.call_soon_threadsafe(queue.put_nowait, chunk.choices[0].delta.content)
+                loop.call_soon_threadsafe(queue.put_nowait, done)
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+        
+        self._check_circuit()
+        parts = []
+        recorded = False
+        
+        async def within_deadline(awaitable):
+            # A stalled stream gives up like a blocking completion does, releasing the SSE connection
+            nonlocal recorded
+            try:
+                return await asyncio.wait_for(awaitable, deadline - time.monotonic())
+            except asyncio.TimeoutError:
+                self.resilience_stats['timeouts'] += 1
+                self.circuit_breaker.record_abandoned()
+                recorded = True
+                raise GenerationTimeoutError(
+                    f"The {operation} request to {self.model} did not finish within {timeout:g} seconds. Please try again."
                 )
+        
+        try:
+            await within_deadline(self._schedule(self._estimate_request_tokens(request)))
+            loop.run_in_executor(_llm_executor, consume)
+            while True:
+                item = await within_deadline(queue.get())
+                if item is done:
+                    self.circuit_breaker.record_success()
+                    recorded = True
+                    break
+                if isinstance(item, Exception):
+                    retry_after = get_retry_after(item)
+                    if retry_after is not None and self.scheduler:
+                        self.scheduler.on_rate_limited(self.model, retry_after)
+                    if is_transient_error(item) and retry_after is None:
+                        self.circuit_breaker.record_failure()
+                    else:
+                        self.circuit_breaker.record_neutral()
+                    recorded = True
+                    raise item
+                parts.append(item)
+                yield item
+        finally:
+            cancelled.set()
+            if not recorded:
+                # Caller left (disconnect at a yield, cancellation while queued or streaming):
+                # tokens arriving means the provider is healthy, silence is an abandoned call
+                if parts:
+                    self.circuit_breaker.record_success()
+                else:
+                    self.circuit_breaker.record_abandoned()
+        
+        if cache_key:
+            await self.response_cache.set_async(cache_key, ''.join(parts).strip())
+    
+    def _resolve_generation_request(self, operation: str, section_type: str, section_name: str, guidelines: str = None, prompt_override: str = None, **prompt_kwargs) -> tuple:
+        """Resolve the (system prompt, user prompt, response format) for an operation"""
+        # Use override prompt or generate using unified method
+        if prompt_override:
+            prompt = prompt_override
+        else:
+            prompt = self.prompts.get_prompt(operation, section_type, section_name, guidelines, **prompt_kwargs)
+        
+        # Determine content type and system prompt
+        is_table_section = JsonSchemaService.is_table_section(section_type)
+        requires_json = is_table_section and operation in ['draft', 'revision']
+        
+        if operation == 'outline_draft':
+            system_prompt = self.SYSTEM_PROMPTS['json'] if is_table_section else self.SYSTEM_PROMPTS['text']
+            response_format = JsonSchemaService.get_outline_draft_output_format(section_type)
+        elif requires_json:
+            system_prompt = self.SYSTEM_PROMPTS['json']
+            response_format = JsonSchemaService.get_structured_output_format(section_type)
+        elif operation == 'review':
+            system_prompt = self.SYSTEM_PROMPTS['review']
+            response_format = None
+        elif operation == 'revision':
+            system_prompt = self.SYSTEM_PROMPTS['revision']
+            response_format = None
+        else:
+            system_prompt = self.SYSTEM_PROMPTS['text']
+            response_format = None
+        
+        # For override prompts, determine the type of operation
+        if prompt_override:
+            # Check if this is a text selection operation
+            if "SELECTION START" in prompt_override and "SELECTION END" in prompt_override:
+                system_prompt = "You are a precise text editor. You must return ONLY the improved version of the selected text, without adding ANY text before or after it. The returned text must be a direct replacement for the selection - no more, no less."
             else:
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": prompt}
-                    ],
-                    temperature=temperature
-                )
-                
-            return response.choices[0].message.content.strip()
+                # Table data or other operations
+                system_prompt = "You are an expert at improving table data based on feedback. Return data in the same format as provided."
+        
+        return system_prompt, prompt, response_format
+    
+    async def _generate_content(self, operation: str, section_type: str, section_name: str, guidelines: str = None, prompt_override: str = None, **prompt_kwargs) -> str:
+        """Unified content generation method for all operations"""
+        try:
+            system_prompt, prompt, response_format = self._resolve_generation_request(
+                operation, section_type, section_name, guidelines, prompt_override, **prompt_kwargs
+            )
+            return await self._create_completion(system_prompt, prompt, response_format, operation)
             
+        except GenerationError:
+            raise
         except Exception as e:
             print(f"Error in {operation} generation: {e}")
-            return f"Error in {operation} generation: {str(e)}. Please check your API configuration."
+            raise GenerationError(f"Error in {operation} generation: {str(e)}. Please check your API configuration.") from e
+    
+    async def _stream_content(self, operation: str, section_type: str, section_name: str, guidelines: str = None, **prompt_kwargs):
+        """Streaming counterpart of _generate_content, yielding content deltas"""
+        system_prompt, prompt, response_format = self._resolve_generation_request(
+            operation, section_type, section_name, guidelines, **prompt_kwargs
+        )
+        async for delta in self._stream_completion(system_prompt, prompt, response_format, operation):
+            yield delta
     
-    def generate_outline_from_notes(self, notes: str, section_name: str, section_type: str, guidelines: str = None) -> str:
+    async def generate_outline_from_notes(self, notes: str, section_name: str, section_type: str, guidelines: str = None) -> str:
         """Generate outline using unified generation method"""
         if not notes.strip():
             return "Please provide notes to generate an outline."
         
-        return self._generate_content('outline', section_type, section_name, guidelines, notes=notes)
+        return await self._generate_content('outline', section_type, section_name, guidelines, notes=notes)
     
-    def generate_draft_from_outline(self, notes: str, outline: str, section_name: str, section_type: str, guidelines: str = None) -> str:
+    async def generate_draft_from_outline(self, notes: str, outline: str, section_name: str, section_type: str, guidelines: str = None) -> str:
         """Generate draft using unified generation method"""
         if not outline.strip():
             return "Please provide an outline to generate a draft."
         
-        return self._generate_content('draft', section_type, section_name, guidelines, notes=notes, outline=outline)
+        return await self._generate_content('draft', section_type, section_name, guidelines, notes=notes, outline=outline)
     
-    def generate_review_suggestions(self, draft: str, section_name: str, section_type: str, guidelines: str = None) -> str:
+    async def generate_review_suggestions(self, draft: str, section_name: str, section_type: str, guidelines: str = None) -> str:
         """Generate review suggestions using unified generation method"""
         if not draft.strip():
             return "Please provide a draft to review."
         
-        return self._generate_content('review', section_type, section_name, guidelines, draft=draft)
+        return await self._generate_content('review', section_type, section_name, guidelines, draft=draft)
     
-    def apply_review_notes(self, draft: str, review_notes: str, section_name: str, section_type: str, guidelines: str = None) -> str:
+    async def apply_review_notes(self, draft: str, review_notes: str, section_name: str, section_type: str, guidelines: str = None) -> str:
         """Apply review notes using unified generation method"""
         if not draft.strip():
             return "Please provide a draft to revise."
         if not review_notes.strip():
             return "Please provide review notes to apply."
         
-        return self._generate_content('revision', section_type, section_name, guidelines, draft=draft, review_notes=review_notes)
+        return await self._generate_content('revision', section_type, section_name, guidelines, draft=draft, review_notes=review_notes)
+    
+    async def generate_outline_and_draft(self, notes: str, section_name: str, section_type: str, guidelines: str = None) -> tuple:
+        """Generate outline and draft in a single structured completion, returning (outline, draft)
+        
+        For table sections the draft is the {"rows": [...]} JSON string, matching the two-step output.
+        """
+        content = await self._generate_content('outline_draft', section_type, section_name, guidelines, notes=notes)
+        try:
+            result = json.loads(content)
+        except json.JSONDecodeError as e:
+            raise GenerationError(f"Error in draft generation: model returned invalid outline/draft JSON ({str(e)}).") from e
+        
+        if JsonSchemaService.is_table_section(section_type):
+            return result['outline'], json.dumps({"rows": result['rows']})
+        return result['outline'], result['draft'].strip()
+    
+    def resolve_draft_mode(self, section_type: str, draft_mode: str = None) -> str:
+        """Pick 'single' or 'two_step' drafting: explicit request mode first, then per-section configuration"""
+        if draft_mode in ('single', 'two_step'):
+            return draft_mode
+        return 'single' if section_type in self.SINGLE_CALL_DRAFT_SECTIONS else 'two_step'
     
-    def generate_draft_from_notes(self, notes: str, section_name: str, section_type: str, guidelines: str = None) -> str:
+    async def generate_draft_from_notes(self, notes: str, section_name: str, section_type: str, guidelines: str = None, draft_mode: str = None) -> str:
         """Generate draft directly from notes using internal two-step process (notes -> outline -> draft)
         
         Note: The 'guidelines' parameter contains the draft guidelines from the frontend.
         These guidelines are intentionally used for both outline and draft generation steps
         to ensure consistency. The outline generation is an internal implementation detail
         not exposed to users.
+        
+        In 'single' draft mode (see resolve_draft_mode) outline and draft come from one
+        structured completion, which avoids re-sending the notes and guidelines.
         """
         if not notes.strip():
             return "Please provide notes to generate a draft."
         
         try:
+            if self.resolve_draft_mode(section_type, draft_mode) == 'single':
+                _, draft = await self.generate_outline_and_draft(notes, section_name, section_type, guidelines)
+                return draft
+            
             # Step 1: Generate outline internally (not returned to user)
             # Uses draft guidelines to ensure outline aligns with desired draft output
-            outline = self.generate_outline_from_notes(notes, section_name, section_type, guidelines)
-            
-            # Check if outline generation failed
-            if outline.startswith("Error generating outline:"):
-                return f"Error in draft generation: {outline}"
+            outline = await self.generate_outline_from_notes(notes, section_name, section_type, guidelines)
             
             # Step 2: Generate draft from the internal outline
             # Uses same draft guidelines for consistency
-            draft = self.generate_draft_from_outline(notes, outline, section_name, section_type, guidelines)
+            draft = await self.generate_draft_from_outline(notes, outline, section_name, section_type, guidelines)
             
             return draft
             
+        except GenerationError:
+            raise
         except Exception as e:
             print(f"Error generating draft from notes: {e}")
-            return f"Error generating draft: {str(e)}. Please check your API configuration."
+            raise GenerationError(f"Error generating draft: {str(e)}. Please check your API configuration.") from e
+    
+    async def generate_drafts_for_sections(self, sections: list, max_concurrency: int = None):
+        """Draft many sections concurrently, yielding ('section', result) as each one finishes
+        
+        Each section runs its own notes -> outline -> draft pipeline; at most
+        max_concurrency pipelines are in flight at once. A final 'done' event
+        carries the completed/failed counts.
+        """
+        semaphore = asyncio.Semaphore(max(1, max_concurrency or self.BATCH_MAX_CONCURRENCY))
+        
+        async def draft_section(index, section):
+            async with semaphore:
+                try:
+                    draft = await self.generate_draft_from_notes(
+                        section.get('notes', ''),
+                        section.get('sectionName', 'Section'),
+                        section.get('sectionType', 'default'),
+                        section.get('guidelines', None),
+                        section.get('draftMode', None)
+                    )
+                except GenerationError as e:
+                    return index, section, e
+            return index, section, draft
+        
+        tasks = [asyncio.ensure_future(draft_section(index, section)) for index, section in enumerate(sections)]
+        completed = 0
+        failed = 0
+        try:
+            for next_finished in asyncio.as_completed(tasks):
+                index, section, draft = await next_finished
+                result = {
+                    "index": index,
+                    "sectionId": section.get('sectionId', index),
+                    "sectionName": section.get('sectionName', 'Section')
+                }
+                if isinstance(draft, GenerationError):
+                    failed += 1
+                    result["error"] = str(draft)
+                    result["status"] = draft.status_code
+                else:
+                    completed += 1
+                    result["result"] = draft
+                yield 'section', result
+            yield 'done', {"result": {"completed": completed, "failed": failed}}
+        finally:
+            # Stop outstanding pipelines if the caller goes away early
+            for task in tasks:
+                task.cancel()
+    
+    async def stream_draft_from_notes(self, notes: str, section_name: str, section_type: str, guidelines: str = None):
+        """Stream the notes -> outline -> draft pipeline as (event, data) tuples
+        
+        Events: 'outline_token' for each outline delta, 'outline' once the outline is
+        complete, 'token' for each draft delta and 'done' with the final draft.
+        Failures are reported as a single 'error' event.
+        """
+        if not notes.strip():
+            yield 'done', {"result": "Please provide notes to generate a draft."}
+            return
+        
+        try:
+            outline_parts = []
+            async for delta in self._stream_content('outline', section_type, section_name, guidelines, notes=notes):
+                outline_parts.append(delta)
+                yield 'outline_token', {"text": delta}
+            outline = ''.join(outline_parts).strip()
+            yield 'outline', {"result": outline}
+            
+            draft_parts = []
+            async for delta in self._stream_content('draft', section_type, section_name, guidelines, notes=notes, outline=outline):
+                draft_parts.append(delta)
+                yield 'token', {"text": delta}
+            yield 'done', {"result": ''.join(draft_parts).strip()}
+            
+        except Exception as e:
+            print(f"Error streaming draft from notes: {e}")
+            yield 'error', {"error": f"Error generating draft: {str(e)}. Please check your API configuration.", "status": getattr(e, 'status_code', 500)}
     
-    def apply_review_notes_with_diff(self, draft: str, review_notes: str, section_name: str, section_type: str, guidelines: str = None) -> dict:
+    async def stream_review_suggestions(self, draft: str, section_name: str, section_type: str, guidelines: str = None):
+        """Stream review suggestions as (event, data) tuples ('token' deltas, then 'done')"""
+        if not draft.strip():
+            yield 'done', {"result": "Please provide a draft to review."}
+            return
+        
+        try:
+            review_parts = []
+            async for delta in self._stream_content('review', section_type, section_name, guidelines, draft=draft):
+                review_parts.append(delta)
+                yield 'token', {"text": delta}
+            yield 'done', {"result": ''.join(review_parts).strip()}
+            
+        except Exception as e:
+            print(f"Error streaming review suggestions: {e}")
+            yield 'error', {"error": f"Error in review generation: {str(e)}. Please check your API configuration.", "status": getattr(e, 'status_code', 500)}
+    
+    async def apply_review_notes_with_diff(self, draft: str, review_notes: str, section_name: str, section_type: str, guidelines: str = None) -> dict:
         """Apply review notes and return both new draft and diff data"""
         if not draft.strip():
             return {"error": "Please provide a draft to revise."}
@@ -167,14 +625,12 @@ class GenerationService:
         
         try:
             # Generate the new draft first
-            new_draft = self.apply_review_notes(draft, review_notes, section_name, section_type, guidelines)
+            new_draft = await self.apply_review_notes(draft, review_notes, section_name, section_type, guidelines)
             
-            # Check if generation failed
-            if new_draft.startswith("Error"):
-                return {"error": new_draft}
-            
-            # Compute diff between original and new draft
-            diff_segments, diff_summary, formatted_original, formatted_new = self._compute_diff_data(draft, new_draft, section_type)
+            # Compute diff between original and new draft (on the CPU pool for large drafts)
+            diff_segments, diff_summary, formatted_original, formatted_new, table_diff = await self.cpu_pool.run(
+                self._compute_diff_data, draft, new_draft, section_type, size=len(draft) + len(new_draft)
+            )
             
             # Return result with optional formatted strings for table sections
             result = {
@@ -187,14 +643,18 @@ class GenerationService:
                 result["original_formatted"] = formatted_original
             if formatted_new:
                 result["new_formatted"] = formatted_new
+            if table_diff:
+                result["table_diff"] = table_diff
             
             return result
             
+        except GenerationError:
+            raise
         except Exception as e:
             print(f"Error applying review notes with diff: {e}")
             return {"error": f"Error applying review notes: {str(e)}. Please check your API configuration."}
     
-    def review_table_row_with_diff(self, row_data: dict, review_notes: str, columns: list, section_name: str, section_type: str = None, guidelines: str = None, full_table_data: dict = None) -> dict:
+    async def review_table_row_with_diff(self, row_data: dict, review_notes: str, columns: list, section_name: str, section_type: str = None, guidelines: str = None, full_table_data: dict = None) -> dict:
         """Review a single table row and return updated row with diff data"""
         if not row_data:
             return {"error": "Please provide row data to review."}
@@ -233,51 +693,27 @@ IMPORTANT: Return the improved table data in the EXACT same JSON format. You may
             # Make direct API call with structured output format
             system_prompt = "You are an expert at improving table data based on feedback. Always return valid JSON in the exact format requested."
             
-            # Set temperature based on model
-            temperature = 1.0 if self.model == 'o4-mini-2025-04-16' else 0.0
-            
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=temperature,
-                response_format=JsonSchemaService.get_structured_output_format(section_type, "row_update")
+            improved_json_text = await self._create_completion(
+                system_prompt, prompt, JsonSchemaService.get_structured_output_format(section_type, "row_update"),
+                operation='row_update'
             )
             
-            improved_json_text = response.choices[0].message.content.strip()
-            
-            if improved_json_text.startswith("Error"):
-                return {"error": improved_json_text}
-            
             # Parse JSON response and extract all rows
             # Structured outputs guarantee valid JSON, so no need for fallbacks
             improved_table = json.loads(improved_json_text)
             improved_rows = improved_table['rows']
             
-            # Compute diff between original single row and new rows using formatted JSON
-            # Always format both as table structure for consistent diff display
-            field_order = self.FIELD_ORDER_MAPPING.get(section_type, None) if section_type else None
-            original_json = self._format_json_with_order({"rows": [row_data]}, field_order, is_table=True)
-            new_formatted = self._format_json_with_order({"rows": improved_rows}, field_order, is_table=True)
-            
-            diff_segments = self.diff_service.compute_document_diff(original_json, new_formatted)
-            diff_summary = self.diff_service.compute_diff_summary(diff_segments)
-            
-            return {
-                "new_rows": improved_rows,  # Return all rows as array
-                "original_formatted": original_json,
-                "new_formatted": new_formatted,
-                "diff_segments": diff_segments,
-                "diff_summary": diff_summary
-            }
+            return await self.cpu_pool.run(
+                self._compute_row_diff_data, row_data, improved_rows, section_type, size=len(improved_json_text)
+            )
             
+        except GenerationError:
+            raise
         except Exception as e:
             print(f"Error reviewing table row: {e}")
             return {"error": f"Error reviewing table row: {str(e)}. Please check your API configuration."}
     
-    def review_table_with_diff(self, table_data: str, review_notes: str, section_name: str, section_type: str = None, guidelines: str = None) -> dict:
+    async def review_table_with_diff(self, table_data: str, review_notes: str, section_name: str, section_type: str = None, guidelines: str = None) -> dict:
         """Review entire table and return updated table with diff data"""
         if not table_data:
             return {"error": "Please provide table data to review."}
@@ -316,41 +752,21 @@ IMPORTANT: Return the improved table data in the EXACT same JSON format with all
             # Make API call with structured output format
             system_prompt = "You are an expert at improving table data based on feedback. Always return valid JSON in the exact format requested."
             
-            # Set temperature based on model
-            temperature = 1.0 if self.model == 'o4-mini-2025-04-16' else 0.0
-            
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=temperature,
-                response_format=JsonSchemaService.get_structured_output_format(section_type, "table_update")
+            improved_json_text = await self._create_completion(
+                system_prompt, prompt, JsonSchemaService.get_structured_output_format(section_type, "table_update"),
+                operation='table_update'
             )
             
-            improved_json_text = response.choices[0].message.content.strip()
-            
-            if improved_json_text.startswith("Error"):
-                return {"error": improved_json_text}
-            
             # Parse JSON response - structured outputs guarantee valid JSON
             improved_table = json.loads(improved_json_text)
             
-            # Format both JSON strings for proper diff computation
-            formatted_original = json.dumps(json.loads(table_data), indent=2)
-            formatted_improved = json.dumps(improved_table, indent=2)
-            
-            # Compute diff between formatted JSON strings
-            diff_segments = self.diff_service.compute_document_diff(formatted_original, formatted_improved)
-            diff_summary = self.diff_service.compute_diff_summary(diff_segments)
-            
-            return {
-                "new_draft": formatted_improved,
-                "diff_segments": diff_segments,
-                "diff_summary": diff_summary
-            }
+            return await self.cpu_pool.run(
+                self._compute_table_diff_data, parsed_table, improved_table, section_type,
+                size=len(table_data) + len(improved_json_text)
+            )
             
+        except GenerationError:
+            raise
         except Exception as e:
             print(f"Error reviewing table: {e}")
             return {"error": f"Error reviewing table: {str(e)}. Please check your API configuration."}
@@ -421,10 +837,79 @@ IMPORTANT: Return the improved table data in the EXACT same JSON format with all
         
         return format_recursive(data)
     
+    async def rebase_draft(self, base_draft: str, edited_draft: str, latest_draft: str, prefer: str = 'latest') -> dict:
+        """
+        Rebase an edit made against base_draft onto latest_draft instead of regenerating it
+        
+        Returns the merged draft, merge conflicts (regions both sides changed differently,
+        resolved in favour of `prefer`) and the diff from latest_draft to the merged draft.
+        """
+        if prefer not in ('latest', 'edited'):
+            return {"error": "Merge preference must be 'latest' or 'edited'."}
+        return await self.cpu_pool.run(
+            self._compute_rebase_data, base_draft, edited_draft, latest_draft, prefer,
+            size=len(base_draft) + len(edited_draft) + len(latest_draft)
+        )
+    
+    def _compute_rebase_data(self, base_draft: str, edited_draft: str, latest_draft: str, prefer: str) -> dict:
+        """Three-way merge plus the diff shown for the merged draft (CPU-bound, see CpuPool)"""
+        merge = self.merge_service.merge(base_draft, edited_draft, latest_draft, prefer)
+        diff_segments = self.diff_service.compute_document_diff(latest_draft, merge['merged'])
+        return {
+            "new_draft": merge['merged'],
+            "conflicts": merge['conflicts'],
+            "clean": merge['clean'],
+            "diff_segments": diff_segments,
+            "diff_summary": self.diff_service.compute_diff_summary(diff_segments)
+        }
+    
+    def _compute_row_diff_data(self, row_data: dict, improved_rows: list, section_type: str = None) -> dict:
+        """Format a reviewed row and its replacement rows and diff them (CPU-bound, see CpuPool)"""
+        # Compute diff between original single row and new rows using formatted JSON
+        # Always format both as table structure for consistent diff display
+        field_order = self.FIELD_ORDER_MAPPING.get(section_type, None) if section_type else None
+        original_json = self._format_json_with_order({"rows": [row_data]}, field_order, is_table=True)
+        new_formatted = self._format_json_with_order({"rows": improved_rows}, field_order, is_table=True)
+        
+        diff_segments = self.diff_service.compute_document_diff(original_json, new_formatted)
+        diff_summary = self.diff_service.compute_diff_summary(diff_segments)
+        
+        return {
+            "new_rows": improved_rows,  # Return all rows as array
+            "original_formatted": original_json,
+            "new_formatted": new_formatted,
+            "diff_segments": diff_segments,
+            "diff_summary": diff_summary
+        }
+    
+    def _compute_table_diff_data(self, parsed_table: dict, improved_table: dict, section_type: str = None) -> dict:
+        """Format a reviewed table and diff it row by row (CPU-bound, see CpuPool)"""
+        formatted_improved = json.dumps(improved_table, indent=2)
+        
+        # Diff the tables row by row rather than line-diffing the formatted JSON
+        field_order = self.FIELD_ORDER_MAPPING.get(section_type, None) if section_type else None
+        table_diff = self.table_diff_service.compute_table_diff(
+            parsed_table['rows'], improved_table.get('rows', []), section_type, field_order
+        )
+        diff_segments = self.table_diff_service.to_diff_segments(table_diff, field_order)
+        diff_summary = self.diff_service.compute_diff_summary(diff_segments)
+        
+        return {
+            "new_draft": formatted_improved,
+            "diff_segments": diff_segments,
+            "diff_summary": diff_summary,
+            "table_diff": table_diff
+        }
+    
     def _compute_diff_data(self, original: str, revised: str, section_type: str) -> tuple:
-        """Unified diff computation for both text and JSON content"""
+        """Unified diff computation for both text and JSON content
+        
+        Returns (diff_segments, diff_summary, formatted_original, formatted_new, table_diff);
+        table_diff holds row/cell change records for table sections and is None otherwise.
+        """
         formatted_original = None
         formatted_new = None
+        table_diff = None
         
         # For table sections, format JSON before computing diff
         if JsonSchemaService.is_table_section(section_type):
@@ -437,8 +922,12 @@ IMPORTANT: Return the improved table data in the EXACT same JSON format with all
                 formatted_original = self._format_json_with_order(original_parsed, field_order, is_table=True)
                 formatted_new = self._format_json_with_order(revised_parsed, field_order, is_table=True)
                 
-                diff_segments = self.diff_service.compute_document_diff(formatted_original, formatted_new)
-            except (json.JSONDecodeError, KeyError):
+                # Match rows structurally instead of line-diffing the formatted tables
+                table_diff = self.table_diff_service.compute_table_diff(
+                    original_parsed['rows'], revised_parsed['rows'], section_type, field_order
+                )
+                diff_segments = self.table_diff_service.to_diff_segments(table_diff, field_order)
+            except (json.JSONDecodeError, KeyError, TypeError):
                 # Fallback to regular diff if JSON parsing fails
                 diff_segments = self.diff_service.compute_document_diff(original, revised)
         else:
@@ -446,23 +935,30 @@ IMPORTANT: Return the improved table data in the EXACT same JSON format with all
             diff_segments = self.diff_service.compute_document_diff(original, revised)
         
         diff_summary = self.diff_service.compute_diff_summary(diff_segments)
-        return diff_segments, diff_summary, formatted_original, formatted_new
+        return diff_segments, diff_summary, formatted_original, formatted_new, table_diff
     
-    def review_text_selection(self, selected_text: str, section_name: str, section_type: str = None, guidelines: str = None, full_draft: str = None) -> str:
+    def _selection_context_header(self, full_draft: str, selected_text: str, selection_start: int = None, selection_end: int = None) -> str:
+        """Document context block for selection prompts, trimmed to a token window around the selection"""
+        start, end = self.context_builder.locate_selection(full_draft, selected_text, selection_start, selection_end)
+        context, trimmed = self.context_builder.build_selection_context(full_draft, start, end)
+        label = "Document context around the selection (trimmed):" if trimmed else "Full document for context:"
+        return f"""
+{label}
+{context}
+
+"""
+    
+    async def review_text_selection(self, selected_text: str, section_name: str, section_type: str = None, guidelines: str = None, full_draft: str = None, selection_start: int = None, selection_end: int = None) -> str:
         """Generate review for a selected text fragment"""
         if not selected_text.strip():
-            return "Error: Please provide text to review."
+            raise InvalidGenerationRequestError("Please provide text to review.")
             
         try:
-            # Create prompt with full document context for better understanding
+            # Create prompt with document context around the selection for better understanding
             prompt = ""
             
             if full_draft and full_draft.strip():
-                prompt = f"""
-Full document for context:
-{full_draft}
-
-"""
+                prompt = self._selection_context_header(full_draft, selected_text, selection_start, selection_end)
             
             prompt += f"""Text selection to review:
 
@@ -483,15 +979,17 @@ Provide your feedback in a clear, structured format."""
                 prompt += f"\n\nGuidelines for reviewing:\n{guidelines.strip()}"
             
             # Generate review using unified error handling
-            review = self._generate_content('review', section_type or 'default', section_name, None, prompt_override=prompt)
+            review = await self._generate_content('review', section_type or 'default', section_name, None, prompt_override=prompt)
             
             return review
             
+        except GenerationError:
+            raise
         except Exception as e:
             print(f"Error reviewing text selection: {e}")
-            return f"Error reviewing text selection: {str(e)}. Please check your API configuration."
+            raise GenerationError(f"Error reviewing text selection: {str(e)}. Please check your API configuration.") from e
     
-    def apply_review_to_selection_with_diff(self, full_draft: str, selected_text: str, selection_start: int, selection_end: int, review_notes: str, section_name: str, section_type: str = None, guidelines: str = None) -> dict:
+    async def apply_review_to_selection_with_diff(self, full_draft: str, selected_text: str, selection_start: int, selection_end: int, review_notes: str, section_name: str, section_type: str = None, guidelines: str = None) -> dict:
         """Apply review to a text selection and return updated draft with diff data"""
         if not full_draft.strip():
             return {"error": "Please provide a draft to work with."}
@@ -501,13 +999,10 @@ Provide your feedback in a clear, structured format."""
             return {"error": "Please provide review notes to apply."}
         
         try:
-            # Create a focused prompt for improving the selection with full document context
+            # Create a focused prompt for improving the selection with document context around it
             selected_char_count = len(selected_text)
-            prompt = f"""
-Full document for context:
-{full_draft}
-
-TEXT SELECTION TO IMPROVE (Original: {selected_char_count} characters):
+            prompt = self._selection_context_header(full_draft, selected_text, selection_start, selection_end)
+            prompt += f"""TEXT SELECTION TO IMPROVE (Original: {selected_char_count} characters):
 
 >>> SELECTION START <<<
 {selected_text}
@@ -529,16 +1024,17 @@ CRITICAL INSTRUCTIONS:
                 prompt += f"\n\nGuidelines for improvement:\n{guidelines.strip()}"
             
             # Generate improved selection using unified error handling
-            improved_selection = self._generate_content('revision', section_type or 'default', section_name, None, prompt_override=prompt)
-            
-            if improved_selection.startswith("Error"):
-                return {"error": improved_selection}
+            improved_selection = await self._generate_content('revision', section_type or 'default', section_name, None, prompt_override=prompt)
             
             # Replace the selection in the full draft
             new_draft = full_draft[:selection_start] + improved_selection + full_draft[selection_end:]
             
-            # Compute diff between original and new draft
-            diff_segments = self.diff_service.compute_document_diff(full_draft, new_draft)
+            # Only the selection window changed: diff it and reuse the untouched prefix/suffix as-is
+            diff_segments = await self.cpu_pool.run(
+                self.diff_service.compute_window_diff,
+                full_draft, new_draft, selection_start, selection_end, selection_start + len(improved_selection),
+                size=len(selected_text) + len(improved_selection)
+            )
             diff_summary = self.diff_service.compute_diff_summary(diff_segments)
             
             return {
@@ -549,6 +1045,8 @@ CRITICAL INSTRUCTIONS:
                 "diff_summary": diff_summary
             }
             
+        except GenerationError:
+            raise
         except Exception as e:
             print(f"Error applying review to selection: {e}")
             return {"error": f"Error applying review to selection: {str(e)}. Please check your API configuration."}
\ No newline at end of file
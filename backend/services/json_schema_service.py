@@ -110,6 +110,49 @@ class JsonSchemaService:
             }
         }
     
+    @classmethod
+    def get_outline_draft_output_format(cls, section_type: str) -> dict:
+        """Get the response_format for single-call outline+draft generation
+        
+        Text sections return {"outline", "draft"}; table sections return
+        {"outline", "rows"} with rows following the table schema.
+        """
+        outline_property = {
+            "type": "string",
+            "description": "Structured outline planned before writing the content"
+        }
+        
+        if cls.is_table_section(section_type):
+            table_schema = cls.get_table_schema(section_type)
+            properties = {
+                "outline": outline_property,
+                "rows": table_schema["properties"]["rows"]
+            }
+            required = ["outline", "rows"]
+        else:
+            properties = {
+                "outline": outline_property,
+                "draft": {
+                    "type": "string",
+                    "description": "Complete section content written from the outline"
+                }
+            }
+            required = ["outline", "draft"]
+        
+        return {
+            "type": "json_schema",
+            "json_schema": {
+                "name": "outline_draft",
+                "schema": {
+                    "type": "object",
+                    "properties": properties,
+                    "required": required,
+                    "additionalProperties": False
+                },
+                "strict": True
+            }
+        }
+    
     @classmethod
     def is_table_section(cls, section_type: str) -> bool:
         """Check if a section type requires table JSON format"""
@@ -0,0 +1,190 @@
+"""
+Per-model rate-limit aware scheduler with priority lanes for LLM completions
+"""
+
+import asyncio
+import heapq
+import itertools
+import json
+import time
+from os import getenv
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at capacity-per-minute"""
+
+    def __init__(self, capacity_per_minute: float):
+        self.capacity = float(capacity_per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def time_until(self, amount: float, now: float) -> float:
+        """Seconds until `amount` tokens are available (amounts above capacity wait for a full bucket)"""
+        self.refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float) -> None:
+        # Allowed to go negative so oversized or under-estimated requests are paid back over time
+        self.tokens -= amount
+
+
+class ModelLane:
+    """Request/token budgets, pause state and priority queue for one model"""
+
+    def __init__(self, rpm: float, tpm: float):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.paused_until = 0.0
+        self.queue = []
+        self.timer = None
+        self.stats = {
+            'admitted': 0,
+            'rate_limited': 0,
+            'total_wait': 0.0,
+            'max_wait': 0.0
+        }
+
+
+class LLMScheduler:
+    """Admits completions per model under requests/min and tokens/min budgets
+
+    Waiters are served strictly by priority lane (interactive, normal, bulk) and
+    FIFO within a lane. Bulk requests are only admitted while a reserve of each
+    budget remains, so interactive work keeps headroom during bulk spikes.
+    Provider retry-after responses pause the whole model lane.
+    """
+
+    PRIORITIES = {'interactive': 0, 'normal': 1, 'bulk': 2}
+
+    def __init__(self, default_rpm: float = 300, default_tpm: float = 150000, limits: dict = None, bulk_reserve: float = 0.2):
+        self.default_rpm = default_rpm
+        self.default_tpm = default_tpm
+        self.limits = limits or {}
+        self.bulk_reserve = bulk_reserve
+        self._lanes = {}
+        self._sequence = itertools.count()
+
+    @classmethod
+    def from_env(cls) -> 'LLMScheduler':
+        """Build a scheduler from LLM_DEFAULT_RPM/TPM, per-model LLM_RATE_LIMITS JSON and LLM_BULK_RESERVE"""
+        return cls(
+            default_rpm=float(getenv('LLM_DEFAULT_RPM', 300)),
+            default_tpm=float(getenv('LLM_DEFAULT_TPM', 150000)),
+            limits=json.loads(getenv('LLM_RATE_LIMITS', '{}')),
+            bulk_reserve=float(getenv('LLM_BULK_RESERVE', 0.2))
+        )
+
+    def _lane(self, model: str) -> ModelLane:
+        lane = self._lanes.get(model)
+        if lane is None:
+            limits = self.limits.get(model, {})
+            lane = ModelLane(limits.get('rpm', self.default_rpm), limits.get('tpm', self.default_tpm))
+            self._lanes[model] = lane
+        return lane
+
+    async def acquire(self, model: str, estimated_tokens: int, priority: str = 'normal') -> None:
+        """Wait until the model's budgets admit a request of roughly estimated_tokens"""
+        lane = self._lane(model)
+        future = asyncio.get_running_loop().create_future()
+        rank = self.PRIORITIES.get(priority, self.PRIORITIES['normal'])
+        heapq.heappush(lane.queue, (rank, next(self._sequence), time.monotonic(), estimated_tokens, future))
+        self._dispatch(model)
+        await future
+
+    def record_usage(self, model: str, estimated_tokens: int, actual_tokens: int) -> None:
+        """Correct the token budget once the provider reports real usage"""
+        if actual_tokens is not None:
+            self._lane(model).tokens.consume(actual_tokens - estimated_tokens)
+
+    def on_rate_limited(self, model: str, retry_after: float) -> None:
+        """Pause admissions for a model after the provider asked us to back off"""
+        lane = self._lane(model)
+        lane.paused_until = max(lane.paused_until, time.monotonic() + retry_after)
+        lane.stats['rate_limited'] += 1
+        # Drain the request bucket so work resumes gradually after the pause
+        lane.requests.tokens = min(lane.requests.tokens, 0.0)
+        self._dispatch(model)
+
+    def _dispatch(self, model: str) -> None:
+        lane = self._lane(model)
+        if lane.timer is not None:
+            lane.timer.cancel()
+            lane.timer = None
+
+        while lane.queue:
+            rank, _, enqueued, estimated_tokens, future = lane.queue[0]
+            if future.done():
+                # Caller was cancelled while queued
+                heapq.heappop(lane.queue)
+                continue
+
+            now = time.monotonic()
+            reserve = self.bulk_reserve if rank == self.PRIORITIES['bulk'] else 0.0
+            wait = max(
+                lane.paused_until - now,
+                lane.requests.time_until(1 + reserve * lane.requests.capacity, now),
+                lane.tokens.time_until(estimated_tokens + reserve * lane.tokens.capacity, now)
+            )
+            if wait > 0:
+                lane.timer = asyncio.get_running_loop().call_later(wait, self._dispatch, model)
+                return
+
+            heapq.heappop(lane.queue)
+            lane.requests.consume(1)
+            lane.tokens.consume(estimated_tokens)
+            waited = now - enqueued
+            lane.stats['admitted'] += 1
+            lane.stats['total_wait'] += waited
+            lane.stats['max_wait'] = max(lane.stats['max_wait'], waited)
+            future.set_result(None)
+
+    def get_stats(self) -> dict:
+        """Queue depth per priority lane plus admission and wait-time counters per model"""
+        now = time.monotonic()
+        stats = {}
+        for model, lane in self._lanes.items():
+            depth = {name: 0 for name in self.PRIORITIES}
+            names = {rank: name for name, rank in self.PRIORITIES.items()}
+            for rank, _, _, _, future in lane.queue:
+                if not future.done():
+                    depth[names[rank]] += 1
+            admitted = lane.stats['admitted']
+            stats[model] = {
+                'queue_depth': depth,
+                'admitted': admitted,
+                'rate_limited': lane.stats['rate_limited'],
+                'avg_wait': lane.stats['total_wait'] / admitted if admitted else 0.0,
+                'max_wait': lane.stats['max_wait'],
+                'paused_for': max(0.0, lane.paused_until - now),
+                'requests_available': lane.requests.tokens,
+                'tokens_available': lane.tokens.tokens
+            }
+        return stats
+
+
+def get_retry_after(error: Exception):
+    """Seconds the provider asked us to wait for a 429 error, or None if it is not a rate limit"""
+    if getattr(error, 'status_code', None) != 429:
+        return None
+    headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+    try:
+        if headers.get('retry-after-ms'):
+            return float(headers['retry-after-ms']) / 1000.0
+        if headers.get('retry-after'):
+            return float(headers['retry-after'])
+    except ValueError:
+        pass
+    return 1.0
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate (about four characters per token) used for budgeting"""
+    return len(text) // 4 + 1
@@ -0,0 +1,128 @@
+"""
+Three-way merge for concurrent edits to the same section
+"""
+
+import re
+from typing import List, Dict, Any
+
+from services.diff_service import DocumentDiffService
+
+
+class MergeService:
+    """Rebases an edit made against an older draft onto the latest draft
+
+    Both base -> edited and base -> latest are diffed at word level and their
+    changes applied together (diff3). Where the two sides change overlapping
+    words differently, the region is a conflict: the merged text keeps one
+    side (the latest draft by default) and the conflict lists all three versions.
+    """
+
+    # Words and whitespace runs, keeping every character so texts rebuild exactly
+    TOKEN_PATTERN = re.compile(r'(\s+)')
+
+    def __init__(self, diff_service: DocumentDiffService = None):
+        self.diff_service = diff_service or DocumentDiffService()
+
+    def merge(self, base: str, edited: str, latest: str, prefer: str = 'latest') -> Dict[str, Any]:
+        """
+        Merge the changes base -> edited into latest
+
+        Args:
+            base: Draft the edit was made against
+            edited: base with the edit applied (e.g. an LLM revision)
+            latest: Current draft, possibly changed since base
+            prefer: Side kept in conflicting regions, 'latest' or 'edited'
+
+        Returns:
+            {'merged': merged text, 'conflicts': conflict records, 'clean': no conflicts}
+            Each conflict has merged_start/merged_end offsets into the merged text
+            and the base, edited and latest text of the region.
+        """
+        if prefer not in ('latest', 'edited'):
+            raise ValueError(f"Unknown merge preference '{prefer}'. Available: latest, edited")
+        if edited == base or edited == latest:
+            return {'merged': latest, 'conflicts': [], 'clean': True}
+        if latest == base:
+            return {'merged': edited, 'conflicts': [], 'clean': True}
+
+        base_tokens = self._tokenize(base)
+        edited_tokens = self._tokenize(edited)
+        latest_tokens = self._tokenize(latest)
+        edited_hunks = self._hunks(base_tokens, edited_tokens)
+        latest_hunks = self._hunks(base_tokens, latest_tokens)
+
+        parts = []
+        conflicts = []
+        position = 0
+        length = 0
+        for start, end, edited_chunk, latest_chunk in self._chunks(edited_hunks, latest_hunks):
+            unchanged = ''.join(base_tokens[position:start])
+            parts.append(unchanged)
+            length += len(unchanged)
+            position = end
+
+            edited_text = self._apply(base_tokens, edited_tokens, edited_chunk, start, end)
+            latest_text = self._apply(base_tokens, latest_tokens, latest_chunk, start, end)
+            if not latest_chunk or edited_text == latest_text:
+                text = edited_text
+            elif not edited_chunk:
+                text = latest_text
+            else:
+                text = latest_text if prefer == 'latest' else edited_text
+                conflicts.append({
+                    'merged_start': length,
+                    'merged_end': length + len(text),
+                    'base': ''.join(base_tokens[start:end]),
+                    'edited': edited_text,
+                    'latest': latest_text
+                })
+            parts.append(text)
+            length += len(text)
+
+        parts.append(''.join(base_tokens[position:]))
+        return {'merged': ''.join(parts), 'conflicts': conflicts, 'clean': not conflicts}
+
+    def _tokenize(self, text: str) -> List[str]:
+        return [token for token in self.TOKEN_PATTERN.split(text) if token]
+
+    def _hunks(self, base_tokens: List[str], side_tokens: List[str]) -> List[tuple]:
+        """(base_start, base_end, side_start, side_end) for every change from base to one side"""
+        return [
+            (base_start, base_end, side_start, side_end)
+            for tag, base_start, base_end, side_start, side_end in self.diff_service.engine.get_opcodes(base_tokens, side_tokens)
+            if tag != 'equal'
+        ]
+
+    @staticmethod
+    def _chunks(edited_hunks: List[tuple], latest_hunks: List[tuple]) -> List[list]:
+        """
+        Group the hunks of both sides into chunks of overlapping changes, in base order
+
+        Ranges overlap when they share a base token, or when both insert at the
+        same point. Changes that merely touch stay separate and merge cleanly.
+        """
+        hunks = sorted([(hunk[0], hunk[1], 0, hunk) for hunk in edited_hunks] + [(hunk[0], hunk[1], 1, hunk) for hunk in latest_hunks])
+        chunks = []
+        for start, end, side, hunk in hunks:
+            if chunks:
+                chunk = chunks[-1]
+                if start < chunk[1] or start == end == chunk[0] == chunk[1]:
+                    chunk[1] = max(chunk[1], end)
+                    chunk[2 + side].append(hunk)
+                    continue
+            chunk = [start, end, [], []]
+            chunk[2 + side].append(hunk)
+            chunks.append(chunk)
+        return chunks
+
+    @staticmethod
+    def _apply(base_tokens: List[str], side_tokens: List[str], hunks: List[tuple], start: int, end: int) -> str:
+        """Text of base[start:end] with one side's hunks applied"""
+        parts = []
+        position = start
+        for base_start, base_end, side_start, side_end in hunks:
+            parts.extend(base_tokens[position:base_start])
+            parts.extend(side_tokens[side_start:side_end])
+            position = base_end
+        parts.extend(base_tokens[position:end])
+        return ''.join(parts)
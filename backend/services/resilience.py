@@ -0,0 +1,148 @@
+"""
+Failure handling for LLM completion calls: circuit breaking, latency tracking and retry policy
+"""
+
+import asyncio
+import random
+import time
+from collections import deque
+from typing import Optional
+
+# Provider status codes worth retrying (rate limits and server-side failures)
+TRANSIENT_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+# SDK exception types raised for network failures and client-side timeouts
+TRANSIENT_ERROR_NAMES = {'APIConnectionError', 'APITimeoutError'}
+
+
+class CircuitBreaker:
+    """Per-model breaker: opens after consecutive failures, then lets one trial call through after a cool-down
+    
+    Every call let through must end in one of the record_* calls. A trial that
+    never reports back (e.g. its task was lost) stops blocking the breaker after
+    trial_timeout seconds, when the next call is let through as a new trial.
+    """
+    
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, trial_timeout: float = None):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.trial_timeout = trial_timeout if trial_timeout is not None else reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.trial_started_at = None
+        self.stats = {'opened': 0, 'rejected': 0, 'lost_trials': 0}
+    
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half_open'
+        return 'open'
+    
+    def allow_request(self) -> bool:
+        """Whether a call may proceed; in half-open state only a single trial call is allowed"""
+        state = self.state
+        if state == 'closed':
+            return True
+        if state == 'half_open':
+            now = time.monotonic()
+            if self.trial_in_flight and now - self.trial_started_at >= self.trial_timeout:
+                self.stats['lost_trials'] += 1
+                self.trial_in_flight = False
+            if not self.trial_in_flight:
+                self.trial_in_flight = True
+                self.trial_started_at = now
+                return True
+        self.stats['rejected'] += 1
+        return False
+    
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+    
+    def record_neutral(self) -> None:
+        """Outcome that says nothing about provider health (rate limits, rejected requests)"""
+        self.trial_in_flight = False
+    
+    def record_abandoned(self) -> None:
+        """Call cancelled before it answered (its deadline passed or the caller went away)
+        
+        While the breaker is open or half-open this is most likely the trial hanging
+        on a still-broken provider, so it counts as a failure and re-opens the breaker;
+        otherwise it says nothing about provider health.
+        """
+        if self.opened_at is not None:
+            self.record_failure()
+        else:
+            self.record_neutral()
+    
+    def record_failure(self) -> None:
+        self.failures += 1
+        self.trial_in_flight = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            # A failed trial re-opens the breaker for another cool-down
+            if self.opened_at is None:
+                self.stats['opened'] += 1
+            self.opened_at = time.monotonic()
+    
+    def get_stats(self) -> dict:
+        return {'state': self.state, 'consecutive_failures': self.failures, **self.stats}
+
+
+class LatencyTracker:
+    """Sliding window of successful call latencies, used to pick the hedging delay"""
+    
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.samples = deque(maxlen=window)
+        self.min_samples = min_samples
+    
+    def record(self, seconds: float) -> None:
+        self.samples.append(seconds)
+    
+    def percentile(self, fraction: float) -> Optional[float]:
+        """Latency at the given fraction (e.g. 0.95), or None until enough samples exist"""
+        if len(self.samples) < self.min_samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+    
+    def get_stats(self) -> dict:
+        return {
+            'samples': len(self.samples),
+            'p50': self.percentile(0.5),
+            'p95': self.percentile(0.95)
+        }
+
+
+def is_transient_error(error: Exception) -> bool:
+    """Whether a failed completion is worth retrying"""
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    if type(error).__name__ in TRANSIENT_ERROR_NAMES:
+        return True
+    return getattr(error, 'status_code', None) in TRANSIENT_STATUS_CODES
+
+
+def backoff_delay(attempt: int, base: float = 0.5, cap: float = 8.0) -> float:
+    """Exponential backoff with full jitter for the given retry attempt (0-based)"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+async def first_successful(tasks: list):
+    """Return the first task result that succeeds, cancelling the rest; re-raise the last failure if all fail"""
+    pending = set(tasks)
+    error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
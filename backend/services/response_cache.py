@@ -0,0 +1,231 @@
+"""
+Content-hashed cache for deterministic LLM responses with a memory LRU tier and an optional disk tier
+"""
+
+import asyncio
+import functools
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from os import getenv
+from typing import Optional
+
+
+class ResponseCache:
+    """Caches completion text keyed by a hash of the full request (model, messages, format, temperature)
+    
+    The disk tier holds at most max_disk_entries files. Once a write goes past
+    that, expired files and then the oldest ones are removed until 90% of the
+    limit remains, so pruning scans the directory only once per many writes.
+    Coroutines use get_async/set_async, which do the disk I/O on the cache's
+    own thread instead of the event loop.
+    """
+    
+    # Share of max_disk_entries kept after pruning
+    DISK_PRUNE_RATIO = 0.9
+    
+    def __init__(self, max_entries: int = 512, ttl: float = 3600.0, cache_dir: str = None, max_disk_entries: int = 10000):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.cache_dir = cache_dir
+        self.max_disk_entries = max_disk_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_lock = threading.Lock()
+        self._disk_entries = 0
+        self._disk_executor = None
+        self.stats = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'writes': 0,
+            'evictions': 0,
+            'disk_evictions': 0
+        }
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # One thread keeps disk writes in order
+            self._disk_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='llm-cache')
+            # Count what earlier runs left behind, dropping expired files
+            with self._disk_lock:
+                self._prune_disk(time.time(), self.max_disk_entries)
+    
+    @classmethod
+    def from_env(cls) -> 'ResponseCache':
+        """Build a cache from LLM_CACHE_* settings; the disk tier is only enabled when LLM_CACHE_DIR is set"""
+        return cls(
+            max_entries=int(getenv('LLM_CACHE_MAX_ENTRIES', 512)),
+            ttl=float(getenv('LLM_CACHE_TTL', 3600)),
+            cache_dir=getenv('LLM_CACHE_DIR') or None,
+            max_disk_entries=int(getenv('LLM_CACHE_MAX_DISK_ENTRIES', 10000))
+        )
+    
+    @staticmethod
+    def make_key(request: dict) -> str:
+        """Hash a completion request into a stable cache key"""
+        payload = json.dumps(request, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+    
+    def get(self, key: str) -> Optional[str]:
+        """Look up a response in memory, then on disk (promoting disk hits to memory)"""
+        now = time.time()
+        value = self._get_memory(key, now)
+        if value is None:
+            value = self._promote(key, self._read_disk(key, now))
+        return value
+    
+    async def get_async(self, key: str) -> Optional[str]:
+        """get() for coroutines: a disk lookup runs on the cache's I/O thread"""
+        now = time.time()
+        value = self._get_memory(key, now)
+        if value is None:
+            entry = await self._run_disk(self._read_disk, key, now) if self.cache_dir else None
+            value = self._promote(key, entry)
+        return value
+    
+    def set(self, key: str, value: str) -> None:
+        """Store a response in both tiers"""
+        entry = self._set_memory(key, value)
+        self._write_disk(key, entry)
+    
+    async def set_async(self, key: str, value: str) -> None:
+        """set() for coroutines: the disk write runs on the cache's I/O thread"""
+        entry = self._set_memory(key, value)
+        if self.cache_dir:
+            await self._run_disk(self._write_disk, key, entry)
+    
+    def clear(self) -> None:
+        """Drop every cached response from memory and disk"""
+        with self._lock:
+            self._entries.clear()
+        if self.cache_dir:
+            with self._disk_lock:
+                for _, path in self._disk_files():
+                    os.remove(path)
+                self._disk_entries = 0
+    
+    def get_stats(self) -> dict:
+        """Hit/miss counters plus current size and hit rate"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats['entries'] = len(self._entries)
+            stats['disk_entries'] = self._disk_entries
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['memory_hits'] + stats['disk_hits']) / lookups if lookups else 0.0
+        stats['disk_enabled'] = bool(self.cache_dir)
+        return stats
+    
+    def _get_memory(self, key: str, now: float) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                created, value = entry
+                if now - created <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self.stats['memory_hits'] += 1
+                    return value
+                del self._entries[key]
+        return None
+    
+    def _promote(self, key: str, entry: Optional[tuple]) -> Optional[str]:
+        """Count the outcome of a disk lookup, copying a hit into memory"""
+        with self._lock:
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+            self.stats['disk_hits'] += 1
+            self._store_memory(key, entry)
+        return entry[1]
+    
+    def _set_memory(self, key: str, value: str) -> tuple:
+        entry = (time.time(), value)
+        with self._lock:
+            self._store_memory(key, entry)
+            self.stats['writes'] += 1
+        return entry
+    
+    def _run_disk(self, function, *args):
+        return asyncio.get_running_loop().run_in_executor(self._disk_executor, functools.partial(function, *args))
+    
+    def _store_memory(self, key: str, entry: tuple) -> None:
+        # Caller holds the lock
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats['evictions'] += 1
+    
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+    
+    def _read_disk(self, key: str, now: float) -> Optional[tuple]:
+        if not self.cache_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as fh:
+                record = json.load(fh)
+            created, response = float(record['created']), record['response']
+        except (OSError, ValueError, KeyError, TypeError):
+            # Missing, unreadable or not a cache record: a miss
+            return None
+        if not isinstance(response, str):
+            return None
+        if now - created > self.ttl:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return created, response
+    
+    def _write_disk(self, key: str, entry: tuple) -> None:
+        if not self.cache_dir:
+            return
+        path = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write then rename so readers never see a partial file
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as fh:
+                json.dump({'created': entry[0], 'response': entry[1]}, fh)
+            with self._disk_lock:
+                is_new = not os.path.exists(path)
+                os.replace(tmp_path, path)
+                self._disk_entries += is_new
+                if self._disk_entries > self.max_disk_entries:
+                    self._prune_disk(entry[0], int(self.max_disk_entries * self.DISK_PRUNE_RATIO))
+        except OSError as e:
+            print(f"Warning: Could not write LLM response cache entry: {e}")
+    
+    def _disk_files(self) -> list:
+        """(modification time, path) of every cached response file"""
+        files = []
+        for root, _, filenames in os.walk(self.cache_dir):
+            for filename in filenames:
+                if filename.endswith('.json'):
+                    path = os.path.join(root, filename)
+                    try:
+                        files.append((os.path.getmtime(path), path))
+                    except OSError:
+                        pass
+        return files
+    
+    def _prune_disk(self, now: float, keep: int) -> None:
+        """Remove expired files, then the oldest ones until at most keep remain (caller holds the disk lock)"""
+        files = sorted(self._disk_files())
+        # Files are written once, so their modification time is their creation time
+        expired = sum(1 for modified, _ in files if now - modified > self.ttl)
+        removed = max(expired, len(files) - keep)
+        for _, path in files[:removed]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self._disk_entries = len(files) - removed
+        with self._lock:
+            self.stats['disk_evictions'] += removed
@@ -0,0 +1,133 @@
+"""
+Process-wide registry of pooled LLM clients and per-model generation services
+"""
+
+import threading
+from os import getenv
+import httpx
+from services.openai_tools import create_azure_openai_client
+from prompts.section_prompts import SectionPrompts
+from services.cpu_pool import CpuPool
+from services.diff_cache import DiffCache
+from services.diff_service import DocumentDiffService
+from services.generation_service import GenerationService, LLM_MAX_WORKERS
+from services.response_cache import ResponseCache
+from services.single_flight import SingleFlight
+from services.llm_scheduler import LLMScheduler
+
+
+class ServiceRegistry:
+    """Keeps one keep-alive LLM client and one GenerationService per model for the life of the process"""
+    
+    # Connection pool limits for the shared HTTP client (one connection per worker thread by default)
+    MAX_CONNECTIONS = int(getenv('LLM_MAX_CONNECTIONS', LLM_MAX_WORKERS))
+    MAX_KEEPALIVE_CONNECTIONS = int(getenv('LLM_MAX_KEEPALIVE_CONNECTIONS', LLM_MAX_WORKERS))
+    KEEPALIVE_EXPIRY = float(getenv('LLM_KEEPALIVE_EXPIRY', 60.0))
+    
+    _lock = threading.Lock()
+    _client = None
+    _prompts = None
+    _diff_service = None
+    _diff_cache = None
+    _cpu_pool = None
+    _response_cache = None
+    _single_flight = SingleFlight()
+    _scheduler = None
+    _services = {}
+    
+    @classmethod
+    def get_client(cls):
+        """Get the shared LLM client, creating it with a pooled HTTP transport on first use"""
+        if cls._client is None:
+            with cls._lock:
+                if cls._client is None:
+                    http_client = httpx.Client(
+                        limits=httpx.Limits(
+                            max_connections=cls.MAX_CONNECTIONS,
+                            max_keepalive_connections=cls.MAX_KEEPALIVE_CONNECTIONS,
+                            keepalive_expiry=cls.KEEPALIVE_EXPIRY
+                        )
+                    )
+                    # GenerationService owns retries, so the SDK's built-in retries are disabled
+                    cls._client = create_azure_openai_client().with_options(http_client=http_client, max_retries=0)
+        return cls._client
+    
+    @classmethod
+    def get_response_cache(cls) -> ResponseCache:
+        """Get the process-wide LLM response cache configured from the environment"""
+        if cls._response_cache is None:
+            with cls._lock:
+                if cls._response_cache is None:
+                    cls._response_cache = ResponseCache.from_env()
+        return cls._response_cache
+    
+    @classmethod
+    def get_diff_cache(cls) -> DiffCache:
+        """Get the process-wide diff result cache configured from the environment"""
+        if cls._diff_cache is None:
+            with cls._lock:
+                if cls._diff_cache is None:
+                    cls._diff_cache = DiffCache.from_env()
+        return cls._diff_cache
+    
+    @classmethod
+    def get_cpu_pool(cls) -> CpuPool:
+        """Get the process-wide worker pool for CPU-heavy diffing and formatting"""
+        if cls._cpu_pool is None:
+            with cls._lock:
+                if cls._cpu_pool is None:
+                    cls._cpu_pool = CpuPool.from_env()
+        return cls._cpu_pool
+    
+    @classmethod
+    def get_single_flight(cls) -> SingleFlight:
+        """Get the process-wide coalescer for identical in-flight completions"""
+        return cls._single_flight
+    
+    @classmethod
+    def get_scheduler(cls) -> LLMScheduler:
+        """Get the process-wide rate-limit scheduler configured from the environment"""
+        if cls._scheduler is None:
+            with cls._lock:
+                if cls._scheduler is None:
+                    cls._scheduler = LLMScheduler.from_env()
+        return cls._scheduler
+    
+    @classmethod
+    def get_generation_service(cls, model_id: str = None) -> GenerationService:
+        """Get the long-lived GenerationService for a model, building it on first request"""
+        model = model_id or GenerationService.DEFAULT_MODEL
+        service = cls._services.get(model)
+        if service is None:
+            client = cls.get_client()
+            response_cache = cls.get_response_cache()
+            scheduler = cls.get_scheduler()
+            diff_cache = cls.get_diff_cache()
+            cpu_pool = cls.get_cpu_pool()
+            with cls._lock:
+                service = cls._services.get(model)
+                if service is None:
+                    if cls._prompts is None:
+                        cls._prompts = SectionPrompts()
+                        cls._diff_service = DocumentDiffService(cache=diff_cache)
+                    service = GenerationService(
+                        model, client=client, prompts=cls._prompts,
+                        diff_service=cls._diff_service, response_cache=response_cache,
+                        single_flight=cls._single_flight, scheduler=scheduler, cpu_pool=cpu_pool
+                    )
+                    cls._services[model] = service
+        return service
+    
+    @classmethod
+    def get_service_stats(cls) -> dict:
+        """Circuit breaker, latency and retry metrics for every model service created so far"""
+        return {model: service.get_stats() for model, service in list(cls._services.items())}
+    
+    @classmethod
+    def reset(cls):
+        """Drop all cached services and close the shared client (e.g. after configuration changes)"""
+        with cls._lock:
+            if cls._client is not None:
+                cls._client.close()
+            cls._client = None
+            cls._services = {}
@@ -0,0 +1,49 @@
+"""
+Single-flight coalescing of identical in-flight async calls
+"""
+
+import asyncio
+import hashlib
+import json
+
+
+class SingleFlight:
+    """Runs one execution per key at a time; concurrent callers with the same key await and share its result"""
+    
+    def __init__(self):
+        self._calls = {}
+        self.stats = {
+            'executions': 0,
+            'coalesced': 0
+        }
+    
+    @staticmethod
+    def make_key(request: dict) -> str:
+        """Key a completion request on its exact parameters, so only byte-identical prompts share a call"""
+        payload = json.dumps(request, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+    
+    async def do(self, key: str, func):
+        """Await func() for this key, joining an identical call that is already in flight"""
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self._calls[key] = task
+            task.add_done_callback(lambda finished: self._forget(key, finished))
+            self.stats['executions'] += 1
+        else:
+            self.stats['coalesced'] += 1
+        # Shield so one caller disconnecting does not cancel the call for everyone else
+        return await asyncio.shield(task)
+    
+    def get_stats(self) -> dict:
+        stats = dict(self.stats)
+        stats['in_flight'] = len(self._calls)
+        return stats
+    
+    def _forget(self, key: str, task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Mark the exception as retrieved when every caller has gone away
+        if not task.cancelled():
+            task.exception()
@@ -0,0 +1,294 @@
+"""
+Row-aware structural diff for table sections (model limitations, model risk issues)
+"""
+
+import json
+import re
+from typing import List, Dict, Any
+
+from services.diff_service import DocumentDiffService, DiffResult
+from services.json_schema_service import JsonSchemaService
+
+
+class TableDiffService:
+    """Matches rows by key or content similarity and diffs them field by field
+
+    Reordered or inserted rows no longer show up as large removed/added text
+    blocks: every row becomes one record (unchanged, modified, added or removed,
+    plus a moved flag) and modified rows carry per-cell changes with word-level
+    diff segments for text fields.
+    """
+
+    # Minimum token Jaccard similarity for pairing rows whose keys do not match
+    SIMILARITY_THRESHOLD = 0.5
+
+    # Tokens shared by more rows than this are ignored when looking for similar rows
+    MAX_TOKEN_ROWS = 50
+
+    WORD_PATTERN = re.compile(r'\w+')
+
+    def __init__(self, diff_service: DocumentDiffService = None, similarity_threshold: float = None):
+        self.diff_service = diff_service or DocumentDiffService()
+        self.similarity_threshold = similarity_threshold if similarity_threshold is not None else self.SIMILARITY_THRESHOLD
+
+    def compute_table_diff(self, original_rows: List[dict], revised_rows: List[dict], section_type: str = None, field_order: list = None) -> Dict[str, Any]:
+        """
+        Diff two lists of table rows
+
+        Returns:
+            {'rows': row change records in display order, 'summary': row/cell counts}
+        """
+        columns = JsonSchemaService.TABLE_CONFIGS.get(section_type, {}).get('columns', [])
+        key_field = next((column['id'] for column in columns if column.get('required')), 'title')
+        text_fields = {column['id'] for column in columns if column['type'] == 'text'}
+
+        matches = self._match_by_key(original_rows, revised_rows, key_field)
+        self._match_by_similarity(original_rows, revised_rows, matches)
+        moved = self._moved_rows(matches)
+
+        records = []
+        summary = {'rows_added': 0, 'rows_removed': 0, 'rows_modified': 0, 'rows_unchanged': 0, 'rows_moved': 0, 'cells_changed': 0}
+        removed_before = sorted(set(range(len(original_rows))) - set(matches.values()), reverse=True)
+
+        for revised_index, revised_row in enumerate(revised_rows):
+            original_index = matches.get(revised_index)
+            if original_index is not None and original_index not in moved:
+                # Emit rows removed before this one so records follow both tables' order
+                while removed_before and removed_before[-1] < original_index:
+                    records.append(self._removed_record(removed_before.pop(), original_rows))
+                    summary['rows_removed'] += 1
+            if original_index is None:
+                records.append({'type': 'added', 'original_index': None, 'revised_index': revised_index, 'moved': False, 'original': None, 'revised': revised_row, 'cells': []})
+                summary['rows_added'] += 1
+                continue
+
+            cells = self._diff_cells(original_rows[original_index], revised_row, field_order, text_fields)
+            row_type = 'modified' if cells else 'unchanged'
+            records.append({
+                'type': row_type,
+                'original_index': original_index,
+                'revised_index': revised_index,
+                'moved': original_index in moved,
+                'original': original_rows[original_index],
+                'revised': revised_row,
+                'cells': cells
+            })
+            summary['rows_' + row_type] += 1
+            summary['rows_moved'] += original_index in moved
+            summary['cells_changed'] += len(cells)
+
+        while removed_before:
+            records.append(self._removed_record(removed_before.pop(), original_rows))
+            summary['rows_removed'] += 1
+
+        return {'rows': records, 'summary': summary}
+
+    def to_diff_segments(self, table_diff: Dict[str, Any], field_order: list = None) -> DiffResult:
+        """Render row records as line-level diff segments in the {"rows": [...]} JSON layout
+
+        Unchanged rows and fields stay unchanged, changed fields become a removed
+        line followed by an added line, so DiffViewer shows row-aligned changes.
+        A moved row is removed where it was and added where it now is, so both
+        texts keep their own row order.
+        """
+        parts = [('unchanged', '{\n  "rows": [\n')]
+        records = table_diff['rows']
+        last_original = max((r['original_index'] for r in records if r['original_index'] is not None), default=-1)
+        last_revised = max((r['revised_index'] for r in records if r['revised_index'] is not None), default=-1)
+        moved = sorted((r for r in records if r['moved']), key=lambda r: r['original_index'], reverse=True)
+
+        def remove_moved_before(original_index):
+            while moved and moved[-1]['original_index'] < original_index:
+                record = moved.pop()
+                parts.append(('removed', self._format_row(record['original'], field_order, record['original_index'] != last_original)))
+
+        for record in records:
+            if record['original_index'] is not None and not record['moved']:
+                remove_moved_before(record['original_index'])
+            if record['moved']:
+                parts.append(('added', self._format_row(record['revised'], field_order, record['revised_index'] != last_revised)))
+                continue
+            if record['type'] in ('added', 'removed'):
+                row = record['revised'] if record['type'] == 'added' else record['original']
+                index, last = (record['revised_index'], last_revised) if record['type'] == 'added' else (record['original_index'], last_original)
+                parts.append((record['type'], self._format_row(row, field_order, index != last)))
+                continue
+
+            original_comma = record['original_index'] != last_original
+            revised_comma = record['revised_index'] != last_revised
+            if record['type'] == 'unchanged' and original_comma == revised_comma:
+                parts.append(('unchanged', self._format_row(record['revised'], field_order, revised_comma)))
+                continue
+
+            original_lines = self._format_row(record['original'], field_order, original_comma).splitlines(keepends=True)
+            revised_lines = self._format_row(record['revised'], field_order, revised_comma).splitlines(keepends=True)
+            if len(original_lines) != len(revised_lines):
+                # Field sets differ: show the row as replaced
+                parts.append(('removed', ''.join(original_lines)))
+                parts.append(('added', ''.join(revised_lines)))
+                continue
+            for original_line, revised_line in zip(original_lines, revised_lines):
+                if original_line == revised_line:
+                    parts.append(('unchanged', original_line))
+                else:
+                    parts.append(('removed', original_line))
+                    parts.append(('added', revised_line))
+
+        remove_moved_before(last_original + 1)
+        parts.append(('unchanged', '  ]\n}'))
+        return self._build_segments(parts)
+
+    def _match_by_key(self, original_rows: List[dict], revised_rows: List[dict], key_field: str) -> Dict[int, int]:
+        """Pair rows whose key field is identical (after normalization) and unique on both sides"""
+        original_keys = self._unique_keys(original_rows, key_field)
+        revised_keys = self._unique_keys(revised_rows, key_field)
+        return {revised_keys[key]: original_keys[key] for key in revised_keys if key in original_keys}
+
+    def _unique_keys(self, rows: List[dict], key_field: str) -> Dict[str, int]:
+        keys = {}
+        duplicates = set()
+        for index, row in enumerate(rows):
+            value = row.get(key_field) if isinstance(row, dict) else None
+            if not isinstance(value, str) or not value.strip():
+                continue
+            key = ' '.join(value.casefold().split())
+            if key in keys:
+                duplicates.add(key)
+            keys[key] = index
+        return {key: index for key, index in keys.items() if key not in duplicates}
+
+    def _match_by_similarity(self, original_rows: List[dict], revised_rows: List[dict], matches: Dict[int, int]) -> None:
+        """Greedily pair the remaining rows by token Jaccard similarity above the threshold"""
+        matched_original = set(matches.values())
+        unmatched_original = [i for i in range(len(original_rows)) if i not in matched_original]
+        unmatched_revised = [j for j in range(len(revised_rows)) if j not in matches]
+        if not unmatched_original or not unmatched_revised:
+            return
+
+        original_tokens = {i: self._row_tokens(original_rows[i]) for i in unmatched_original}
+        # Inverted index so only rows sharing a reasonably rare token are compared
+        index = {}
+        for i, tokens in original_tokens.items():
+            for token in tokens:
+                index.setdefault(token, []).append(i)
+
+        candidates = []
+        for j in unmatched_revised:
+            tokens = self._row_tokens(revised_rows[j])
+            overlap = {}
+            for token in tokens:
+                rows = index.get(token, ())
+                if len(rows) <= self.MAX_TOKEN_ROWS:
+                    for i in rows:
+                        overlap[i] = overlap.get(i, 0) + 1
+            for i, shared in overlap.items():
+                similarity = shared / (len(tokens) + len(original_tokens[i]) - shared)
+                if similarity >= self.similarity_threshold:
+                    candidates.append((-similarity, abs(i - j), j, i))
+
+        candidates.sort()
+        for _, _, j, i in candidates:
+            if j not in matches and i not in matched_original:
+                matches[j] = i
+                matched_original.add(i)
+
+    def _row_tokens(self, row: dict) -> set:
+        if not isinstance(row, dict):
+            return set(self.WORD_PATTERN.findall(str(row).casefold()))
+        return set(self.WORD_PATTERN.findall(' '.join(str(value) for value in row.values()).casefold()))
+
+    @staticmethod
+    def _moved_rows(matches: Dict[int, int]) -> set:
+        """Original indices of matched rows outside the longest in-order run (i.e. rows that moved)"""
+        pairs = sorted(matches.items())
+        tails, tail_pairs = [], []
+        previous = {}
+        for revised_index, original_index in pairs:
+            low, high = 0, len(tails)
+            while low < high:
+                middle = (low + high) // 2
+                if tails[middle] < original_index:
+                    low = middle + 1
+                else:
+                    high = middle
+            previous[original_index] = tail_pairs[low - 1] if low else None
+            if low == len(tails):
+                tails.append(original_index)
+                tail_pairs.append(original_index)
+            else:
+                tails[low] = original_index
+                tail_pairs[low] = original_index
+
+        in_order = set()
+        current = tail_pairs[-1] if tail_pairs else None
+        while current is not None:
+            in_order.add(current)
+            current = previous[current]
+        return {original_index for _, original_index in pairs if original_index not in in_order}
+
+    def _diff_cells(self, original_row: dict, revised_row: dict, field_order: list, text_fields: set) -> List[Dict[str, Any]]:
+        """Cell change records for the fields that differ between two matched rows"""
+        if not isinstance(original_row, dict) or not isinstance(revised_row, dict):
+            if original_row == revised_row:
+                return []
+            return [{'field': None, 'type': 'modified', 'original': original_row, 'revised': revised_row}]
+
+        cells = []
+        for field in self._ordered_keys(original_row, revised_row, field_order):
+            in_original = field in original_row
+            in_revised = field in revised_row
+            original_value = original_row.get(field)
+            revised_value = revised_row.get(field)
+            if in_original and in_revised and original_value == revised_value:
+                continue
+            cell = {
+                'field': field,
+                'type': 'added' if not in_original else 'removed' if not in_revised else 'modified',
+                'original': original_value,
+                'revised': revised_value
+            }
+            if cell['type'] == 'modified' and isinstance(original_value, str) and isinstance(revised_value, str) and (field in text_fields or not text_fields):
+                cell['diff_segments'] = self.diff_service.compute_document_diff(original_value, revised_value).to_dicts()
+            cells.append(cell)
+        return cells
+
+    @staticmethod
+    def _ordered_keys(original_row: dict, revised_row: dict, field_order: list = None) -> list:
+        keys = [key for key in (field_order or []) if key in original_row or key in revised_row]
+        for row in (original_row, revised_row):
+            keys.extend(key for key in row if key not in keys)
+        return keys
+
+    @staticmethod
+    def _removed_record(original_index: int, original_rows: List[dict]) -> Dict[str, Any]:
+        return {'type': 'removed', 'original_index': original_index, 'revised_index': None, 'moved': False, 'original': original_rows[original_index], 'revised': None, 'cells': []}
+
+    def _format_row(self, row: dict, field_order: list, trailing_comma: bool) -> str:
+        """Format one row like _format_json_with_order does inside a {"rows": [...]} table"""
+        comma = ',' if trailing_comma else ''
+        if not isinstance(row, dict) or not row:
+            return f'    {json.dumps(row)}{comma}\n'
+        fields = ',\n'.join(f'      "{key}": {json.dumps(row[key])}' for key in self._ordered_keys(row, {}, field_order))
+        return '    {\n' + fields + '\n    }' + comma + '\n'
+
+    @staticmethod
+    def _build_segments(parts: list) -> DiffResult:
+        """Lay out (type, text) parts as original/revised texts and offset segments over them"""
+        original_parts, revised_parts = [], []
+        original_position = revised_position = 0
+        spans = []
+        for part_type, text in parts:
+            original_length = len(text) if part_type != 'added' else 0
+            revised_length = len(text) if part_type != 'removed' else 0
+            spans.append((part_type, original_position, original_position + original_length, revised_position, revised_position + revised_length))
+            if original_length:
+                original_parts.append(text)
+            if revised_length:
+                revised_parts.append(text)
+            original_position += original_length
+            revised_position += revised_length
+
+        result = DiffResult(''.join(original_parts), ''.join(revised_parts))
+        for span in spans:
+            result.add(*span)
+        return result
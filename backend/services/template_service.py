@@ -1,3 +1,4 @@
+from functools import lru_cache
 from docx import Document
 from io import BytesIO
 
@@ -68,4 +69,15 @@ def create_default_template():
     doc.save(doc_io)
     doc_io.seek(0)
     
-    return doc_io
\ No newline at end of file
+    return doc_io
+
+
+@lru_cache(maxsize=1)
+def default_template_content() -> bytes:
+    """
+    The default template as .docx bytes, built once per process
+    
+    Saving stamps the zip entries with the current time, so rebuilt bytes
+    would differ and miss DocxTemplate's parsed package cache.
+    """
+    return create_default_template().getvalue()
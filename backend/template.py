@@ -8,8 +8,12 @@ Created : 2015-03-12
 from os import PathLike
 from typing import Any, Optional, IO, Union, Dict, Set
 # from .subdoc import Subdoc
+from collections import OrderedDict
+import copy
 import functools
+import hashlib
 import io
+import threading
 from lxml import etree
 from docx import Document
 from docx.opc.oxml import parse_xml
@@ -30,6 +34,178 @@ import os
 import zipfile
 
 
+def find_all(xml, literal):
+    """Offsets of every occurrence of literal in xml"""
+    position = xml.find(literal)
+    while position != -1:
+        yield position
+        position = xml.find(literal, position + 1)
+
+
+def find_tags(xml, pattern):
+    """Offsets of every match of a jinja2 tag pattern. Patterns start with a
+    literal "{" (which lets re skip ahead quickly) and check the rest with a
+    lookahead, so overlapping tags like "{{{" are all found."""
+    return (m.start() for m in re.finditer(pattern, xml))
+
+
+def last_before(xml, prefix, endings, positions):
+    """For each of the ascending offsets, where the last xml tag starting with
+    prefix and followed by one of the endings (if given) opens before it.
+    Only the text since the previous offset is searched, so finding the tag
+    before every jinja2 tag of a document stays linear."""
+    start = -1
+    searched = 0
+    for position in positions:
+        found = xml.rfind(prefix, searched, position)
+        while found != -1 and endings and xml[found + len(prefix)] not in endings:
+            found = xml.rfind(prefix, searched, found)
+        if found != -1:
+            start = found
+        searched = position
+        if start != -1:
+            yield start
+
+
+def sub_at(pattern, repl, xml, starts):
+    """Same result as pattern.sub(repl, xml) for a pattern that can only match
+    at the given ascending offsets. The pattern is tried there only, instead
+    of at every character of the document; offsets inside an earlier match
+    are skipped like re.sub does. repl is a function of the match or a plain
+    string (group references are not expanded)."""
+    parts = []
+    end = 0
+    previous = -1
+    for start in starts:
+        if start < end or start == previous:
+            continue
+        previous = start
+        m = pattern.match(xml, start)
+        if m is None:
+            continue
+        parts.append(xml[end:start])
+        parts.append(repl(m) if callable(repl) else repl)
+        end = m.end()
+    if not parts:
+        return xml
+    parts.append(xml[end:])
+    return "".join(parts)
+
+
+def preserve_space(xml):
+    """Same result as re.sub(r"<w:t>((?:(?!<w:t>).)*)({{.*?}}|{%.*?%})",
+    r'<w:t xml:space="preserve">\1\2', xml, flags=re.DOTALL). The regex steps
+    through the text up to the next <w:t> and backtracks to the last jinja2
+    tag before it; here that tag is looked up with rfind."""
+    parts = []
+    end = 0
+    starts = last_before(xml, "<w:t>", "", find_tags(xml, r"{(?=[{%])"))
+    for start in starts:
+        if start < end:
+            continue
+        limit = xml.find("<w:t>", start + 5)
+        if limit == -1:
+            limit = len(xml)
+        # Greedy group 1 backtracks to the last {{ or {% before limit that
+        # has a closer (none can straddle limit, which holds a "<")
+        closer = -1
+        while limit > start + 5:
+            opener = max(
+                xml.rfind("{{", start + 5, limit), xml.rfind("{%", start + 5, limit)
+            )
+            if opener == -1:
+                break
+            closer = xml.find("}}" if xml[opener + 1] == "{" else "%}", opener + 2)
+            if closer != -1:
+                break
+            limit = opener + 1
+        if closer == -1:
+            continue
+        parts.append(xml[end:start])
+        parts.append('<w:t xml:space="preserve">' + xml[start + 5: closer + 2])
+        end = closer + 2
+    if not parts:
+        return xml
+    parts.append(xml[end:])
+    return "".join(parts)
+
+
+class CompiledPartCache(object):
+    """LRU cache of patched XML and compiled jinja2 templates for docx parts
+
+    Keys are content hashes of a part's source XML, so every DocxTemplate
+    loaded from the same template file shares the entries of its body,
+    headers and footers, whichever upload or default template it came from.
+    """
+
+    def __init__(self, maxsize: int = 64) -> None:
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry
+
+    def set(self, key, entry) -> None:
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+            stats["entries"] = len(self._entries)
+        stats["maxsize"] = self.maxsize
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+class PackageSnapshotCache(CompiledPartCache):
+    """LRU cache of parsed template packages
+
+    Opening a template inflates its zip and parses every part. Instead, the
+    opened Document is kept per content hash of the template file and each
+    load returns a deep copy of it: lxml copies the element trees without
+    parsing, and the blobs of media and other unparsed parts are immutable
+    bytes shared by all copies. Snapshots themselves are never handed out,
+    so renders cannot alter them.
+    """
+
+    def __init__(self, maxsize: int = 16) -> None:
+        super().__init__(maxsize)
+
+    def load(self, template_file: Union[IO[bytes], str, PathLike]):
+        """A Document of its own for template_file, a path or a binary file"""
+        if hasattr(template_file, "read"):
+            template_file.seek(0)
+            content = template_file.read()
+        else:
+            with open(template_file, "rb") as fh:
+                content = fh.read()
+        key = hashlib.blake2b(content, digest_size=16).digest()
+        snapshot = self.get(key)
+        if snapshot is None:
+            snapshot = Document(io.BytesIO(content))
+            self.set(key, snapshot)
+        return copy.deepcopy(snapshot)
+
+
 class DocxTemplate(object):
     """Class for managing docx files as they were jinja2 templates"""
 
@@ -40,6 +216,29 @@ class DocxTemplate(object):
         "http://schemas.openxmlformats.org/officeDocument/2006/relationships/footer"
     )
 
+    # Shared by all instances: a new DocxTemplate is built for every export
+    compiled_parts = CompiledPartCache()
+    packages = PackageSnapshotCache()
+
+    # Environment for render(autoescape=True) without a jinja_env. Compiled
+    # parts are keyed on the environment, so a fresh one per render would
+    # never hit the cache.
+    _autoescape_env = None
+    _autoescape_env_lock = threading.Lock()
+
+    # Characters in rendered values that resolve_listing turns into markup
+    LISTING_CHARACTERS = "\t\a\n\f"
+
+    # Tables fix_tables leaves as they are: no cell spans several columns and
+    # the widest row has as many cells as the grid has columns. That is most
+    # tables without {%tc %} loops, colspan or hm.
+    FIXED_TABLE = etree.XPath(
+        "not(.//w:gridSpan) and w:tblGrid"
+        " and not(.//w:tr[count(w:tc) > $columns])"
+        " and boolean(.//w:tr[count(w:tc) = $columns])",
+        namespaces=docx.oxml.ns.nsmap,
+    )
+
     def __init__(self, template_file: Union[IO[bytes], str, PathLike]) -> None:
         self.template_file = template_file
         self.reset_replacements()
@@ -50,7 +249,7 @@ class DocxTemplate(object):
 
     def init_docx(self, reload: bool = True):
         if not self.docx or (self.is_rendered and reload):
-            self.docx = Document(self.template_file)
+            self.docx = self.packages.load(self.template_file)
             self.is_rendered = False
 
     def render_init(self):
@@ -84,12 +283,25 @@ class DocxTemplate(object):
         strip all unnecessary xml tags, manage table cell background color and colspan,
         unescape html entities, etc..."""
 
+        # Every pattern below starts at, or at the xml tag right before, a
+        # jinja2 tag it is about. Those offsets are found with substring
+        # searches and each pattern is only tried there (see sub_at), so the
+        # output is the same as re.sub over the whole document. This is not a
+        # single scan: each of the ~20 passes still searches the whole
+        # document for its tag (a fast literal search), but the patterns,
+        # several of which backtrack, no longer run at every character.
+        # tests/test_template_patch.py checks the output against the regex
+        # cascade these passes replace.
+
         # replace {<something>{ by {{   ( works with {{ }} {% and %} {# and #})
-        src_xml = re.sub(
-            r"(?<={)(<[^>]*>)+(?=[\{%\#])|(?<=[%\}\#])(<[^>]*>)+(?=\})",
+        src_xml = sub_at(
+            re.compile(
+                r"(?<={)(<[^>]*>)+(?=[\{%\#])|(?<=[%\}\#])(<[^>]*>)+(?=\})",
+                re.DOTALL,
+            ),
             "",
             src_xml,
-            flags=re.DOTALL,
+            (m.start() + 1 for m in re.finditer(r"[{%}#]<", src_xml)),
         )
 
         # replace {{<some tags>jinja2 stuff<some other tags>}} by {{jinja2 stuff}}
@@ -100,11 +312,11 @@ class DocxTemplate(object):
                 "</w:t>.*?(<w:t>|<w:t [^>]*>)", "", m.group(0), flags=re.DOTALL
             )
 
-        src_xml = re.sub(
-            r"{%(?:(?!%}).)*|{#(?:(?!#}).)*|{{(?:(?!}}).)*",
+        src_xml = sub_at(
+            re.compile(r"{%(?:(?!%}).)*|{#(?:(?!#}).)*|{{(?:(?!}}).)*", re.DOTALL),
             striptags,
             src_xml,
-            flags=re.DOTALL,
+            find_tags(src_xml, r"{(?=[%#{])"),
         )
 
         # manage table cell colspan
@@ -123,11 +335,16 @@ class DocxTemplate(object):
                 cell_xml,
             )
 
-        src_xml = re.sub(
-            r"(<w:tc[ >](?:(?!<w:tc[ >]).)*){%\s*colspan\s+([^%]*)\s*%}(.*?</w:tc>)",
+        src_xml = sub_at(
+            re.compile(
+                r"(<w:tc[ >](?:(?!<w:tc[ >]).)*){%\s*colspan\s+([^%]*)\s*%}(.*?</w:tc>)",
+                re.DOTALL,
+            ),
             colspan,
             src_xml,
-            flags=re.DOTALL,
+            last_before(
+                src_xml, "<w:tc", " >", find_tags(src_xml, r"{(?=%\s*colspan\s)")
+            ),
         )
 
         # manage table cell background color
@@ -146,32 +363,42 @@ class DocxTemplate(object):
                 cell_xml,
             )
 
-        src_xml = re.sub(
-            r"(<w:tc[ >](?:(?!<w:tc[ >]).)*){%\s*cellbg\s+([^%]*)\s*%}(.*?</w:tc>)",
+        src_xml = sub_at(
+            re.compile(
+                r"(<w:tc[ >](?:(?!<w:tc[ >]).)*){%\s*cellbg\s+([^%]*)\s*%}(.*?</w:tc>)",
+                re.DOTALL,
+            ),
             cellbg,
             src_xml,
-            flags=re.DOTALL,
+            last_before(
+                src_xml, "<w:tc", " >", find_tags(src_xml, r"{(?=%\s*cellbg\s)")
+            ),
         )
 
         # ensure space preservation
-        src_xml = re.sub(
-            r"<w:t>((?:(?!<w:t>).)*)({{.*?}}|{%.*?%})",
-            r'<w:t xml:space="preserve">\1\2',
+        src_xml = preserve_space(src_xml)
+        src_xml = sub_at(
+            re.compile(r"({{r\s.*?}}|{%r\s.*?%})", re.DOTALL),
+            lambda m: '</w:t></w:r><w:r><w:t xml:space="preserve">'
+            + m.group(1)
+            + '</w:t></w:r><w:r><w:t xml:space="preserve">',
             src_xml,
-            flags=re.DOTALL,
-        )
-        src_xml = re.sub(
-            r"({{r\s.*?}}|{%r\s.*?%})",
-            r'</w:t></w:r><w:r><w:t xml:space="preserve">\1</w:t></w:r><w:r><w:t xml:space="preserve">',
-            src_xml,
-            flags=re.DOTALL,
+            find_tags(src_xml, r"{(?=[{%]r\s)"),
         )
 
         # {%- will merge with previous paragraph text
-        src_xml = re.sub(r"</w:t>(?:(?!</w:t>).)*?{%-", "{%", src_xml, flags=re.DOTALL)
+        src_xml = sub_at(
+            re.compile(r"</w:t>(?:(?!</w:t>).)*?{%-", re.DOTALL),
+            "{%",
+            src_xml,
+            last_before(src_xml, "</w:t>", "", find_all(src_xml, "{%-")),
+        )
         # -%} will merge with next paragraph text
-        src_xml = re.sub(
-            r"-%}(?:(?!<w:t[ >]|{%|{{).)*?<w:t[^>]*?>", "%}", src_xml, flags=re.DOTALL
+        src_xml = sub_at(
+            re.compile(r"-%}(?:(?!<w:t[ >]|{%|{{).)*?<w:t[^>]*?>", re.DOTALL),
+            "%}",
+            src_xml,
+            find_all(src_xml, "-%}"),
         )
 
         for y in ["tr", "tc", "p", "r"]:
@@ -183,7 +410,17 @@ class DocxTemplate(object):
                 r"<w:%(y)s[ >](?:(?!<w:%(y)s[ >]).)*({%%|{{)%(y)s ([^}%%]*(?:%%}|}})).*?</w:%(y)s>"
                 % {"y": y}
             )
-            src_xml = re.sub(pat, r"\1 \2", src_xml, flags=re.DOTALL)
+            src_xml = sub_at(
+                re.compile(pat, re.DOTALL),
+                lambda m: m.group(1) + " " + m.group(2),
+                src_xml,
+                last_before(
+                    src_xml,
+                    "<w:%s" % y,
+                    " >",
+                    find_tags(src_xml, r"{(?=[%%{]%s )" % y),
+                ),
+            )
 
         for y in ["tr", "tc", "p"]:
             # same thing, but for {#y xxx #} (but not where y == 'r', since that
@@ -192,7 +429,17 @@ class DocxTemplate(object):
                 r"<w:%(y)s[ >](?:(?!<w:%(y)s[ >]).)*({#)%(y)s ([^}#]*(?:#})).*?</w:%(y)s>"
                 % {"y": y}
             )
-            src_xml = re.sub(pat, r"\1 \2", src_xml, flags=re.DOTALL)
+            src_xml = sub_at(
+                re.compile(pat, re.DOTALL),
+                lambda m: m.group(1) + " " + m.group(2),
+                src_xml,
+                last_before(
+                    src_xml,
+                    "<w:%s" % y,
+                    " >",
+                    find_all(src_xml, "{#%s " % y),
+                ),
+            )
 
         # add vMerge
         # use {% vm %} to make this table cell and its copies
@@ -217,11 +464,15 @@ class DocxTemplate(object):
                 flags=re.DOTALL,
             )
 
-        src_xml = re.sub(
-            r"<w:tc[ >](?:(?!<w:tc[ >]).)*?{%\s*vm\s*%}.*?</w:tc[ >]",
+        src_xml = sub_at(
+            re.compile(
+                r"<w:tc[ >](?:(?!<w:tc[ >]).)*?{%\s*vm\s*%}.*?</w:tc[ >]", re.DOTALL
+            ),
             v_merge_tc,
             src_xml,
-            flags=re.DOTALL,
+            last_before(
+                src_xml, "<w:tc", " >", find_tags(src_xml, r"{(?=%\s*vm\s*%})")
+            ),
         )
 
         # Use ``{% hm %}`` to make table cell become horizontally merged within
@@ -276,11 +527,15 @@ class DocxTemplate(object):
             # Discard every other cell generated in loop.
             return "{% if loop.first %}" + xml + "{% endif %}"
 
-        src_xml = re.sub(
-            r"<w:tc[ >](?:(?!<w:tc[ >]).)*?{%\s*hm\s*%}.*?</w:tc[ >]",
+        src_xml = sub_at(
+            re.compile(
+                r"<w:tc[ >](?:(?!<w:tc[ >]).)*?{%\s*hm\s*%}.*?</w:tc[ >]", re.DOTALL
+            ),
             h_merge_tc,
             src_xml,
-            flags=re.DOTALL,
+            last_before(
+                src_xml, "<w:tc", " >", find_tags(src_xml, r"{(?=%\s*hm\s*%})")
+            ),
         )
 
         def clean_tags(m):
@@ -299,23 +554,69 @@ class DocxTemplate(object):
 
         return src_xml
 
-    def render_xml_part(self, src_xml, part, context, jinja_env=None):
+    def compile_xml_part(self, src_xml, jinja_env=None):
+        """Compile patched xml into a jinja2 template.
+        Returns the xml the template was compiled from and the template."""
         src_xml = re.sub(r"<w:p([ >])", r"\n<w:p\1", src_xml)
         try:
-            self.current_rendering_part = part
             if jinja_env:
                 template = jinja_env.from_string(src_xml)
             else:
                 template = Template(src_xml)
-            dst_xml = template.render(context)
         except TemplateError as exc:
-            if hasattr(exc, "lineno") and exc.lineno is not None:
-                line_number = max(exc.lineno - 4, 0)
-                exc.docx_context = map(
-                    lambda x: re.sub(r"<[^>]+>", "", x),
-                    src_xml.splitlines()[line_number: (line_number + 7)],  # fmt: skip
-                )
+            self.add_docx_context(exc, src_xml)
+            raise exc
+        return src_xml, template
+
+    def get_compiled_part(self, xml, jinja_env=None):
+        """Patch and compile the raw xml of a part, reusing the result of an
+        earlier render of the same xml (see CompiledPartCache)"""
+        # Compiled code depends on the environment (filters, autoescape), so
+        # it is part of the key; cached templates keep their environment
+        # alive, which keeps its id unique while the entry exists
+        key = (
+            hashlib.blake2b(xml.encode("utf-8"), digest_size=16).digest(),
+            id(jinja_env) if jinja_env else None,
+            jinja_env.autoescape if jinja_env else False,
+        )
+        compiled = self.compiled_parts.get(key)
+        if compiled is None:
+            compiled = self.compile_xml_part(self.patch_xml(xml), jinja_env)
+            self.compiled_parts.set(key, compiled)
+        return compiled
+
+    @classmethod
+    def get_autoescape_env(cls) -> Environment:
+        """The shared default environment of autoescaped renders"""
+        with cls._autoescape_env_lock:
+            if cls._autoescape_env is None:
+                cls._autoescape_env = Environment(autoescape=True)
+            return cls._autoescape_env
+
+    def add_docx_context(self, exc, src_xml):
+        if hasattr(exc, "lineno") and exc.lineno is not None:
+            line_number = max(exc.lineno - 4, 0)
+            exc.docx_context = map(
+                lambda x: re.sub(r"<[^>]+>", "", x),
+                src_xml.splitlines()[line_number: (line_number + 7)],  # fmt: skip
+            )
+
+    def render_xml_part(self, src_xml, part, context, jinja_env=None):
+        src_xml, template = self.compile_xml_part(src_xml, jinja_env)
+        return self.render_compiled_part(src_xml, template, part, context)
+
+    def render_compiled_part(self, src_xml, template, part, context):
+        dst_xml = self.render_template_part(src_xml, template, part, context)
+        dst_xml = self.resolve_listing(dst_xml)
+        return dst_xml
 
+    def render_template_part(self, src_xml, template, part, context):
+        """Render a compiled part, leaving listing characters unresolved"""
+        try:
+            self.current_rendering_part = part
+            dst_xml = template.render(context)
+        except TemplateError as exc:
+            self.add_docx_context(exc, src_xml)
             raise exc
         dst_xml = re.sub(r"\n<w:p([ >])", r"<w:p\1", dst_xml)
         dst_xml = (
@@ -324,7 +625,6 @@ class DocxTemplate(object):
             .replace("{_%", "{%")
             .replace("%_}", "%}")
         )
-        dst_xml = self.resolve_listing(dst_xml)
         return dst_xml
 
     def render_properties(
@@ -366,76 +666,226 @@ class DocxTemplate(object):
                     "application/vnd.openxmlformats-officedocument"
                     ".wordprocessingml.footnotes+xml"
                 ):
-                    xml = self.patch_xml(
+                    src_xml, template = self.get_compiled_part(
                         part.blob.decode("utf-8")
                         if isinstance(part.blob, bytes)
-                        else part.blob
+                        else part.blob,
+                        jinja_env,
                     )
-                    xml = self.render_xml_part(xml, part, context, jinja_env)
+                    xml = self.render_compiled_part(src_xml, template, part, context)
                     part._blob = xml.encode("utf-8")
 
     def resolve_listing(self, xml):
-
-        def resolve_text(run_properties, paragraph_properties, m):
-            xml = m.group(0).replace(
-                "\t",
-                "</w:t></w:r>"
-                "<w:r>%s<w:tab/></w:r>"
-                '<w:r>%s<w:t xml:space="preserve">' % (run_properties, run_properties),
-            )
-            xml = xml.replace(
-                "\a",
-                "</w:t></w:r></w:p>"
-                '<w:p>%s<w:r>%s<w:t xml:space="preserve">'
-                % (paragraph_properties, run_properties),
-            )
-            xml = xml.replace("\n", '</w:t><w:br/><w:t xml:space="preserve">')
-            xml = xml.replace(
-                "\f",
-                "</w:t></w:r></w:p>"
-                '<w:p><w:r><w:br w:type="page"/></w:r></w:p>'
-                '<w:p>%s<w:r>%s<w:t xml:space="preserve">'
-                % (paragraph_properties, run_properties),
-            )
+        # Rendered values may contain \t, \a, \n and \f, which become tabs,
+        # new paragraphs, line breaks and page breaks. Most parts contain
+        # none of them and are returned untouched; otherwise only the
+        # paragraphs holding them are parsed and rewritten.
+        if not any(char in xml for char in self.LISTING_CHARACTERS):
+            return xml
+        search = re.compile("[%s]" % self.LISTING_CHARACTERS).search
+        spans = []
+        end = 0
+        m = search(xml)
+        while m is not None:
+            position = m.start()
+            start = xml.rfind("<w:p", end, position)
+            while start != -1 and xml[start + 4] not in " >":
+                start = xml.rfind("<w:p", end, start)
+            stop = xml.find("</w:p>", start) if start != -1 else -1
+            if stop < position:
+                # not inside a paragraph: left as is
+                m = search(xml, position + 1)
+                continue
+            end = stop + len("</w:p>")
+            spans.append((start, end))
+            m = search(xml, end)
+        if not spans:
             return xml
 
-        def resolve_run(paragraph_properties, m):
-            run_properties = re.search(r"<w:rPr>.*?</w:rPr>", m.group(0))
-            run_properties = run_properties.group(0) if run_properties else ""
-            return re.sub(
-                r"<w:t(?: [^>]*)?>.*?</w:t>",
-                lambda x: resolve_text(run_properties, paragraph_properties, x),
-                m.group(0),
-                flags=re.DOTALL,
-            )
-
-        def resolve_paragraph(m):
-            paragraph_properties = re.search(r"<w:pPr>.*?</w:pPr>", m.group(0))
-            paragraph_properties = (
-                paragraph_properties.group(0) if paragraph_properties else ""
-            )
-            return re.sub(
-                r"<w:r(?: [^>]*)?>.*?</w:r>",
-                lambda x: resolve_run(paragraph_properties, x),
-                m.group(0),
-                flags=re.DOTALL,
-            )
-
-        xml = re.sub(
-            r"<w:p(?: [^>]*)?>.*?</w:p>", resolve_paragraph, xml, flags=re.DOTALL
+        # paragraphs are parsed together inside the part's root tag, which
+        # declares the namespaces they use
+        root = re.search(r"<([^?!/\s>]+)[^>]*>", xml)
+        fragments = self.resolve_paragraphs(
+            [xml[start:stop] for start, stop in spans],
+            root.group(0),
+            "</%s>" % root.group(1),
+        )
+        parts = []
+        end = 0
+        for (start, stop), fragment in zip(spans, fragments):
+            parts.append(xml[end:start])
+            parts.append(fragment)
+            end = stop
+        parts.append(xml[end:])
+        return "".join(parts)
+
+    def resolve_paragraphs(self, fragments, root_start, root_end):
+        xml = "".join("<w:listing>%s</w:listing>" % fragment for fragment in fragments)
+        xml, listing = self.listing_stand_ins(xml)
+        parser = etree.XMLParser(recover=True)
+        tree = etree.fromstring(
+            (root_start + xml + root_end).encode("utf-8"), parser=parser
         )
+        self.resolve_listing_tree(tree, listing)
+        fragments = []
+        for wrapper in tree:
+            xml = self.xml_to_string(wrapper)
+            xml = xml[xml.index(">") + 1: xml.rindex("<")]
+            # characters outside of w:t text are kept as they were
+            for stand_in, char in listing.items():
+                xml = xml.replace(stand_in, char)
+            fragments.append(xml)
+        return fragments
+
+    def listing_stand_ins(self, xml):
+        """\a and \f are not allowed in XML: they get through the parser as
+        private use characters that do not otherwise occur in the xml.
+        Returns the xml to parse and the listing characters by stand-in."""
+        listing = {"\t": "\t", "\n": "\n"}
+        for char in "\a\f":
+            if char in xml:
+                stand_in = next(
+                    chr(code) for code in range(0xE000, 0xF900) if chr(code) not in xml
+                )
+                xml = xml.replace(char, stand_in)
+                listing[stand_in] = char
+        return xml, listing
+
+    def parse_rendered_xml(self, xml, parse=None):
+        """Parse a rendered part and resolve its listing characters on the
+        tree, rather than in the string before parsing (see resolve_listing).
+        parse defaults to lxml's recovering parser."""
+        if parse is None:
+            parse = functools.partial(
+                etree.fromstring, parser=etree.XMLParser(recover=True)
+            )
+        if not any(char in xml for char in self.LISTING_CHARACTERS):
+            return parse(xml)
+        xml, listing = self.listing_stand_ins(xml)
+        tree = parse(xml)
+        self.resolve_listing_tree(tree, listing)
+        # stand-ins left outside of w:t text go the way the recovering parser
+        # takes \a and \f: dropped from text, replaced in attribute values
+        # (etree.XPath works on python-docx elements, whose xpath() takes
+        # no variables)
+        for stand_in, char in listing.items():
+            if stand_in == char:
+                continue
+            for text in etree.XPath("//text()[contains(., $c)]")(tree, c=stand_in):
+                parent = text.getparent()
+                if text.is_tail:
+                    parent.tail = parent.tail.replace(stand_in, "")
+                else:
+                    parent.text = parent.text.replace(stand_in, "")
+            for value in etree.XPath("//@*[contains(., $c)]")(tree, c=stand_in):
+                value.getparent().set(
+                    value.attrname, value.replace(stand_in, "\ufffd")
+                )
+        return tree
 
-        return xml
+    def resolve_listing_tree(self, tree, listing):
+        ns = "{%s}" % docx.oxml.ns.nsmap["w"]
+        # only the w:t nodes holding one of the characters are rewritten; the
+        # xpath finds them without walking every node in python
+        chars = {"c%d" % index: char for index, char in enumerate(listing)}
+        text_nodes = etree.XPath(
+            "//w:t[%s]" % " or ".join("contains(., $%s)" % name for name in chars),
+            namespaces=docx.oxml.ns.nsmap,
+        )(tree, **chars)
+        for text_node in text_nodes:
+            run = text_node.getparent()
+            if run is None or run.tag != ns + "r":
+                continue
+            paragraph = next(run.iterancestors(ns + "p"), None)
+            if paragraph is None:
+                continue
+            self.resolve_text_node(ns, listing, text_node, run, paragraph)
+
+    def resolve_text_node(self, ns, listing, text_node, run, paragraph):
+        run_properties = run.find(ns + "rPr")
+        paragraph_properties = paragraph.find(ns + "pPr")
+
+        def empty_copy(element):
+            # new runs and paragraphs only keep the properties of the ones
+            # being resolved; other containers (hyperlinks...) keep attributes
+            if element.tag == ns + "r":
+                properties = run_properties
+            elif element.tag == ns + "p":
+                properties = paragraph_properties
+            else:
+                return element.makeelement(element.tag, element.attrib)
+            new_element = element.makeelement(element.tag, {})
+            if properties is not None:
+                new_element.append(copy.deepcopy(properties))
+            return new_element
+
+        pieces = re.split("([%s])" % "".join(listing), text_node.text)
+        text_node.text = pieces[0] or None
+        for char, text in zip(pieces[1::2], pieces[2::2]):
+            char = listing[char]
+            next_node = text_node.makeelement(ns + "t", {})
+            next_node.set("{http://www.w3.org/XML/1998/namespace}space", "preserve")
+            next_node.text = text or None
+            if char == "\n":
+                line_break = text_node.makeelement(ns + "br", {})
+                text_node.addnext(line_break)
+                line_break.addnext(next_node)
+            elif char == "\t":
+                # the run ends; a run holding a tab, then one with the rest follow
+                run = self.split_after(text_node, next_node, run, empty_copy)
+                tab_run = empty_copy(run)
+                etree.SubElement(tab_run, ns + "tab")
+                run.addprevious(tab_run)
+            else:
+                # the paragraph ends and a new one holds the rest; a page
+                # break gets a paragraph of its own in between
+                paragraph = self.split_after(text_node, next_node, paragraph, empty_copy)
+                run = next_node.getparent()
+                if char == "\f":
+                    page_break = paragraph.makeelement(ns + "p", {})
+                    etree.SubElement(
+                        etree.SubElement(page_break, ns + "r"),
+                        ns + "br",
+                        {ns + "type": "page"},
+                    )
+                    paragraph.addprevious(page_break)
+            text_node = next_node
+
+    def split_after(self, node, next_node, top, empty_copy):
+        """Insert next_node after node, then split each ancestor of node up to
+        top: next_node and everything after it move into an empty copy of the
+        ancestor placed right after it. Returns the copy of top."""
+        node.addnext(next_node)
+        parent = node.getparent()
+        while True:
+            parent_copy = empty_copy(parent)
+            parent_copy.extend([next_node] + list(next_node.itersiblings()))
+            parent.addnext(parent_copy)
+            if parent is top:
+                return parent_copy
+            next_node, parent = parent_copy, parent.getparent()
 
     def build_xml(self, context, jinja_env=None):
         xml = self.get_xml()
-        xml = self.patch_xml(xml)
-        xml = self.render_xml_part(xml, self.docx._part, context, jinja_env)
+        src_xml, template = self.get_compiled_part(xml, jinja_env)
+        xml = self.render_compiled_part(src_xml, template, self.docx._part, context)
         return xml
 
+    def build_tree(self, context, jinja_env=None):
+        """Render the body and parse it once: listing characters are resolved
+        on the parsed tree, which fix_tables then works on"""
+        xml = self.get_xml()
+        src_xml, template = self.get_compiled_part(xml, jinja_env)
+        xml = self.render_template_part(src_xml, template, self.docx._part, context)
+        return self.parse_rendered_xml(xml)
+
     def map_tree(self, tree):
         root = self.docx._element
         body = root.body
+        # lxml fixes the namespaces of a detached element node by node, in
+        # time quadratic in its size: emptied first, the old body is freed
+        # child by child instead
+        body.clear()
         root.replace(body, tree)
 
     def get_headers_footers(self, uri):
@@ -444,6 +894,10 @@ class DocxTemplate(object):
                 yield relKey, val.target_part
 
     def get_part_xml(self, part):
+        # header and footer parts are already parsed: serializing their
+        # element directly saves a serialize and parse of the blob
+        if isinstance(part, XmlPart):
+            return self.xml_to_string(part.element)
         return self.xml_to_string(parse_xml(part.blob))
 
     def get_headers_footers_encoding(self, xml):
@@ -456,13 +910,25 @@ class DocxTemplate(object):
         for relKey, part in self.get_headers_footers(uri):
             xml = self.get_part_xml(part)
             encoding = self.get_headers_footers_encoding(xml)
-            xml = self.patch_xml(xml)
-            xml = self.render_xml_part(xml, part, context, jinja_env)
+            src_xml, template = self.get_compiled_part(xml, jinja_env)
+            xml = self.render_compiled_part(src_xml, template, part, context)
             yield relKey, xml.encode(encoding)
 
+    def build_headers_footers_trees(self, context, uri, jinja_env=None):
+        """Like build_headers_footers_xml, but yields the parsed parts, which
+        map_headers_footers_tree uses as they are"""
+        for relKey, part in self.get_headers_footers(uri):
+            xml = self.get_part_xml(part)
+            src_xml, template = self.get_compiled_part(xml, jinja_env)
+            xml = self.render_template_part(src_xml, template, part, context)
+            yield relKey, self.parse_rendered_xml(xml, docx.oxml.parse_xml)
+
     def map_headers_footers_xml(self, relKey, xml):
+        self.map_headers_footers_tree(relKey, docx.oxml.parse_xml(xml))
+
+    def map_headers_footers_tree(self, relKey, tree):
         part = self.docx._part.rels[relKey].target_part
-        new_part = XmlPart.load(part.partname, part.content_type, xml, part.package)
+        new_part = XmlPart(part.partname, part.content_type, tree, part.package)
         for rId, rel in part.rels.items():
             new_part.load_rel(rel.reltype, rel._target, rel.rId, rel.is_external)
         self.docx._part.rels[relKey]._target = new_part
@@ -478,15 +944,15 @@ class DocxTemplate(object):
 
         if autoescape:
             if not jinja_env:
-                jinja_env = Environment(autoescape=autoescape)
+                jinja_env = self.get_autoescape_env()
             else:
                 jinja_env.autoescape = autoescape
 
-        # Body
-        xml_src = self.build_xml(context, jinja_env)
+        # Body: serialized once for jinja2 and parsed once afterwards
+        tree = self.build_tree(context, jinja_env)
 
         # fix tables if needed
-        tree = self.fix_tables(xml_src)
+        tree = self.fix_tables(tree)
 
         # fix docPr ID's
         self.fix_docpr_ids(tree)
@@ -495,14 +961,18 @@ class DocxTemplate(object):
         self.map_tree(tree)
 
         # Headers
-        headers = self.build_headers_footers_xml(context, self.HEADER_URI, jinja_env)
-        for relKey, xml in headers:
-            self.map_headers_footers_xml(relKey, xml)
+        headers = self.build_headers_footers_trees(
+            context, self.HEADER_URI, jinja_env
+        )
+        for relKey, tree in headers:
+            self.map_headers_footers_tree(relKey, tree)
 
         # Footers
-        footers = self.build_headers_footers_xml(context, self.FOOTER_URI, jinja_env)
-        for relKey, xml in footers:
-            self.map_headers_footers_xml(relKey, xml)
+        footers = self.build_headers_footers_trees(
+            context, self.FOOTER_URI, jinja_env
+        )
+        for relKey, tree in footers:
+            self.map_headers_footers_tree(relKey, tree)
 
         self.render_properties(context, jinja_env)
 
@@ -514,12 +984,20 @@ class DocxTemplate(object):
     # using of TC tag in for cycle can cause that count of columns does not
     # correspond to real count of columns in row. This function is able to fix it.
     def fix_tables(self, xml):
-        parser = etree.XMLParser(recover=True)
-        tree = etree.fromstring(xml, parser=parser)
+        # accepts the rendered xml or, from render(), its parsed tree
+        if isinstance(xml, str):
+            parser = etree.XMLParser(recover=True)
+            tree = etree.fromstring(xml, parser=parser)
+        else:
+            tree = xml
         # get namespace
         ns = "{" + tree.nsmap["w"] + "}"
         # walk trough xml and find table
         for t in tree.iter(ns + "tbl"):
+            if self.FIXED_TABLE(
+                t, columns=len(t.findall("%stblGrid/%sgridCol" % (ns, ns)))
+            ):
+                continue
             tblGrid = t.find(ns + "tblGrid")
             columns = tblGrid.findall(ns + "gridCol")
             to_add = 0
@@ -892,7 +1370,7 @@ class DocxTemplate(object):
         context: Optional[Dict[str, Any]] = None,
     ) -> Set[str]:
         # Create a temporary document to analyze the template without affecting the current state
-        temp_doc = Document(self.template_file)
+        temp_doc = self.packages.load(self.template_file)
 
         # Get XML from the temporary document
         xml = self.xml_to_string(temp_doc._element.body)
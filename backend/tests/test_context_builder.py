@@ -0,0 +1,86 @@
+import pytest
+
+from services.context_builder import ContextBuilder
+
+
+@pytest.fixture
+def builder():
+    """Builder using the length-based token estimate so windows are predictable"""
+    builder = ContextBuilder(window_tokens=100)
+    builder.encoding = None
+    return builder
+
+
+def long_draft():
+    paragraphs = []
+    for number in range(1, 21):
+        paragraphs.append(f"## Heading {number}")
+        paragraphs.append(' '.join(f"word{number}x{index}" for index in range(30)))
+    return '\n'.join(paragraphs)
+
+
+def test_short_draft_is_returned_unchanged(builder):
+    draft = 'A short draft.'
+    assert builder.build_selection_context(draft, 2, 7) == (draft, False)
+
+
+def test_missing_offsets_return_full_draft(builder):
+    draft = long_draft()
+    assert builder.build_selection_context(draft, None, None) == (draft, False)
+
+
+def test_window_keeps_selection_and_stays_within_budget(builder):
+    draft = long_draft()
+    selected = 'word10x10 word10x11 word10x12'
+    start = draft.index(selected)
+    end = start + len(selected)
+
+    context, trimmed = builder.build_selection_context(draft, start, end)
+
+    assert trimmed
+    assert selected in context
+    assert '[... earlier text omitted ...]' in context
+    assert '[... later text omitted ...]' in context
+    window = context.split('[... earlier text omitted ...]\n')[1].split('\n[... later text omitted ...]')[0]
+    assert window in draft
+    assert builder.count_tokens(window) <= builder.window_tokens
+    # Snapped to word boundaries on both sides
+    window_start = draft.index(window)
+    assert draft[window_start - 1] in ' \n'
+    assert draft[window_start + len(window)] in ' \n'
+
+
+def test_omitted_headings_are_listed(builder):
+    draft = long_draft()
+    start = draft.index('word10x0')
+    context, _ = builder.build_selection_context(draft, start, start + 8)
+    listing = context.split('\n\n')[0]
+    assert listing.startswith('Section headings in this document:')
+    assert '## Heading 1' in listing
+    assert '## Heading 20' in listing
+
+
+def test_selection_at_document_start_has_no_earlier_marker(builder):
+    draft = long_draft()
+    context, trimmed = builder.build_selection_context(draft, 0, 12)
+    assert trimmed
+    assert '[... earlier text omitted ...]' not in context
+    assert context.split('\n', 1)[0] != ''
+    assert '## Heading 1\n' in context
+
+
+def test_selection_larger_than_window_is_kept_whole(builder):
+    draft = long_draft()
+    start = draft.index('## Heading 5')
+    end = draft.index('## Heading 12')
+    context, trimmed = builder.build_selection_context(draft, start, end)
+    assert trimmed
+    assert draft[start:end] in context
+
+
+def test_locate_selection_prefers_valid_offsets(builder):
+    draft = 'alpha beta alpha'
+    assert builder.locate_selection(draft, 'alpha', 11, 16) == (11, 16)
+    assert builder.locate_selection(draft, 'alpha', None, None) == (0, 5)
+    assert builder.locate_selection(draft, 'beta', 10, 99) == (6, 10)
+    assert builder.locate_selection(draft, 'gamma') == (None, None)
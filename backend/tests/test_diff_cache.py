@@ -0,0 +1,66 @@
+from services.diff_cache import DiffCache
+from services.diff_service import DiffResult, DocumentDiffService
+
+
+def result_for(text: str) -> DiffResult:
+    result = DiffResult(text, text)
+    result.add('unchanged', 0, len(text), 0, len(text))
+    return result
+
+
+def test_keys_depend_on_both_texts_and_mode():
+    key = DiffCache.make_key('a', 'b', ('histogram', 'auto'))
+    assert key == DiffCache.make_key('a', 'b', ('histogram', 'auto'))
+    assert key != DiffCache.make_key('b', 'a', ('histogram', 'auto'))
+    assert key != DiffCache.make_key('a', 'b', ('myers', 'auto'))
+    assert key != DiffCache.make_key('a', 'b', ('histogram', 'word'))
+
+
+def test_evicts_least_recently_used_to_stay_within_budget():
+    entry_size = DiffCache.estimate_size(result_for('x' * 100))
+    cache = DiffCache(max_bytes=2 * entry_size)
+    cache.set('a', result_for('a' * 100))
+    cache.set('b', result_for('b' * 100))
+    assert cache.get('a') is not None
+    cache.set('c', result_for('c' * 100))
+
+    assert cache.get('b') is None
+    assert cache.get('a') is not None
+    assert cache.get('c') is not None
+    stats = cache.get_stats()
+    assert stats['evictions'] == 1
+    assert stats['entries'] == 2
+    assert stats['bytes'] <= cache.max_bytes
+
+
+def test_replacing_an_entry_updates_its_size():
+    cache = DiffCache()
+    cache.set('a', result_for('a' * 1000))
+    cache.set('a', result_for('a'))
+    assert cache.get_stats()['bytes'] == DiffCache.estimate_size(result_for('a'))
+
+
+def test_results_larger_than_the_budget_are_skipped():
+    cache = DiffCache(max_bytes=100)
+    cache.set('big', result_for('x' * 1000))
+    assert cache.get('big') is None
+    assert cache.get_stats()['skipped'] == 1
+
+
+def test_clear_resets_size():
+    cache = DiffCache()
+    cache.set('a', result_for('a'))
+    cache.clear()
+    assert cache.get_stats()['entries'] == 0
+    assert cache.get_stats()['bytes'] == 0
+
+
+def test_service_reuses_cached_results():
+    service = DocumentDiffService(cache=DiffCache())
+    first = service.compute_document_diff('old text here', 'new text here')
+    assert service.compute_document_diff('old text here', 'new text here') is first
+    assert service.compute_document_diff('old text here', 'new text here', 'char') is not first
+
+
+def test_zero_budget_disables_service_cache():
+    assert DocumentDiffService(cache=DiffCache(max_bytes=0)).cache is None
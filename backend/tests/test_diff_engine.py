@@ -0,0 +1,157 @@
+import random
+import time
+
+import pytest
+
+from services.diff_engine import (
+    DIFF_ENGINES,
+    DiffTimeout,
+    HistogramDiffEngine,
+    MyersDiffEngine,
+    PatienceDiffEngine,
+    get_diff_engine,
+    tokenize_chars,
+    tokenize_lines,
+    tokenize_sentences,
+    tokenize_words,
+)
+
+
+def assert_valid_opcodes(opcodes, a, b):
+    """Opcodes must tile both sequences in order, with equal ranges really equal"""
+    i = j = 0
+    for tag, i1, i2, j1, j2 in opcodes:
+        assert (i1, j1) == (i, j)
+        assert i1 <= i2 and j1 <= j2
+        if tag == 'equal':
+            assert list(a[i1:i2]) == list(b[j1:j2])
+        elif tag == 'replace':
+            assert i1 < i2 and j1 < j2
+        elif tag == 'delete':
+            assert i1 < i2 and j1 == j2
+        elif tag == 'insert':
+            assert i1 == i2 and j1 < j2
+        else:
+            pytest.fail(f"unknown opcode {tag}")
+        i, j = i2, j2
+    assert (i, j) == (len(a), len(b))
+
+
+def apply_opcodes(opcodes, a, b):
+    result = []
+    for tag, i1, i2, j1, j2 in opcodes:
+        result.extend(a[i1:i2] if tag == 'equal' else b[j1:j2])
+    return result
+
+
+def lcs_length(a, b) -> int:
+    row = [0] * (len(b) + 1)
+    for x in a:
+        previous = 0
+        for index, y in enumerate(b, 1):
+            current = row[index]
+            row[index] = previous + 1 if x == y else max(row[index], row[index - 1])
+            previous = current
+    return row[-1]
+
+
+def equal_count(opcodes) -> int:
+    return sum(i2 - i1 for tag, i1, i2, _, _ in opcodes if tag == 'equal')
+
+
+@pytest.mark.parametrize('name', sorted(DIFF_ENGINES))
+def test_randomized_opcodes_are_valid(name):
+    rng = random.Random(name)
+    engine = get_diff_engine(name)
+    for _ in range(2000):
+        a = [rng.choice('abcde') for _ in range(rng.randint(0, 30))]
+        b = [rng.choice('abcde') for _ in range(rng.randint(0, 30))]
+        opcodes = engine.get_opcodes(a, b)
+        assert_valid_opcodes(opcodes, a, b)
+        assert apply_opcodes(opcodes, a, b) == b
+
+
+def test_myers_is_minimal_below_max_cost():
+    rng = random.Random(11)
+    engine = MyersDiffEngine()
+    for _ in range(2000):
+        a = [rng.choice('abcd') for _ in range(rng.randint(0, 25))]
+        b = [rng.choice('abcd') for _ in range(rng.randint(0, 25))]
+        assert equal_count(engine.get_opcodes(a, b)) == lcs_length(a, b)
+
+
+@pytest.mark.parametrize('engine_class', [MyersDiffEngine, PatienceDiffEngine, HistogramDiffEngine])
+def test_heavy_rewrites_past_max_cost_stay_valid(engine_class):
+    rng = random.Random(3)
+    vocabulary = [f"w{index}" for index in range(50)]
+    a = [rng.choice(vocabulary) for _ in range(3000)]
+    b = [rng.choice(vocabulary) for _ in range(3000)]
+    opcodes = engine_class().get_opcodes(a, b)
+    assert_valid_opcodes(opcodes, a, b)
+
+
+@pytest.mark.parametrize('name', ['myers', 'patience', 'histogram'])
+def test_small_edits_in_long_text_are_localized(name):
+    rng = random.Random(5)
+    words = [f"word{rng.randint(0, 500)}" for _ in range(20000)]
+    edited = list(words)
+    edited[5000] = 'CHANGED'
+    edited.insert(12000, 'NEW')
+    del edited[17000]
+    opcodes = get_diff_engine(name).get_opcodes(words, edited)
+    assert_valid_opcodes(opcodes, words, edited)
+    assert equal_count(opcodes) == len(words) - 2
+
+
+def test_patience_aligns_unique_tokens_first():
+    a = ['u1', 'c', 'c', 'u2']
+    b = ['c', 'u1', 'c', 'u2']
+    assert PatienceDiffEngine().get_opcodes(a, b) == [
+        ('insert', 0, 0, 0, 1),
+        ('equal', 0, 1, 1, 2),
+        ('delete', 1, 2, 2, 2),
+        ('equal', 2, 4, 2, 4),
+    ]
+
+
+def test_histogram_anchors_on_repeated_tokens():
+    a = ['x', 'a', 'x', 'b', 'x', 'c', 'x']
+    b = ['x', 'a', 'x', 'B', 'x', 'c', 'x']
+    opcodes = HistogramDiffEngine().get_opcodes(a, b)
+    assert_valid_opcodes(opcodes, a, b)
+    assert equal_count(opcodes) == 6
+
+
+def test_identical_and_empty_inputs():
+    for name in DIFF_ENGINES:
+        engine = get_diff_engine(name)
+        assert engine.get_opcodes([], []) == []
+        assert engine.get_opcodes(['a', 'b'], ['a', 'b']) == [('equal', 0, 2, 0, 2)]
+        assert engine.get_opcodes([], ['a']) == [('insert', 0, 0, 0, 1)]
+        assert engine.get_opcodes(['a'], []) == [('delete', 0, 1, 0, 0)]
+        assert engine.get_opcodes(['a'], ['b']) == [('replace', 0, 1, 0, 1)]
+
+
+@pytest.mark.parametrize('name', sorted(DIFF_ENGINES))
+def test_expired_deadline_raises(name):
+    with pytest.raises(DiffTimeout):
+        get_diff_engine(name).get_opcodes(['a', 'b'], ['b', 'c'], deadline=time.monotonic() - 1)
+
+
+def test_unknown_algorithm():
+    with pytest.raises(ValueError):
+        get_diff_engine('bogus')
+
+
+def test_default_algorithm_is_histogram(monkeypatch):
+    monkeypatch.delenv('DIFF_ALGORITHM', raising=False)
+    assert isinstance(get_diff_engine(), HistogramDiffEngine)
+
+
+def test_tokenizers_round_trip():
+    text = 'First sentence. Second one!\nThird line?  End'
+    assert ''.join(tokenize_words(text)) == text
+    assert ''.join(tokenize_sentences(text)) == text
+    assert ''.join(tokenize_lines(text)) == text
+    assert ''.join(tokenize_chars(text)) == text
+    assert tokenize_words('  two words ') == ('two', ' ', 'words')
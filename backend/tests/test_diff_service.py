@@ -0,0 +1,170 @@
+import random
+import re
+
+import pytest
+
+from services.diff_cache import DiffCache
+from services.diff_service import DiffResult, DocumentDiffService
+
+
+def js_slice(text: str, start: int, end: int) -> str:
+    """String.prototype.slice: offsets count UTF-16 code units"""
+    units = text.encode('utf-16-le')
+    return units[2 * start:2 * end].decode('utf-16-le')
+
+
+def expand_compact(compact: dict) -> list:
+    """Python port of expandCompactDiff in frontend/src/utils/diffFormat.ts"""
+    types = {'=': 'unchanged', '-': 'removed', '+': 'added'}
+    segments = []
+    for index, op in enumerate(compact['ops']):
+        start, end = compact['ranges'][2 * index:2 * index + 2]
+        source = compact['revised'] if op == '+' else compact['original']
+        segments.append((types[op], js_slice(source, start, end)))
+    return segments
+
+
+@pytest.fixture
+def service():
+    return DocumentDiffService()
+
+
+@pytest.mark.parametrize('original, revised', [
+    ('The model 📈 grew fast.', 'The model 📈 grew 🚀 very fast.'),
+    ('𝒜 risk 😀😀 remains.', 'A risk 😀 remains 𝒵.'),
+    ('plain ascii text here', 'plain text here now'),
+    ('naïve café', 'naïve café 🎉'),
+])
+def test_compact_round_trip_with_astral_characters(service, original, revised):
+    result = service.compute_document_diff(original, revised)
+    expected = [(segment['type'], segment['text']) for segment in result.to_dicts()]
+    assert expand_compact(result.to_compact()) == expected
+
+
+def test_compact_round_trip_randomized(service):
+    rng = random.Random(14)
+    vocabulary = ['risk', 'model', '📊', 'data🔥', 'ok', '𝔘nit', 'é', 'x']
+    for _ in range(300):
+        original = ' '.join(rng.choice(vocabulary) for _ in range(rng.randint(1, 15)))
+        revised = ' '.join(rng.choice(vocabulary) for _ in range(rng.randint(1, 15)))
+        for granularity in ('char', 'word', 'line'):
+            result = service.compute_document_diff(original, revised, granularity)
+            expected = [(segment['type'], segment['text']) for segment in result.to_dicts()]
+            assert expand_compact(result.to_compact()) == expected
+
+
+def test_compact_ascii_ranges_are_code_point_offsets():
+    result = DiffResult('abc def', 'abc xyz')
+    result.add('unchanged', 0, 4, 0, 4)
+    result.add('removed', 4, 7, 4, 4)
+    result.add('added', 7, 7, 4, 7)
+    compact = result.to_compact(original_ref='request.draft')
+    assert compact['ops'] == '=-+'
+    assert compact['ranges'] == [0, 4, 4, 7, 4, 7]
+    assert compact['original_ref'] == 'request.draft'
+    assert 'original' not in compact
+    assert compact['revised'] == 'abc xyz'
+
+
+def test_timed_out_fallbacks_are_not_cached(monkeypatch):
+    service = DocumentDiffService(cache=DiffCache())
+    original = 'The model uses two years of data for calibration.'
+    revised = 'The model uses five years of market data for calibration.'
+
+    monkeypatch.setattr(DocumentDiffService, 'TIME_BUDGET', -1.0)
+    degraded = service.compute_document_diff(original, revised)
+    assert degraded.granularity == 'rewrite'
+    assert service.cache.get_stats()['entries'] == 0
+
+    monkeypatch.setattr(DocumentDiffService, 'TIME_BUDGET', 5.0)
+    result = service.compute_document_diff(original, revised)
+    assert result.granularity == 'word'
+    assert service.compute_document_diff(original, revised) is result
+    assert service.cache.get_stats()['hits'] == 1
+
+
+def rescanned_stats(result: DiffResult) -> dict:
+    """Stats counted the lazy way, by scanning the text of every final segment"""
+    copy = DiffResult(result.original, result.revised)
+    copy.segments = result.segments
+    return copy.stats.to_dict()
+
+
+def build_time_results(service):
+    draft = 'Intro paragraph stays.\n\nThe model uses two years of data.\n\nClosing words stay too.'
+    start = draft.index('two years')
+    revised = draft[:start] + 'five years of market' + draft[start + len('two years'):]
+    yield service.compute_window_diff(draft, revised, start, start + len('two years'), start + len('five years of market'))
+    yield service.compute_window_diff(draft, draft[:start] + draft[start + len('two years'):], start, start + len('two years'), start)
+    yield service.compute_document_diff('  alpha beta gamma\n', 'delta epsilon zeta eta theta')
+    yield service.compute_document_diff('', '  added text\nover two lines  ')
+    yield service.compute_document_diff('removed text only', '   ')
+
+
+def test_stats_are_collected_while_building(service):
+    for result in build_time_results(service):
+        assert result._stats is not None
+        collected = result.stats.to_dict()
+        rescanned = rescanned_stats(result)
+        for field in ('words_added', 'words_removed', 'words_unchanged', 'chars_added', 'chars_removed', 'chars_unchanged'):
+            assert collected[field] == rescanned[field], field
+
+
+def test_rewrite_and_empty_stats():
+    service = DocumentDiffService()
+    rewrite = service.compute_document_diff('one two three', 'four five six seven')
+    assert rewrite.granularity == 'rewrite'
+    stats = rewrite.stats.to_dict()
+    assert (stats['words_removed'], stats['words_added'], stats['chars_unchanged']) == (3, 4, 0)
+    assert stats['change_ratio'] == 1.0
+
+    added = service.compute_document_diff('', 'line one\nline two\n').stats.to_dict()
+    assert (added['words_added'], added['lines_added'], added['chars_added']) == (4, 2, 18)
+
+
+def rebuilt_texts(result: DiffResult) -> tuple:
+    """Original and revised text as DiffViewer rebuilds them by joining segment texts"""
+    segments = result.to_dicts()
+    original = ''.join(segment['text'] for segment in segments if segment['type'] != 'added')
+    revised = ''.join(segment['text'] for segment in segments if segment['type'] != 'removed')
+    return original, revised
+
+
+def assert_rebuilds(result: DiffResult, original: str, revised: str) -> None:
+    assert rebuilt_texts(result) == (original, revised)
+    compact = expand_compact(result.to_compact())
+    assert ''.join(text for op, text in compact if op != 'added') == original
+    assert ''.join(text for op, text in compact if op != 'removed') == revised
+
+
+@pytest.mark.parametrize('original, revised', [
+    ('The fit is good overall.\n\nHowever, tails are thin.', 'The fit is good overall. However, tails are thin.'),
+    ('one two three four five six', 'one two three\nfour five six'),
+    ('  indented text\n', 'indented text'),
+    ('text', 'text\n\n'),
+    ('   ', '\n'),
+    ('', '  added  '),
+    ('{\n  "a": 1\n}', '{\n\n  "a": 1\n}'),
+])
+@pytest.mark.parametrize('granularity', ['auto', 'char', 'word', 'sentence', 'line'])
+def test_whitespace_only_changes_rebuild_both_texts(service, original, revised, granularity):
+    assert_rebuilds(service.compute_document_diff(original, revised, granularity), original, revised)
+
+
+def test_document_and_window_diffs_rebuild_both_texts_randomized(service):
+    rng = random.Random(114)
+    words = ['model', 'risk', 'data.', 'However,', 'x']
+    spaces = [' ', '  ', '\n', '\n\n', '\t']
+    for _ in range(1000):
+        tokens = [rng.choice(words if index % 2 == 0 else spaces) for index in range(rng.randint(1, 21))]
+        original = ''.join(tokens)
+        start = rng.randint(0, len(original))
+        end = rng.randint(start, len(original))
+        replacement = ''.join(rng.choice(words + spaces) for _ in range(rng.randint(0, 3)))
+        if rng.random() < 0.5:
+            # Only the whitespace changes
+            replacement = ''.join(rng.choice(spaces) if token.isspace() else token for token in re.split(r'(\s+)', original[start:end]))
+        revised = original[:start] + replacement + original[end:]
+
+        assert_rebuilds(service.compute_document_diff(original, revised), original, revised)
+        assert_rebuilds(service.compute_window_diff(original, revised, start, end, start + len(replacement)), original, revised)
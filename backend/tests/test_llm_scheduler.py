@@ -0,0 +1,155 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+from services.llm_scheduler import LLMScheduler, estimate_tokens, get_retry_after
+
+
+MODEL = 'test-model'
+
+
+def drained_scheduler(**options) -> LLMScheduler:
+    """Scheduler whose request bucket for MODEL starts empty (3000 rpm refills one request every 20 ms)"""
+    scheduler = LLMScheduler(default_rpm=3000, default_tpm=10_000_000, **options)
+    scheduler._lane(MODEL).requests.tokens = 0.0
+    return scheduler
+
+
+async def admit_in_order(scheduler: LLMScheduler, requests: list) -> list:
+    admitted = []
+
+    async def acquire(name, priority):
+        await scheduler.acquire(MODEL, 10, priority)
+        admitted.append(name)
+
+    await asyncio.gather(*(acquire(name, priority) for name, priority in requests))
+    return admitted
+
+
+def test_admits_immediately_within_budget():
+    scheduler = LLMScheduler(default_rpm=60, default_tpm=1000)
+
+    async def run():
+        started = time.monotonic()
+        await scheduler.acquire(MODEL, 100)
+        return time.monotonic() - started
+
+    assert asyncio.run(run()) < 0.05
+    stats = scheduler.get_stats()[MODEL]
+    assert stats['admitted'] == 1
+    assert stats['tokens_available'] < 901
+
+
+def test_waiters_are_served_by_priority_then_fifo():
+    scheduler = drained_scheduler(bulk_reserve=0.0)
+    requests = [
+        ('bulk-1', 'bulk'), ('normal-1', 'normal'), ('interactive-1', 'interactive'),
+        ('normal-2', 'normal'), ('interactive-2', 'interactive'), ('bulk-2', 'bulk'),
+    ]
+    admitted = asyncio.run(admit_in_order(scheduler, requests))
+    assert admitted == ['interactive-1', 'interactive-2', 'normal-1', 'normal-2', 'bulk-1', 'bulk-2']
+
+
+def test_unknown_priority_uses_normal_lane():
+    scheduler = drained_scheduler(bulk_reserve=0.0)
+    admitted = asyncio.run(admit_in_order(scheduler, [('bulk', 'bulk'), ('other', 'whatever'), ('first', 'interactive')]))
+    assert admitted == ['first', 'other', 'bulk']
+
+
+def test_bulk_waits_for_reserve_while_interactive_is_admitted():
+    scheduler = LLMScheduler(default_rpm=600, default_tpm=10_000_000, bulk_reserve=0.5)
+    lane = scheduler._lane(MODEL)
+    lane.requests.tokens = 200.0
+
+    async def run():
+        bulk = asyncio.ensure_future(scheduler.acquire(MODEL, 10, 'bulk'))
+        await asyncio.sleep(0.02)
+        assert not bulk.done()
+        # Interactive work behind a waiting bulk request is still admitted from the reserve
+        await asyncio.wait_for(scheduler.acquire(MODEL, 10, 'interactive'), 0.05)
+        assert scheduler.get_stats()[MODEL]['queue_depth']['bulk'] == 1
+
+        lane.requests.tokens = lane.requests.capacity
+        scheduler._dispatch(MODEL)
+        await asyncio.wait_for(bulk, 0.05)
+
+    asyncio.run(run())
+    assert scheduler.get_stats()[MODEL]['admitted'] == 2
+
+
+def test_token_budget_limits_admission():
+    scheduler = LLMScheduler(default_rpm=1000, default_tpm=600, bulk_reserve=0.0)
+
+    async def run():
+        await scheduler.acquire(MODEL, 600)
+        second = asyncio.ensure_future(scheduler.acquire(MODEL, 5))
+        await asyncio.sleep(0.02)
+        assert not second.done()
+        # 600 tpm refills 10 tokens a second, so five tokens arrive within 0.5 s
+        await asyncio.wait_for(second, 1.0)
+
+    asyncio.run(run())
+
+
+def test_record_usage_corrects_token_budget():
+    scheduler = LLMScheduler(default_rpm=60, default_tpm=1000)
+    lane = scheduler._lane(MODEL)
+    asyncio.run(scheduler.acquire(MODEL, 100))
+    before = lane.tokens.tokens
+    scheduler.record_usage(MODEL, 100, 300)
+    assert lane.tokens.tokens == before - 200
+    scheduler.record_usage(MODEL, 100, None)
+    assert lane.tokens.tokens == before - 200
+
+
+def test_rate_limit_pauses_the_model():
+    scheduler = LLMScheduler(default_rpm=6000, default_tpm=10_000_000)
+
+    async def run():
+        scheduler.on_rate_limited(MODEL, 0.1)
+        started = time.monotonic()
+        await scheduler.acquire(MODEL, 10, 'interactive')
+        return time.monotonic() - started
+
+    assert asyncio.run(run()) >= 0.09
+    assert scheduler.get_stats()[MODEL]['rate_limited'] == 1
+
+
+def test_cancelled_waiter_is_skipped():
+    scheduler = drained_scheduler(bulk_reserve=0.0)
+
+    async def run():
+        abandoned = asyncio.ensure_future(scheduler.acquire(MODEL, 10, 'interactive'))
+        kept = asyncio.ensure_future(scheduler.acquire(MODEL, 10, 'normal'))
+        await asyncio.sleep(0)
+        abandoned.cancel()
+        await asyncio.wait_for(kept, 0.1)
+
+    asyncio.run(run())
+    stats = scheduler.get_stats()[MODEL]
+    assert stats['admitted'] == 1
+    assert sum(stats['queue_depth'].values()) == 0
+
+
+def test_per_model_limits_override_defaults():
+    scheduler = LLMScheduler(default_rpm=60, default_tpm=1000, limits={'big-model': {'rpm': 500, 'tpm': 300000}})
+    assert scheduler._lane('big-model').requests.capacity == 500
+    assert scheduler._lane('big-model').tokens.capacity == 300000
+    assert scheduler._lane(MODEL).tokens.capacity == 1000
+
+
+def test_get_retry_after():
+    def rate_limit(headers):
+        return SimpleNamespace(status_code=429, response=SimpleNamespace(headers=headers))
+
+    assert get_retry_after(rate_limit({'retry-after-ms': '1500'})) == 1.5
+    assert get_retry_after(rate_limit({'retry-after': '3'})) == 3.0
+    assert get_retry_after(rate_limit({'retry-after': 'soon'})) == 1.0
+    assert get_retry_after(rate_limit({})) == 1.0
+    assert get_retry_after(SimpleNamespace(status_code=500)) is None
+    assert get_retry_after(ValueError()) is None
+
+
+def test_estimate_tokens():
+    assert estimate_tokens('') == 1
+    assert estimate_tokens('x' * 400) == 101
@@ -0,0 +1,99 @@
+import random
+
+import pytest
+
+from services.merge_service import MergeService
+
+
+BASE = "The model uses monthly data. It was validated in 2020. Results are stable."
+
+
+@pytest.fixture
+def merger():
+    return MergeService()
+
+
+def test_trivial_cases(merger):
+    edited = BASE.replace('monthly', 'daily')
+    assert merger.merge(BASE, edited, BASE) == {'merged': edited, 'conflicts': [], 'clean': True}
+    assert merger.merge(BASE, BASE, edited)['merged'] == edited
+    assert merger.merge(BASE, edited, edited)['merged'] == edited
+
+
+def test_disjoint_edits_merge_cleanly(merger):
+    edited = BASE.replace('monthly', 'daily')
+    latest = BASE.replace('2020', '2023')
+    result = merger.merge(BASE, edited, latest)
+    assert result['clean']
+    assert result['merged'] == "The model uses daily data. It was validated in 2023. Results are stable."
+
+
+def test_edits_around_text_added_at_both_ends(merger):
+    edited = BASE.replace('stable', 'robust')
+    result = merger.merge(BASE, edited, 'Intro. ' + BASE + ' Outro.')
+    assert result['clean']
+    assert result['merged'] == 'Intro. ' + edited + ' Outro.'
+
+
+def test_identical_changes_on_both_sides_are_not_conflicts(merger):
+    edited = BASE.replace('monthly', 'daily')
+    result = merger.merge(BASE, edited, edited + ' Extra.')
+    assert result['clean']
+    assert result['merged'] == edited + ' Extra.'
+
+
+@pytest.mark.parametrize('prefer, kept', [('latest', 'weekly'), ('edited', 'daily')])
+def test_overlapping_changes_conflict(merger, prefer, kept):
+    edited = BASE.replace('monthly', 'daily')
+    latest = BASE.replace('monthly', 'weekly')
+    result = merger.merge(BASE, edited, latest, prefer)
+    assert not result['clean']
+    assert result['merged'] == BASE.replace('monthly', kept)
+    [conflict] = result['conflicts']
+    assert (conflict['base'], conflict['edited'], conflict['latest']) == ('monthly', 'daily', 'weekly')
+    assert result['merged'][conflict['merged_start']:conflict['merged_end']] == kept
+
+
+def test_insertions_at_the_same_point_conflict(merger):
+    edited = BASE.replace('uses monthly', 'uses cleaned monthly')
+    latest = BASE.replace('uses monthly', 'uses raw monthly')
+    result = merger.merge(BASE, edited, latest)
+    assert not result['clean']
+    assert result['merged'] == latest
+
+
+def test_unknown_preference(merger):
+    with pytest.raises(ValueError):
+        merger.merge(BASE, BASE + '!', BASE + '?', prefer='base')
+
+
+def test_randomized_disjoint_sentence_edits_merge_cleanly(merger):
+    rng = random.Random(2)
+    words = ['alpha', 'beta', 'gamma', 'delta', 'eps']
+    for _ in range(500):
+        sentences = [' '.join(rng.choice(words) for _ in range(5)) + '.' for _ in range(8)]
+        edited, latest = list(sentences), list(sentences)
+        i, j = rng.sample(range(8), 2)
+        edited[i] = 'EDIT ' + edited[i]
+        latest[j] = latest[j].replace('.', ' LATEST.')
+        expected = list(sentences)
+        expected[i], expected[j] = edited[i], latest[j]
+
+        result = merger.merge(' '.join(sentences), ' '.join(edited), ' '.join(latest))
+        assert result['clean']
+        assert result['merged'] == ' '.join(expected)
+
+
+@pytest.mark.parametrize('prefer', ['latest', 'edited'])
+def test_randomized_conflict_offsets_point_at_kept_side(merger, prefer):
+    rng = random.Random(prefer)
+    words = ['alpha', 'beta', 'gamma', 'delta', 'eps', '\n']
+    for _ in range(500):
+        base = ' '.join(rng.choice(words) for _ in range(rng.randint(1, 30)))
+        edited = ' '.join(rng.choice(words) for _ in range(rng.randint(1, 30)))
+        latest = ' '.join(rng.choice(words) for _ in range(rng.randint(1, 30)))
+        result = merger.merge(base, edited, latest, prefer)
+        assert result['clean'] == (not result['conflicts'])
+        for conflict in result['conflicts']:
+            assert result['merged'][conflict['merged_start']:conflict['merged_end']] == conflict[prefer]
+            assert conflict['edited'] != conflict['latest']
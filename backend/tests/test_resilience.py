@@ -0,0 +1,190 @@
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from services.resilience import CircuitBreaker
+
+
+def open_breaker(breaker: CircuitBreaker, cooled_down: bool = True) -> None:
+    """Trip the breaker, optionally backdating it so it is already half-open"""
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    if cooled_down:
+        breaker.opened_at -= breaker.reset_timeout
+
+
+def test_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == 'closed'
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert not breaker.allow_request()
+    assert breaker.get_stats()['rejected'] == 1
+
+
+def test_half_open_lets_a_single_trial_through():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    open_breaker(breaker)
+    assert breaker.state == 'half_open'
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == 'closed'
+    assert breaker.allow_request() and breaker.allow_request()
+
+
+def test_failed_trial_reopens():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    open_breaker(breaker)
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert not breaker.trial_in_flight
+
+
+def test_neutral_trial_outcome_allows_another_trial():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    open_breaker(breaker)
+    assert breaker.allow_request()
+    breaker.record_neutral()
+    assert breaker.state == 'half_open'
+    assert breaker.allow_request()
+
+
+def test_abandoned_trial_reopens_but_abandoned_closed_call_is_neutral():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    breaker.record_failure()
+    breaker.record_abandoned()
+    assert breaker.state == 'closed'
+    assert breaker.failures == 1
+
+    open_breaker(breaker)
+    assert breaker.allow_request()
+    breaker.record_abandoned()
+    assert breaker.state == 'open'
+    assert not breaker.trial_in_flight
+
+
+def test_lost_trial_stops_blocking_after_trial_timeout():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60, trial_timeout=5)
+    open_breaker(breaker)
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+    breaker.trial_started_at -= 5
+    assert breaker.allow_request()
+    assert breaker.get_stats()['lost_trials'] == 1
+    assert not breaker.allow_request()
+
+
+def test_trial_timeout_defaults_to_reset_timeout():
+    assert CircuitBreaker(reset_timeout=12).trial_timeout == 12
+
+
+class HangingClient:
+    """Chat client whose completions block until released, like a provider that stopped answering"""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **request):
+        self.release.wait(5)
+        raise ConnectionError('released')
+
+    def with_options(self, **options):
+        return self
+
+
+@pytest.fixture
+def hanging_service():
+    pytest.importorskip('openai')
+    from services.generation_service import GenerationService
+    client = HangingClient()
+    service = GenerationService(model_id='test-model', client=client)
+    open_breaker(service.circuit_breaker)
+    yield service
+    client.release.set()
+
+
+def test_timed_out_half_open_trial_reopens_breaker(hanging_service):
+    from services.generation_errors import GenerationTimeoutError
+    hanging_service._operation_timeout = lambda operation: 0.05
+
+    with pytest.raises(GenerationTimeoutError):
+        asyncio.run(hanging_service._create_completion('system', 'prompt'))
+
+    breaker = hanging_service.circuit_breaker
+    assert not breaker.trial_in_flight
+    assert breaker.state == 'open'
+
+
+def test_cancelled_half_open_trial_is_released(hanging_service):
+    async def cancel_trial():
+        task = asyncio.ensure_future(hanging_service._create_completion('system', 'prompt'))
+        await asyncio.sleep(0.05)
+        assert hanging_service.circuit_breaker.trial_in_flight
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_trial())
+    assert not hanging_service.circuit_breaker.trial_in_flight
+
+
+def test_stream_closed_before_any_token_releases_trial(hanging_service):
+    async def close_early():
+        stream = hanging_service._stream_completion('system', 'prompt')
+        task = asyncio.ensure_future(stream.__anext__())
+        await asyncio.sleep(0.05)
+        assert hanging_service.circuit_breaker.trial_in_flight
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await stream.aclose()
+
+    asyncio.run(close_early())
+    assert not hanging_service.circuit_breaker.trial_in_flight
+
+
+def test_stalled_stream_times_out_and_reopens_breaker(hanging_service):
+    from services.generation_errors import GenerationTimeoutError
+    hanging_service._operation_timeout = lambda operation: 0.05
+
+    async def consume():
+        return [delta async for delta in hanging_service._stream_completion('system', 'prompt', operation='draft')]
+
+    with pytest.raises(GenerationTimeoutError):
+        asyncio.run(consume())
+
+    breaker = hanging_service.circuit_breaker
+    assert not breaker.trial_in_flight
+    assert breaker.state == 'open'
+    assert hanging_service.resilience_stats['timeouts'] == 1
+
+
+def test_stream_request_carries_the_operation_timeout():
+    pytest.importorskip('openai')
+    from services.generation_service import GenerationService
+    requests = []
+
+    def create(**request):
+        requests.append(request)
+        return iter([SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content='text'))])])
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)), with_options=lambda **options: client)
+    service = GenerationService(model_id='test-model', client=client)
+    service._operation_timeout = lambda operation: 42.0
+
+    async def consume():
+        return [delta async for delta in service._stream_completion('system', 'prompt', operation='review')]
+
+    assert asyncio.run(consume()) == ['text']
+    assert 1.0 <= requests[0]['timeout'] <= 42.0
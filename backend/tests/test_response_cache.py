@@ -0,0 +1,137 @@
+import asyncio
+import json
+import os
+import threading
+import time
+
+import pytest
+
+from services.response_cache import ResponseCache
+
+
+def test_lru_evicts_least_recently_used():
+    cache = ResponseCache(max_entries=2)
+    cache.set('a', 'A')
+    cache.set('b', 'B')
+    assert cache.get('a') == 'A'
+    cache.set('c', 'C')
+    assert cache.get('b') is None
+    assert cache.get('a') == 'A'
+    assert cache.get('c') == 'C'
+    stats = cache.get_stats()
+    assert stats['evictions'] == 1
+    assert stats['entries'] == 2
+
+
+def test_overwrite_does_not_evict():
+    cache = ResponseCache(max_entries=2)
+    cache.set('a', 'A')
+    cache.set('b', 'B')
+    cache.set('a', 'A2')
+    assert cache.get('a') == 'A2'
+    assert cache.get('b') == 'B'
+    assert cache.get_stats()['evictions'] == 0
+
+
+def test_expired_entries_miss(monkeypatch):
+    cache = ResponseCache(ttl=10)
+    cache.set('a', 'A')
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now + 11)
+    assert cache.get('a') is None
+    stats = cache.get_stats()
+    assert stats['misses'] == 1
+    assert stats['entries'] == 0
+
+
+def test_disk_tier_survives_memory_eviction_and_restart(tmp_path):
+    cache = ResponseCache(max_entries=1, cache_dir=str(tmp_path))
+    cache.set('a' * 64, 'A')
+    cache.set('b' * 64, 'B')
+    assert cache.get('a' * 64) == 'A'
+    assert cache.get_stats()['disk_hits'] == 1
+    # The disk hit was promoted, so the next lookup is served from memory
+    assert cache.get('a' * 64) == 'A'
+    assert cache.get_stats()['memory_hits'] == 1
+
+    restarted = ResponseCache(cache_dir=str(tmp_path))
+    assert restarted.get('b' * 64) == 'B'
+
+
+def test_expired_disk_entries_are_removed(tmp_path, monkeypatch):
+    cache = ResponseCache(ttl=10, cache_dir=str(tmp_path))
+    cache.set('c' * 64, 'C')
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now + 11)
+    assert ResponseCache(ttl=10, cache_dir=str(tmp_path)).get('c' * 64) is None
+    assert not list(tmp_path.rglob('*.json'))
+
+
+def test_clear_drops_both_tiers(tmp_path):
+    cache = ResponseCache(cache_dir=str(tmp_path))
+    cache.set('d' * 64, 'D')
+    cache.clear()
+    assert cache.get('d' * 64) is None
+
+
+def test_make_key_ignores_dict_order_only():
+    request = {'model': 'm', 'messages': [{'role': 'user', 'content': 'x'}]}
+    assert ResponseCache.make_key(request) == ResponseCache.make_key(dict(reversed(list(request.items()))))
+    assert ResponseCache.make_key(request) != ResponseCache.make_key({**request, 'model': 'n'})
+
+
+def test_disk_tier_is_pruned_to_its_limit(tmp_path):
+    cache = ResponseCache(max_entries=1, cache_dir=str(tmp_path), max_disk_entries=10)
+    start = time.time() - 100
+    for index in range(25):
+        key = f"{index:02d}" * 32
+        cache.set(key, str(index))
+        # Distinct modification times, oldest first
+        os.utime(cache._disk_path(key), (start + index, start + index))
+    files = list(tmp_path.rglob('*.json'))
+    assert len(files) <= 10
+    assert cache.get_stats()['disk_entries'] == len(files)
+    assert cache.get_stats()['disk_evictions'] == 25 - len(files)
+    assert ResponseCache(cache_dir=str(tmp_path)).get('24' * 32) == '24'
+    assert ResponseCache(cache_dir=str(tmp_path)).get('00' * 32) is None
+
+
+def test_expired_files_are_pruned_at_startup(tmp_path):
+    cache = ResponseCache(ttl=10, cache_dir=str(tmp_path))
+    cache.set('e' * 64, 'E')
+    old = time.time() - 60
+    os.utime(cache._disk_path('e' * 64), (old, old))
+    assert ResponseCache(ttl=10, cache_dir=str(tmp_path)).get_stats()['disk_entries'] == 0
+    assert not list(tmp_path.rglob('*.json'))
+
+
+@pytest.mark.parametrize('record', ['{}', '{"created": 1}', '[1, 2]', '"text"', '{"created": "x", "response": "R"}', '{"created": 1e18, "response": 5}', 'not json'])
+def test_malformed_disk_records_are_misses(tmp_path, record):
+    cache = ResponseCache(cache_dir=str(tmp_path))
+    path = cache._disk_path('f' * 64)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as fh:
+        fh.write(record)
+    assert cache.get('f' * 64) is None
+    assert cache.get_stats()['misses'] == 1
+
+
+def test_async_access_does_disk_io_off_the_event_loop(tmp_path):
+    cache = ResponseCache(max_entries=1, cache_dir=str(tmp_path))
+    loop_thread = threading.get_ident()
+    io_threads = []
+    read_disk, write_disk = cache._read_disk, cache._write_disk
+    cache._read_disk = lambda *args: io_threads.append(threading.get_ident()) or read_disk(*args)
+    cache._write_disk = lambda *args: io_threads.append(threading.get_ident()) or write_disk(*args)
+
+    async def exercise():
+        await cache.set_async('g' * 64, 'G')
+        await cache.set_async('h' * 64, 'H')
+        return await cache.get_async('g' * 64), await cache.get_async('h' * 64)
+
+    assert asyncio.run(exercise()) == ('G', 'H')
+    with open(cache._disk_path('g' * 64), encoding='utf-8') as fh:
+        assert json.load(fh)['response'] == 'G'
+    assert io_threads and loop_thread not in io_threads
+    stats = cache.get_stats()
+    assert (stats['disk_hits'], stats['memory_hits']) == (2, 0)
@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+
+from services.single_flight import SingleFlight
+
+
+def completion_request(content: str) -> dict:
+    return {
+        'model': 'test-model',
+        'temperature': 0.0,
+        'messages': [
+            {'role': 'system', 'content': 'system'},
+            {'role': 'user', 'content': content},
+        ],
+    }
+
+
+def test_key_is_stable_across_dict_order():
+    request = completion_request('prompt')
+    reordered = dict(reversed(list(request.items())))
+    assert SingleFlight.make_key(request) == SingleFlight.make_key(reordered)
+
+
+@pytest.mark.parametrize('variant', ['prompt ', 'prompt\n', 'pro mpt', '  prompt', 'prompt\n\n- item'])
+def test_key_distinguishes_whitespace(variant):
+    assert SingleFlight.make_key(completion_request('prompt')) != SingleFlight.make_key(completion_request(variant))
+
+
+def test_key_distinguishes_parameters():
+    request = completion_request('prompt')
+    assert SingleFlight.make_key(request) != SingleFlight.make_key({**request, 'temperature': 1.0})
+    assert SingleFlight.make_key(request) != SingleFlight.make_key({**request, 'model': 'other-model'})
+
+
+def test_concurrent_identical_calls_share_one_execution():
+    flight = SingleFlight()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return 'result'
+
+    async def run():
+        return await asyncio.gather(*(flight.do('key', work) for _ in range(5)))
+
+    assert asyncio.run(run()) == ['result'] * 5
+    assert len(calls) == 1
+    assert flight.get_stats() == {'executions': 1, 'coalesced': 4, 'in_flight': 0}
+
+
+def test_distinct_keys_and_sequential_calls_execute_separately():
+    flight = SingleFlight()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        count = len(calls)
+        await asyncio.sleep(0)
+        return count
+
+    async def run():
+        first = await asyncio.gather(flight.do('a', work), flight.do('b', work))
+        second = await flight.do('a', work)
+        return first, second
+
+    assert asyncio.run(run()) == ([1, 2], 3)
+    assert flight.get_stats()['executions'] == 3
+
+
+def test_errors_reach_every_waiter():
+    flight = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError('boom')
+
+    async def run():
+        return await asyncio.gather(flight.do('key', fail), flight.do('key', fail), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert [type(result) for result in results] == [ValueError, ValueError]
+
+
+def test_cancelled_caller_does_not_cancel_shared_call():
+    flight = SingleFlight()
+
+    async def work():
+        await asyncio.sleep(0.02)
+        return 'result'
+
+    async def run():
+        leaving = asyncio.ensure_future(flight.do('key', work))
+        staying = asyncio.ensure_future(flight.do('key', work))
+        await asyncio.sleep(0)
+        leaving.cancel()
+        return await staying
+
+    assert asyncio.run(run()) == 'result'
@@ -0,0 +1,124 @@
+import json
+import random
+
+import pytest
+
+from services.table_diff_service import TableDiffService
+
+
+FIELDS = ['title', 'description', 'category', 'importance']
+
+
+def risk(title, description='Impact on the model outputs.', category='Operational Risk', importance='High'):
+    return {'title': title, 'description': description, 'category': category, 'importance': importance}
+
+
+@pytest.fixture
+def service():
+    return TableDiffService()
+
+
+def row_types(table_diff):
+    return [(record['type'], record['original_index'], record['revised_index'], record['moved']) for record in table_diff['rows']]
+
+
+def test_identical_tables_are_unchanged(service):
+    rows = [risk('Data drift'), risk('Overfitting')]
+    table_diff = service.compute_table_diff(rows, [dict(row) for row in rows], 'model_risk_issues')
+    assert row_types(table_diff) == [('unchanged', 0, 0, False), ('unchanged', 1, 1, False)]
+    assert table_diff['summary']['rows_unchanged'] == 2
+    assert table_diff['summary']['cells_changed'] == 0
+
+
+def test_rows_match_by_key_and_report_cell_changes(service):
+    original = [risk('Data drift'), risk('Overfitting', importance='Low')]
+    revised = [risk('data  DRIFT'), risk('Overfitting', importance='Critical')]
+    table_diff = service.compute_table_diff(original, revised, 'model_risk_issues')
+
+    assert row_types(table_diff) == [('modified', 0, 0, False), ('modified', 1, 1, False)]
+    title_cell, importance_cell = table_diff['rows'][0]['cells'][0], table_diff['rows'][1]['cells'][0]
+    assert title_cell['field'] == 'title'
+    assert 'diff_segments' in title_cell
+    # Select columns are compared as whole values
+    assert importance_cell == {'field': 'importance', 'type': 'modified', 'original': 'Low', 'revised': 'Critical'}
+
+
+def test_inserted_and_removed_rows_keep_table_order(service):
+    original = [risk('A first'), risk('B second'), risk('C third')]
+    revised = [risk('A first'), risk('New row', description='Something else entirely.'), risk('C third')]
+    table_diff = service.compute_table_diff(original, revised, 'model_risk_issues')
+    assert row_types(table_diff) == [
+        ('unchanged', 0, 0, False),
+        ('added', None, 1, False),
+        ('removed', 1, None, False),
+        ('unchanged', 2, 2, False),
+    ]
+    summary = table_diff['summary']
+    assert (summary['rows_added'], summary['rows_removed'], summary['rows_unchanged']) == (1, 1, 2)
+
+
+def test_reordered_rows_are_flagged_as_moved(service):
+    original = [risk('Alpha'), risk('Beta'), risk('Gamma'), risk('Delta')]
+    revised = [original[0], original[3], original[1], original[2]]
+    table_diff = service.compute_table_diff(original, revised, 'model_risk_issues')
+    assert [record['moved'] for record in table_diff['rows']] == [False, True, False, False]
+    assert table_diff['summary']['rows_moved'] == 1
+    assert table_diff['summary']['rows_unchanged'] == 4
+
+
+def test_renamed_rows_pair_by_similarity(service):
+    description = 'Training data covers only two years of history and misses the 2020 shock.'
+    original = [risk('Limited history', description)]
+    revised = [risk('Short data history', description)]
+    table_diff = service.compute_table_diff(original, revised, 'model_risk_issues')
+    assert row_types(table_diff) == [('modified', 0, 0, False)]
+
+    dissimilar = [risk('Unrelated', 'Vendor model documentation is incomplete.', 'Market Risk', 'Low')]
+    table_diff = service.compute_table_diff(original, dissimilar, 'model_risk_issues')
+    assert sorted(record['type'] for record in table_diff['rows']) == ['added', 'removed']
+
+
+def test_duplicate_keys_fall_back_to_similarity(service):
+    original = [risk('Same', 'First description about data.'), risk('Same', 'Second description about code.')]
+    revised = [risk('Same', 'Second description about code.'), risk('Same', 'First description about data.')]
+    table_diff = service.compute_table_diff(original, revised, 'model_risk_issues')
+    assert [(record['original_index'], record['revised_index']) for record in table_diff['rows'] if record['type'] == 'unchanged'] == [(1, 0), (0, 1)]
+
+
+def test_added_and_removed_fields(service):
+    original = [{'title': 'Row', 'description': 'Text', 'owner': 'Team A'}]
+    revised = [{'title': 'Row', 'description': 'Text', 'status': 'Open'}]
+    cells = service.compute_table_diff(original, revised, 'model_limitations')['rows'][0]['cells']
+    assert [(cell['field'], cell['type']) for cell in cells] == [('owner', 'removed'), ('status', 'added')]
+
+
+@pytest.mark.parametrize('seed', range(40))
+def test_diff_segments_rebuild_both_tables(service, seed):
+    rng = random.Random(seed)
+    titles = [f"Risk {index} {rng.choice(['data', 'model', 'process'])}" for index in range(12)]
+    original = [risk(title, f"Description {rng.randint(0, 3)} for {title}.") for title in titles[:8]]
+    revised = [dict(row) for row in original]
+    for _ in range(4):
+        action = rng.choice(['edit', 'insert', 'delete', 'move'])
+        if action == 'edit' and revised:
+            row = rng.choice(revised)
+            row[rng.choice(FIELDS)] = f"Changed {rng.randint(0, 99)}"
+        elif action == 'insert':
+            revised.insert(rng.randint(0, len(revised)), risk(rng.choice(titles[8:]) + f" {rng.randint(0, 99)}"))
+        elif action == 'delete' and revised:
+            del revised[rng.randrange(len(revised))]
+        elif action == 'move' and len(revised) > 1:
+            revised.insert(rng.randint(0, len(revised) - 1), revised.pop(rng.randrange(len(revised))))
+
+    table_diff = service.compute_table_diff(original, revised, 'model_risk_issues', FIELDS)
+    summary = table_diff['summary']
+    assert summary['rows_added'] + summary['rows_modified'] + summary['rows_unchanged'] == len(revised)
+    assert summary['rows_removed'] + summary['rows_modified'] + summary['rows_unchanged'] == len(original)
+
+    result = service.to_diff_segments(table_diff, FIELDS)
+    assert json.loads(result.original) == {'rows': original}
+    assert json.loads(result.revised) == {'rows': revised}
+    rebuilt_original = ''.join(result.text(segment) for segment in result if segment.type != 'added')
+    rebuilt_revised = ''.join(result.text(segment) for segment in result if segment.type != 'removed')
+    assert rebuilt_original == result.original
+    assert rebuilt_revised == result.revised
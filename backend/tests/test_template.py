@@ -0,0 +1,42 @@
+import io
+import os
+
+import pytest
+
+from template import DocxTemplate
+
+
+TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'template-tagged.docx')
+
+
+@pytest.fixture
+def compiled_parts():
+    DocxTemplate.compiled_parts.clear()
+    yield DocxTemplate.compiled_parts
+    DocxTemplate.compiled_parts.clear()
+
+
+def render_template(context, **kwargs) -> bytes:
+    doc = DocxTemplate(TEMPLATE_PATH)
+    doc.render(context, **kwargs)
+    output = io.BytesIO()
+    doc.save(output)
+    return output.getvalue()
+
+
+@pytest.mark.parametrize('autoescape', [False, True])
+def test_repeated_renders_reuse_compiled_parts(compiled_parts, autoescape):
+    context = {'model_name': 'Credit <PD> & LGD'}
+    render_template(context, autoescape=autoescape)
+    first = compiled_parts.get_stats()
+
+    render_template(context, autoescape=autoescape)
+    second = compiled_parts.get_stats()
+    assert second['entries'] == first['entries']
+    assert second['misses'] == first['misses']
+    assert second['hits'] > first['hits']
+
+
+def test_autoescape_renders_share_one_environment():
+    assert DocxTemplate.get_autoescape_env() is DocxTemplate.get_autoescape_env()
+    assert DocxTemplate.get_autoescape_env().autoescape is True
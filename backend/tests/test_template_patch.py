@@ -0,0 +1,141 @@
+import os
+import random
+import re
+
+import pytest
+
+from template import DocxTemplate, preserve_space, sub_at
+
+
+TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'template-tagged.docx')
+
+
+def regex_patch_xml(src_xml):
+    """The regex cascade patch_xml replaced, kept as the reference its output must match"""
+    src_xml = re.sub(r'(?<={)(<[^>]*>)+(?=[\{%\#])|(?<=[%\}\#])(<[^>]*>)+(?=\})', '', src_xml, flags=re.DOTALL)
+
+    def striptags(m):
+        return re.sub('</w:t>.*?(<w:t>|<w:t [^>]*>)', '', m.group(0), flags=re.DOTALL)
+
+    src_xml = re.sub(r'{%(?:(?!%}).)*|{#(?:(?!#}).)*|{{(?:(?!}}).)*', striptags, src_xml, flags=re.DOTALL)
+
+    def cell_property(m, pattern, element):
+        cell_xml = m.group(1) + m.group(3)
+        cell_xml = re.sub(r'<w:r[ >](?:(?!<w:r[ >]).)*<w:t></w:t>.*?</w:r>', '', cell_xml, flags=re.DOTALL)
+        cell_xml = re.sub(pattern, '', cell_xml, count=1)
+        return re.sub(r'(<w:tcPr[^>]*>)', r'\1' + element % m.group(2), cell_xml)
+
+    src_xml = re.sub(
+        r'(<w:tc[ >](?:(?!<w:tc[ >]).)*){%\s*colspan\s+([^%]*)\s*%}(.*?</w:tc>)',
+        lambda m: cell_property(m, r'<w:gridSpan[^/]*/>', '<w:gridSpan w:val="{{%s}}"/>'),
+        src_xml, flags=re.DOTALL)
+    src_xml = re.sub(
+        r'(<w:tc[ >](?:(?!<w:tc[ >]).)*){%\s*cellbg\s+([^%]*)\s*%}(.*?</w:tc>)',
+        lambda m: cell_property(m, r'<w:shd[^/]*/>', '<w:shd w:val="clear" w:color="auto" w:fill="{{%s}}"/>'),
+        src_xml, flags=re.DOTALL)
+
+    src_xml = re.sub(r'<w:t>((?:(?!<w:t>).)*)({{.*?}}|{%.*?%})', r'<w:t xml:space="preserve">\1\2', src_xml, flags=re.DOTALL)
+    src_xml = re.sub(
+        r'({{r\s.*?}}|{%r\s.*?%})',
+        r'</w:t></w:r><w:r><w:t xml:space="preserve">\1</w:t></w:r><w:r><w:t xml:space="preserve">',
+        src_xml, flags=re.DOTALL)
+
+    src_xml = re.sub(r'</w:t>(?:(?!</w:t>).)*?{%-', '{%', src_xml, flags=re.DOTALL)
+    src_xml = re.sub(r'-%}(?:(?!<w:t[ >]|{%|{{).)*?<w:t[^>]*?>', '%}', src_xml, flags=re.DOTALL)
+
+    for y in ['tr', 'tc', 'p', 'r']:
+        pat = r'<w:%(y)s[ >](?:(?!<w:%(y)s[ >]).)*({%%|{{)%(y)s ([^}%%]*(?:%%}|}})).*?</w:%(y)s>' % {'y': y}
+        src_xml = re.sub(pat, r'\1 \2', src_xml, flags=re.DOTALL)
+    for y in ['tr', 'tc', 'p']:
+        pat = r'<w:%(y)s[ >](?:(?!<w:%(y)s[ >]).)*({#)%(y)s ([^}#]*(?:#})).*?</w:%(y)s>' % {'y': y}
+        src_xml = re.sub(pat, r'\1 \2', src_xml, flags=re.DOTALL)
+
+    def v_merge_tc(m):
+        def v_merge(m1):
+            return ('<w:vMerge w:val="{% if loop.first %}restart{% else %}continue{% endif %}"/>'
+                    + m1.group(1) + '{% if loop.first %}' + m1.group(2) + m1.group(3) + '{% endif %}' + m1.group(4))
+
+        return re.sub(r'(</w:tcPr[ >].*?<w:t(?:.*?)>)(.*?)(?:{%\s*vm\s*%})(.*?)(</w:t>)', v_merge, m.group(), flags=re.DOTALL)
+
+    src_xml = re.sub(r'<w:tc[ >](?:(?!<w:tc[ >]).)*?{%\s*vm\s*%}.*?</w:tc[ >]', v_merge_tc, src_xml, flags=re.DOTALL)
+
+    def h_merge_tc(m):
+        xml_to_patch = m.group()
+        if re.search(r'w:gridSpan', xml_to_patch):
+            xml = re.sub(r'(w:gridSpan w:val=")(\d+)(")',
+                         lambda m1: m1.group(1) + '{{ ' + m1.group(2) + ' * loop.length }}' + m1.group(3),
+                         xml_to_patch, flags=re.DOTALL)
+            xml = re.sub(r'{%\s*hm\s*%}', '', xml, flags=re.DOTALL)
+        else:
+            xml = re.sub(r'(</w:tcPr[ >].*?<w:t(?:.*?)>)(.*?)(?:{%\s*hm\s*%})(.*?)(</w:t>)',
+                         lambda m2: '<w:gridSpan w:val="{{ loop.length }}"/>' + m2.group(1) + m2.group(2) + m2.group(3) + m2.group(4),
+                         xml_to_patch, flags=re.DOTALL)
+        return '{% if loop.first %}' + xml + '{% endif %}'
+
+    src_xml = re.sub(r'<w:tc[ >](?:(?!<w:tc[ >]).)*?{%\s*hm\s*%}.*?</w:tc[ >]', h_merge_tc, src_xml, flags=re.DOTALL)
+
+    def clean_tags(m):
+        return (m.group(0).replace(r'&#8216;', "'").replace('&lt;', '<').replace('&gt;', '>')
+                .replace('“', '"').replace('”', '"').replace('‘', "'").replace('’', "'"))
+
+    return re.sub(r'(?<=\{[\{%])(.*?)(?=[\}%]})', clean_tags, src_xml)
+
+
+# Pieces of WordprocessingML and jinja2 tags that random templates are made of
+FRAGMENTS = [
+    '<w:p>', '<w:p w:x="1">', '</w:p>', '<w:pPr><w:jc/></w:pPr>', '<w:r>', '<w:r w:a="b">', '</w:r>',
+    '<w:rPr><w:b/></w:rPr>', '<w:t>', '<w:t xml:space="preserve">', '</w:t>', '<w:tc>', '<w:tc w:x="1">', '</w:tc>',
+    '<w:tcPr>', '</w:tcPr>', '<w:gridSpan w:val="2"/>', '<w:shd w:fill="x"/>', '<w:tr>', '<w:tr w:r="1">', '</w:tr>',
+    '<w:tbl>', '</w:tbl>', '<w:tab/>', '<w:tcW w:w="5"/>',
+    '{', '}', '%', '#', '{{', '}}', '{%', '%}', '{#', '#}', '{%-', '-%}', '{{r ', '{%r ', '{%tr ', '{%tc ', '{%p ',
+    '{{tr ', '{{p ', '{#tr ', '{#tc ', '{#p ', '{% colspan ', '{%colspan x%}', '{% cellbg c %}', '{% vm %}', '{%vm%}',
+    '{% hm %}', 'x', ' ', 'abc', '&lt;', '&gt;', '“', '’', '&#8216;', '\n', 'for i in y', 'endfor', 'if a', ' %}', ' }}',
+    ' #}', 'loop',
+]
+
+
+def random_xml(rng, max_fragments=60):
+    return ''.join(rng.choice(FRAGMENTS) for _ in range(rng.randint(1, max_fragments)))
+
+
+@pytest.fixture(scope='module')
+def template():
+    return DocxTemplate.__new__(DocxTemplate)
+
+
+@pytest.mark.parametrize('seed', range(8))
+def test_patch_xml_matches_regex_cascade(template, seed):
+    rng = random.Random(seed)
+    for _ in range(500):
+        xml = random_xml(rng)
+        assert template.patch_xml(xml) == regex_patch_xml(xml), xml
+
+
+def test_patch_xml_matches_regex_cascade_on_template_body(template):
+    doc = DocxTemplate(TEMPLATE_PATH)
+    doc.init_docx()
+    xml = doc.get_xml()
+    assert '{{' in xml
+    assert template.patch_xml(xml) == regex_patch_xml(xml)
+
+
+@pytest.mark.parametrize('pattern', [
+    r'<w:tc[ >](?:(?!<w:tc[ >]).)*?{%\s*vm\s*%}.*?</w:tc[ >]',
+    r'({{r\s.*?}}|{%r\s.*?%})',
+    r'</w:t>(?:(?!</w:t>).)*?{%-',
+])
+def test_sub_at_matches_re_sub_at_candidate_offsets(pattern):
+    compiled = re.compile(pattern, re.DOTALL)
+    rng = random.Random(pattern)
+    for _ in range(500):
+        xml = random_xml(rng)
+        # Every offset is a candidate, so sub_at must agree with a full scan
+        assert sub_at(compiled, '#', xml, range(len(xml) + 1)) == compiled.sub('#', xml), xml
+
+
+def test_preserve_space_matches_re_sub():
+    rng = random.Random(3)
+    for _ in range(2000):
+        xml = random_xml(rng)
+        expected = re.sub(r'<w:t>((?:(?!<w:t>).)*)({{.*?}}|{%.*?%})', r'<w:t xml:space="preserve">\1\2', xml, flags=re.DOTALL)
+        assert preserve_space(xml) == expected, xml
@@ -18,11 +18,13 @@ import {
   Menu,
   MenuItem,
   Select,
-  FormControl
+  FormControl,
+  CircularProgress
 } from '@material-ui/core';
-import { Add as AddIcon, Check as CheckIcon, GetApp as DownloadIcon, Close as CloseIcon, Block as BlockIcon, Delete as DeleteIcon } from '@material-ui/icons';
+import { Add as AddIcon, Check as CheckIcon, GetApp as DownloadIcon, Close as CloseIcon, Block as BlockIcon, Delete as DeleteIcon, Create as CreateIcon } from '@material-ui/icons';
 import { useDocumentSections } from '../hooks/useDocumentSections';
 import { DocumentInfo, SectionData, TemplateInfo } from '../types/document.types';
+import { generateDraftsBatch } from '../services/api.service';
 import DocumentSetup from './DocumentSetup';
 import SectionWorkflow from './SectionWorkflow';
 import TableWorkflow from './TableWorkflow';
@@ -73,6 +75,7 @@ const Craft: React.FC = () => {
   const [showGenerationModal, setShowGenerationModal] = useState(false);
   const [showClearDataDialog, setShowClearDataDialog] = useState(false);
   const [contextMenu, setContextMenu] = useState<{ mouseX: number; mouseY: number; sectionId: string } | null>(null);
+  const [batchProgress, setBatchProgress] = useState<{ finished: number; total: number } | null>(null);
   
   const {
     sections,
@@ -105,6 +108,43 @@ const Craft: React.FC = () => {
     return setupComplete && sectionsComplete;
   };
 
+  // Open sections with notes but no draft yet, which "Draft All" generates in one batch
+  const sectionsToDraft = sections.filter(section =>
+    !section.isCompleted && section.data.notes.trim() && !section.data.draft.trim()
+  );
+
+  const handleDraftAllSections = async () => {
+    if (sectionsToDraft.length === 0) return;
+
+    setBatchProgress({ finished: 0, total: sectionsToDraft.length });
+    try {
+      // Each section's draft is saved as soon as its 'section' event arrives
+      await generateDraftsBatch({
+        sections: sectionsToDraft.map(section => ({
+          sectionId: section.id,
+          notes: section.data.notes,
+          sectionName: section.name,
+          sectionType: section.type,
+          guidelines: section.guidelines?.draft
+        })),
+        modelId: selectedModel
+      }, {
+        onSection: (result) => {
+          if (result.result !== undefined) {
+            updateSectionData(result.sectionId, 'draft', result.result);
+          } else {
+            console.error(`Error drafting section ${result.sectionName}:`, result.error);
+          }
+          setBatchProgress(prev => prev && { ...prev, finished: prev.finished + 1 });
+        }
+      });
+    } catch (error) {
+      console.error('Error drafting sections:', error);
+    } finally {
+      setBatchProgress(null);
+    }
+  };
+
   const handleTabChange = (event: React.ChangeEvent<{}>, newValue: number) => {
     if (newValue === sections.length + 1) {
       setAddTabDialog(true);
@@ -266,6 +306,31 @@ const Craft: React.FC = () => {
               </FormControl>
             </Box>
 
+            {/* Draft All Button */}
+            <Box mr={1}>
+              <Button
+                size="small"
+                onClick={handleDraftAllSections}
+                disabled={batchProgress !== null || sectionsToDraft.length === 0}
+                style={{ 
+                  color: 'white',
+                  textTransform: 'none',
+                  minWidth: 'auto',
+                  padding: '4px 8px'
+                }}
+                startIcon={batchProgress ? (
+                  <CircularProgress size={14} style={{ color: 'white' }} />
+                ) : (
+                  <CreateIcon style={{ fontSize: '16px' }} />
+                )}
+                title="Generate drafts for every open section that has notes but no draft"
+              >
+                {batchProgress
+                  ? `Drafting ${batchProgress.finished}/${batchProgress.total}...`
+                  : 'Draft All'}
+              </Button>
+            </Box>
+
             {/* Clear Data Button */}
             <Box>
               <Button
@@ -12,7 +12,7 @@ import {
   Radio
 } from '@material-ui/core';
 import { Check as CheckIcon, Close as CloseIcon } from '@material-ui/icons';
-import { DiffSegment, DiffSummary } from '../types/document.types';
+import { DiffSegment, DiffSummary, MergeConflict } from '../types/document.types';
 import DiffViewer, { DiffViewMode } from './DiffViewer';
 import { dialogStyles } from '../utils/diffStyles';
 
@@ -27,6 +27,7 @@ interface DraftComparisonDialogProps {
   fieldOrder?: string[];
   diffSegments?: DiffSegment[];
   diffSummary?: DiffSummary;
+  conflicts?: MergeConflict[];
 }
 
 const DraftComparisonDialog: React.FC<DraftComparisonDialogProps> = ({
@@ -39,7 +40,8 @@ const DraftComparisonDialog: React.FC<DraftComparisonDialogProps> = ({
   isTable = false,
   fieldOrder,
   diffSegments,
-  diffSummary
+  diffSummary,
+  conflicts
 }) => {
   const [viewMode, setViewMode] = useState<DiffViewMode>('unified');
 
@@ -85,6 +87,12 @@ const DraftComparisonDialog: React.FC<DraftComparisonDialogProps> = ({
           {diffSegments ? 'Choose your preferred view mode below' : 'Compare the current version with the proposed changes'}
         </Typography>
         {diffSummary && renderSummary(diffSummary)}
+        {conflicts && conflicts.length > 0 && (
+          <Typography variant="body2" style={{ color: '#ff9800' }}>
+            The draft changed while this edit was generated: {conflicts.length} overlapping{' '}
+            {conflicts.length === 1 ? 'change keeps' : 'changes keep'} the current text.
+          </Typography>
+        )}
         
         {/* View Mode Selector */}
         {diffSegments && (
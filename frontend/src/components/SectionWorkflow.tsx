@@ -22,13 +22,14 @@ import {
   Block as BlockIcon,
   Settings as SettingsIcon 
 } from '@material-ui/icons';
-import { DocumentSection, SectionData, DiffSegment, DiffSummary, TextSelection } from '../types/document.types';
+import { DocumentSection, SectionData, DiffSegment, DiffSummary, MergeConflict, TextSelection } from '../types/document.types';
 import { 
-  generateDraftFromNotes, 
-  generateReview, 
+  streamDraftFromNotes, 
+  streamReview, 
   generateDraftFromReviewWithDiff,
   generateReviewForSelection,
-  applyReviewToSelectionWithDiff 
+  applyReviewToSelectionWithDiff,
+  rebaseDraft
 } from '../services/api.service';
 import FormattedDocument from './FormattedDocument';
 import DraftComparisonDialog from './DraftComparisonDialog';
@@ -62,12 +63,27 @@ const SectionWorkflow: React.FC<SectionWorkflowProps> = ({
     open: false,
     proposedDraft: '',
     diffSegments: undefined as DiffSegment[] | undefined,
-    diffSummary: undefined as DiffSummary | undefined
+    diffSummary: undefined as DiffSummary | undefined,
+    conflicts: undefined as MergeConflict[] | undefined
   });
   const [guidelinesModalOpen, setGuidelinesModalOpen] = useState(false);
   // Use persistent selection from section data instead of local state
   const textSelection = section.data.selection || null;
   const draftTextareaRef = useRef<HTMLTextAreaElement>(null);
+  // Latest draft, checked when a generation finishes to detect edits made meanwhile
+  const latestDraftRef = useRef(section.data.draft);
+  latestDraftRef.current = section.data.draft;
+  // Text streamed so far for a field being generated, shown in place of the saved value
+  const [streamingText, setStreamingText] = useState<{ draft?: string; reviewNotes?: string }>({});
+  const streamControllersRef = useRef<{ [operation: string]: AbortController }>({});
+
+  // Cancel in-flight generation streams when the section is closed
+  useEffect(() => {
+    const controllers = streamControllersRef.current;
+    return () => {
+      Object.values(controllers).forEach(controller => controller.abort());
+    };
+  }, []);
 
   const steps = ['Notes', 'Draft & Review Cycle'];
 
@@ -100,25 +116,60 @@ const SectionWorkflow: React.FC<SectionWorkflowProps> = ({
     setLoading(prev => ({ ...prev, [operation]: state }));
   };
 
+  // Start a stream for an operation, cancelling any earlier one still running for it
+  const startStream = (operation: string): AbortController => {
+    streamControllersRef.current[operation]?.abort();
+    const controller = new AbortController();
+    streamControllersRef.current[operation] = controller;
+    return controller;
+  };
+
+  const finishStream = (operation: string, controller: AbortController) => {
+    if (streamControllersRef.current[operation] === controller) {
+      delete streamControllersRef.current[operation];
+    }
+  };
+
+  const appendStreamingText = (field: 'draft' | 'reviewNotes', text: string) => {
+    setStreamingText(prev => ({ ...prev, [field]: (prev[field] || '') + text }));
+  };
+
+  const clearStreamingText = (field: 'draft' | 'reviewNotes') => {
+    setStreamingText(prev => ({ ...prev, [field]: undefined }));
+  };
+
   const handleGenerateDraftFromNotes = async () => {
     if (!section.data.notes.trim()) return;
     
     setLoadingState('notes', true);
+    const controller = startStream('notes');
+    setStreamingText(prev => ({ ...prev, draft: '' }));
     try {
-      const result = await generateDraftFromNotes({ 
+      // The outline streams into the draft box first, then is replaced by the draft itself
+      const result = await streamDraftFromNotes({ 
         notes: section.data.notes,
         sectionName: section.name,
         sectionType: section.type,
         guidelines: section.guidelines?.draft,
         modelId: selectedModel
+      }, {
+        onOutlineToken: (text) => appendStreamingText('draft', text),
+        onOutline: () => setStreamingText(prev => ({ ...prev, draft: '' })),
+        onToken: (text) => appendStreamingText('draft', text),
+        signal: controller.signal
       });
       onSectionUpdate(section.id, 'draft', result);
       // Clear selection when generating new draft since content is completely replaced
       onSelectionClear(section.id);
     } catch (error) {
+      if (controller.signal.aborted) return;
       console.error('Error generating draft:', error);
     } finally {
-      setLoadingState('notes', false);
+      if (!controller.signal.aborted) {
+        clearStreamingText('draft');
+        setLoadingState('notes', false);
+      }
+      finishStream('notes', controller);
     }
   };
 
@@ -127,20 +178,30 @@ const SectionWorkflow: React.FC<SectionWorkflowProps> = ({
     if (!section.data.draft.trim()) return;
     
     setLoadingState('generate-review', true);
+    const controller = startStream('generate-review');
+    setStreamingText(prev => ({ ...prev, reviewNotes: '' }));
     try {
-      const result = await generateReview({ 
+      const result = await streamReview({ 
         draft: section.data.draft,
         sectionName: section.name,
         sectionType: section.type,
         guidelines: section.guidelines?.review,
         draftGuidelines: section.guidelines?.draft,
         modelId: selectedModel
+      }, {
+        onToken: (text) => appendStreamingText('reviewNotes', text),
+        signal: controller.signal
       });
       onSectionUpdate(section.id, 'reviewNotes', result);
     } catch (error) {
+      if (controller.signal.aborted) return;
       console.error('Error generating review:', error);
     } finally {
-      setLoadingState('generate-review', false);
+      if (!controller.signal.aborted) {
+        clearStreamingText('reviewNotes');
+        setLoadingState('generate-review', false);
+      }
+      finishStream('generate-review', controller);
     }
   };
 
@@ -148,9 +209,10 @@ const SectionWorkflow: React.FC<SectionWorkflowProps> = ({
     if (!section.data.draft.trim() || !section.data.reviewNotes.trim()) return;
     
     setLoadingState('apply-review', true);
+    const requestDraft = section.data.draft;
     try {
       const result = await generateDraftFromReviewWithDiff({
-        draft: section.data.draft,
+        draft: requestDraft,
         reviewNotes: section.data.reviewNotes,
         sectionName: section.name,
         sectionType: section.type,
@@ -160,17 +222,43 @@ const SectionWorkflow: React.FC<SectionWorkflowProps> = ({
       });
       
       // Open comparison dialog with diff data
+      await showProposedDraft(requestDraft, result);
+    } catch (error) {
+      console.error('Error revising draft with diff:', error);
+    } finally {
+      setLoadingState('apply-review', false);
+    }
+  };
+
+  // Open the comparison dialog for a generated draft. If the draft was edited while the
+  // request ran, the generated edit is rebased onto the current draft instead of replacing it.
+  const showProposedDraft = async (
+    requestDraft: string,
+    result: { new_draft: string; diff_segments: DiffSegment[]; diff_summary: DiffSummary }
+  ) => {
+    const latestDraft = latestDraftRef.current;
+    if (latestDraft === requestDraft) {
       setComparisonDialog({
         open: true,
         proposedDraft: result.new_draft,
         diffSegments: result.diff_segments,
-        diffSummary: result.diff_summary
+        diffSummary: result.diff_summary,
+        conflicts: undefined
       });
-    } catch (error) {
-      console.error('Error revising draft with diff:', error);
-    } finally {
-      setLoadingState('apply-review', false);
+      return;
     }
+    const rebased = await rebaseDraft({
+      baseDraft: requestDraft,
+      editedDraft: result.new_draft,
+      latestDraft
+    });
+    setComparisonDialog({
+      open: true,
+      proposedDraft: rebased.new_draft,
+      diffSegments: rebased.diff_segments,
+      diffSummary: rebased.diff_summary,
+      conflicts: rebased.conflicts
+    });
   };
 
   const handleAcceptChanges = () => {
@@ -181,7 +269,8 @@ const SectionWorkflow: React.FC<SectionWorkflowProps> = ({
       open: false, 
       proposedDraft: '',
       diffSegments: undefined,
-      diffSummary: undefined
+      diffSummary: undefined,
+      conflicts: undefined
     });
   };
 
@@ -190,7 +279,8 @@ const SectionWorkflow: React.FC<SectionWorkflowProps> = ({
       open: false, 
       proposedDraft: '',
       diffSegments: undefined,
-      diffSummary: undefined
+      diffSummary: undefined,
+      conflicts: undefined
     });
   };
 
@@ -238,6 +328,8 @@ const SectionWorkflow: React.FC<SectionWorkflowProps> = ({
         guidelines: section.guidelines?.review,
         draftGuidelines: section.guidelines?.draft,
         fullDraft: section.data.draft,
+        selectionStart: textSelection.start,
+        selectionEnd: textSelection.end,
         modelId: selectedModel
       });
       
@@ -253,9 +345,10 @@ const SectionWorkflow: React.FC<SectionWorkflowProps> = ({
     if (!textSelection || !section.data.reviewNotes.trim()) return;
     
     setLoadingState('apply-selection', true);
+    const requestDraft = section.data.draft;
     try {
       const result = await applyReviewToSelectionWithDiff({
-        fullDraft: section.data.draft,
+        fullDraft: requestDraft,
         selectedText: textSelection.text,
         selectionStart: textSelection.start,
         selectionEnd: textSelection.end,
@@ -267,12 +360,7 @@ const SectionWorkflow: React.FC<SectionWorkflowProps> = ({
         modelId: selectedModel
       });
       
-      setComparisonDialog({
-        open: true,
-        proposedDraft: result.new_draft,
-        diffSegments: result.diff_segments,
-        diffSummary: result.diff_summary
-      });
+      await showProposedDraft(requestDraft, result);
     } catch (error) {
       console.error('Error applying review to selection:', error);
     } finally {
@@ -458,8 +546,9 @@ const SectionWorkflow: React.FC<SectionWorkflowProps> = ({
                     multiline
                     rows={24}
                     variant="outlined"
-                    value={section.data.draft}
+                    value={streamingText.draft ?? section.data.draft}
                     onChange={(e) => onSectionUpdate(section.id, 'draft', e.target.value)}
+                    InputProps={{ readOnly: streamingText.draft !== undefined }}
                     onFocus={() => setFocusedField(`draft-${section.id}`)}
                     onBlur={() => setFocusedField(null)}
                     onSelect={handleSelectionChange}
@@ -515,8 +604,9 @@ const SectionWorkflow: React.FC<SectionWorkflowProps> = ({
                     multiline
                     rows={24}
                     variant="outlined"
-                    value={section.data.reviewNotes}
+                    value={streamingText.reviewNotes ?? section.data.reviewNotes}
                     onChange={(e) => onSectionUpdate(section.id, 'reviewNotes', e.target.value)}
+                    InputProps={{ readOnly: streamingText.reviewNotes !== undefined }}
                     onFocus={() => setFocusedField(`review-${section.id}`)}
                     onBlur={() => setFocusedField(null)}
                     placeholder="Review suggestions will appear here, or write your own feedback..."
@@ -541,6 +631,7 @@ const SectionWorkflow: React.FC<SectionWorkflowProps> = ({
         isTable={false}
         diffSegments={comparisonDialog.diffSegments}
         diffSummary={comparisonDialog.diffSummary}
+        conflicts={comparisonDialog.conflicts}
       />
 
       <GuidelinesEditorModal
@@ -6,6 +6,9 @@ import {
   GenerateReviewRequest,
   GenerateDraftFromReviewRequest,
   GenerateDraftFromNotesRequest,
+  GenerationStreamHandlers,
+  GenerateDraftsBatchRequest,
+  BatchDraftSummary,
   GenerateDocumentRequest,
   GenerateDocumentResponse,
   GenerateDraftFromReviewWithDiffResponse,
@@ -14,7 +17,10 @@ import {
   GenerateSelectionReviewRequest,
   ApplySelectionReviewRequest,
   ApplySelectionReviewResponse,
+  RebaseDraftRequest,
+  RebaseDraftResponse,
 } from '../types/document.types';
+import { withExpandedDiff } from '../utils/diffFormat';
 
 const API_BASE_URL = process.env.REACT_APP_API_BASE_URL || 'http://localhost:8888';
 
@@ -61,19 +67,91 @@ export async function generateDraftFromNotes(request: GenerateDraftFromNotesRequ
   return response.data.result;
 }
 
+// POST to a server-sent-event endpoint and dispatch events until 'done' (axios 0.19 cannot stream)
+async function postEventStream<T = string>(path: string, request: object, handlers: GenerationStreamHandlers): Promise<T> {
+  const response = await fetch(`${API_BASE_URL}${path}`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify(request),
+    signal: handlers.signal,
+  });
+  if (!response.ok || !response.body) {
+    const errorBody = await response.json().catch(() => null);
+    throw new Error(errorBody?.error || `Request to ${path} failed with status ${response.status}`);
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    let boundary = buffer.indexOf('\n\n');
+    while (boundary !== -1) {
+      const rawEvent = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      boundary = buffer.indexOf('\n\n');
+
+      const eventName = rawEvent.match(/^event: (.*)$/m)?.[1];
+      const data = JSON.parse(rawEvent.match(/^data: (.*)$/m)?.[1] || '{}');
+      switch (eventName) {
+        case 'outline_token':
+          handlers.onOutlineToken?.(data.text);
+          break;
+        case 'outline':
+          handlers.onOutline?.(data.result);
+          break;
+        case 'token':
+          handlers.onToken?.(data.text);
+          break;
+        case 'section':
+          handlers.onSection?.(data);
+          break;
+        case 'error':
+          throw new Error(data.error);
+        case 'done':
+          reader.cancel();
+          return data.result;
+      }
+    }
+  }
+  throw new Error(`Stream from ${path} ended before completion`);
+}
+
+export async function streamDraftFromNotes(request: GenerateDraftFromNotesRequest, handlers: GenerationStreamHandlers): Promise<string> {
+  return postEventStream('/api/generate-draft-from-notes-stream', request, handlers);
+}
+
+export async function generateDraftsBatch(request: GenerateDraftsBatchRequest, handlers: GenerationStreamHandlers): Promise<BatchDraftSummary> {
+  return postEventStream<BatchDraftSummary>('/api/generate-drafts-batch', request, handlers);
+}
+
+export async function streamReview(request: GenerateReviewRequest, handlers: GenerationStreamHandlers): Promise<string> {
+  return postEventStream('/api/generate-review-stream', request, handlers);
+}
+
 export async function generateDraftFromReviewWithDiff(request: GenerateDraftFromReviewRequest): Promise<GenerateDraftFromReviewWithDiffResponse> {
-  const response = await axiosInstance.post<ApiResponse<GenerateDraftFromReviewWithDiffResponse>>('/api/generate-draft-from-review-with-diff', request);
-  return response.data.result;
+  // Diffs travel in the compact format and are expanded here for DiffViewer
+  const body = { diffFormat: 'compact', ...request };
+  const response = await axiosInstance.post<ApiResponse<GenerateDraftFromReviewWithDiffResponse>>('/api/generate-draft-from-review-with-diff', body);
+  return withExpandedDiff(response.data.result, body);
 }
 
 export async function generateRowFromReviewWithDiff(request: GenerateRowReviewRequest): Promise<GenerateRowReviewResponse> {
-  const response = await axiosInstance.post<ApiResponse<GenerateRowReviewResponse>>('/api/generate-row-from-review-with-diff', request);
-  return response.data.result;
+  // Diffs travel in the compact format and are expanded here for DiffViewer
+  const body = { diffFormat: 'compact', ...request };
+  const response = await axiosInstance.post<ApiResponse<GenerateRowReviewResponse>>('/api/generate-row-from-review-with-diff', body);
+  return withExpandedDiff(response.data.result, body);
 }
 
 export async function generateTableFromReviewWithDiff(request: GenerateDraftFromReviewRequest): Promise<GenerateDraftFromReviewWithDiffResponse> {
-  const response = await axiosInstance.post<ApiResponse<GenerateDraftFromReviewWithDiffResponse>>('/api/generate-table-from-review-with-diff', request);
-  return response.data.result;
+  // Diffs travel in the compact format and are expanded here for DiffViewer
+  const body = { diffFormat: 'compact', ...request };
+  const response = await axiosInstance.post<ApiResponse<GenerateDraftFromReviewWithDiffResponse>>('/api/generate-table-from-review-with-diff', body);
+  return withExpandedDiff(response.data.result, body);
 }
 
 export async function generateReviewForSelection(request: GenerateSelectionReviewRequest): Promise<string> {
@@ -82,8 +160,16 @@ export async function generateReviewForSelection(request: GenerateSelectionRevie
 }
 
 export async function applyReviewToSelectionWithDiff(request: ApplySelectionReviewRequest): Promise<ApplySelectionReviewResponse> {
-  const response = await axiosInstance.post<ApiResponse<ApplySelectionReviewResponse>>('/api/apply-review-to-selection-with-diff', request);
-  return response.data.result;
+  // Diffs travel in the compact format and are expanded here for DiffViewer
+  const body = { diffFormat: 'compact', ...request };
+  const response = await axiosInstance.post<ApiResponse<ApplySelectionReviewResponse>>('/api/apply-review-to-selection-with-diff', body);
+  return withExpandedDiff(response.data.result, body);
+}
+
+export async function rebaseDraft(request: RebaseDraftRequest): Promise<RebaseDraftResponse> {
+  const body = { diffFormat: 'compact', ...request };
+  const response = await axiosInstance.post<ApiResponse<RebaseDraftResponse>>('/api/rebase-draft', body);
+  return withExpandedDiff(response.data.result, body);
 }
 
 export async function generateDocument(request: GenerateDocumentRequest): Promise<GenerateDocumentResponse> {
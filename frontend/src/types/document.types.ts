@@ -72,6 +72,7 @@ export interface GenerateReviewRequest {
   guidelines?: string;
   draftGuidelines?: string;
   modelId?: string;
+  bypassCache?: boolean;
 }
 
 export interface GenerateDraftFromReviewRequest {
@@ -82,20 +83,65 @@ export interface GenerateDraftFromReviewRequest {
   guidelines?: string;
   draftGuidelines?: string;
   modelId?: string;
+  diffFormat?: DiffFormat;
 }
 
+// 'single' plans and writes in one structured completion; 'two_step' generates the outline first
+export type DraftMode = 'single' | 'two_step';
+
 export interface GenerateDraftFromNotesRequest {
   notes: string;
   sectionName: string;
   sectionType: string;
   guidelines?: string;
   modelId?: string;
+  bypassCache?: boolean;
+  draftMode?: DraftMode;
 }
 
 export interface ApiError {
   error: string;
 }
 
+export interface BatchDraftSection {
+  sectionId: string;
+  notes: string;
+  sectionName: string;
+  sectionType: string;
+  guidelines?: string;
+  draftMode?: DraftMode;
+}
+
+export interface GenerateDraftsBatchRequest {
+  sections: BatchDraftSection[];
+  maxConcurrency?: number;
+  modelId?: string;
+  bypassCache?: boolean;
+}
+
+export interface BatchDraftSectionResult {
+  index: number;
+  sectionId: string;
+  sectionName: string;
+  result?: string;
+  error?: string;
+}
+
+export interface BatchDraftSummary {
+  completed: number;
+  failed: number;
+}
+
+// Callbacks for server-sent-event generation endpoints
+export interface GenerationStreamHandlers {
+  onOutlineToken?: (text: string) => void;
+  onOutline?: (outline: string) => void;
+  onToken?: (text: string) => void;
+  onSection?: (section: BatchDraftSectionResult) => void;
+  // Aborting cancels the request; the pending call rejects with an AbortError
+  signal?: AbortSignal;
+}
+
 export interface GenerateDocumentRequest {
   documentId: string;
   documentData: DocumentInfo | null;
@@ -115,10 +161,68 @@ export interface DiffSegment {
   revised: string;
 }
 
+// Compact diff wire format: one op code per segment ('=' unchanged, '-' removed, '+' added)
+// and flat [start, end) ranges into the original (=, -) or revised (+) text. Texts the
+// client already has are referenced by field name ('new_draft', 'request.draft', ...).
+export interface CompactDiff {
+  format: 'compact';
+  ops: string;
+  // [start, end) pairs in UTF-16 code units, i.e. plain JavaScript string indices
+  ranges: number[];
+  original?: string;
+  revised?: string;
+  original_ref?: string;
+  revised_ref?: string;
+  granularity?: DiffGranularity;
+}
+
+export type DiffGranularity = 'char' | 'word' | 'sentence' | 'line' | 'rewrite';
+
+export type DiffFormat = 'segments' | 'compact';
+
 export interface DiffSummary {
   words_added: number;
   words_removed: number;
   words_unchanged: number;
+  lines_added?: number;
+  lines_removed?: number;
+  lines_unchanged?: number;
+  chars_added?: number;
+  chars_removed?: number;
+  chars_unchanged?: number;
+  // Share of characters (over both texts) that are part of a change
+  change_ratio?: number;
+}
+
+// Row-aware diff of table sections: one record per row, cell records for changed fields
+export interface TableCellChange {
+  field: string | null;
+  type: 'added' | 'removed' | 'modified';
+  original: string | number | null;
+  revised: string | number | null;
+  diff_segments?: DiffSegment[];
+}
+
+export interface TableRowChange {
+  type: 'unchanged' | 'modified' | 'added' | 'removed';
+  original_index: number | null;
+  revised_index: number | null;
+  moved: boolean;
+  original: { [key: string]: string | number } | null;
+  revised: { [key: string]: string | number } | null;
+  cells: TableCellChange[];
+}
+
+export interface TableDiff {
+  rows: TableRowChange[];
+  summary: {
+    rows_added: number;
+    rows_removed: number;
+    rows_modified: number;
+    rows_unchanged: number;
+    rows_moved: number;
+    cells_changed: number;
+  };
 }
 
 export interface GenerateDraftFromReviewWithDiffResponse {
@@ -127,6 +231,7 @@ export interface GenerateDraftFromReviewWithDiffResponse {
   new_formatted?: string;
   diff_segments: DiffSegment[];
   diff_summary: DiffSummary;
+  table_diff?: TableDiff;
 }
 
 export interface GenerateRowReviewRequest {
@@ -140,6 +245,7 @@ export interface GenerateRowReviewRequest {
   draftGuidelines?: string;
   fullTableData?: TableData;
   modelId?: string;
+  diffFormat?: DiffFormat;
 }
 
 export interface GenerateRowReviewResponse {
@@ -158,6 +264,8 @@ export interface GenerateSelectionReviewRequest {
   guidelines?: string;
   draftGuidelines?: string;
   fullDraft?: string;
+  selectionStart?: number;
+  selectionEnd?: number;
   modelId?: string;
 }
 
@@ -172,6 +280,7 @@ export interface ApplySelectionReviewRequest {
   guidelines?: string;
   draftGuidelines?: string;
   modelId?: string;
+  diffFormat?: DiffFormat;
 }
 
 export interface ApplySelectionReviewResponse {
@@ -180,4 +289,30 @@ export interface ApplySelectionReviewResponse {
   new_selection: string;
   diff_segments: DiffSegment[];
   diff_summary: DiffSummary;
+}
+
+// Three-way merge of an edit made against baseDraft into the latest draft
+export interface RebaseDraftRequest {
+  baseDraft: string;
+  editedDraft: string;
+  latestDraft: string;
+  prefer?: 'latest' | 'edited';
+  diffFormat?: DiffFormat;
+}
+
+// A region both sides changed differently; offsets index the merged draft
+export interface MergeConflict {
+  merged_start: number;
+  merged_end: number;
+  base: string;
+  edited: string;
+  latest: string;
+}
+
+export interface RebaseDraftResponse {
+  new_draft: string;
+  conflicts: MergeConflict[];
+  clean: boolean;
+  diff_segments: DiffSegment[];
+  diff_summary: DiffSummary;
 }
\ No newline at end of file
@@ -0,0 +1,34 @@
+import { expandCompactDiff, withExpandedDiff } from './diffFormat';
+import { CompactDiff } from '../types/document.types';
+
+// Payload produced by DiffResult.to_compact for 'Risk 📈 grew fast.' -> 'Risk 📈 grew 🚀 very fast.'
+const emojiDiff: CompactDiff = {
+  format: 'compact',
+  ops: '=+=',
+  ranges: [0, 13, 13, 21, 13, 18],
+  granularity: 'char',
+  original_ref: 'request.draft',
+  revised: 'Risk 📈 grew 🚀 very fast.'
+};
+
+test('expands ranges given in UTF-16 code units around astral characters', () => {
+  const segments = expandCompactDiff(emojiDiff, { draft: 'Risk 📈 grew fast.' }, {});
+  expect(segments.map(segment => [segment.type, segment.text])).toEqual([
+    ['unchanged', 'Risk 📈 grew '],
+    ['added', '🚀 very '],
+    ['unchanged', 'fast.']
+  ]);
+});
+
+test('resolves response references and leaves segment lists untouched', () => {
+  const result = {
+    new_draft: 'b',
+    diff_segments: { format: 'compact', ops: '-+', ranges: [0, 1, 0, 1], original: 'a', revised_ref: 'new_draft' } as CompactDiff
+  };
+  expect(withExpandedDiff(result, {}).diff_segments).toEqual([
+    { type: 'removed', text: 'a', original: 'a', revised: '' },
+    { type: 'added', text: 'b', original: '', revised: 'b' }
+  ]);
+  const expanded = withExpandedDiff(result, {});
+  expect(withExpandedDiff(expanded, {})).toBe(expanded);
+});
@@ -0,0 +1,64 @@
+/**
+ * Decoding of the compact diff wire format into the DiffSegment list used by DiffViewer
+ */
+
+import { CompactDiff, DiffSegment } from '../types/document.types';
+
+const SEGMENT_TYPES: { [op: string]: DiffSegment['type'] } = {
+  '=': 'unchanged',
+  '-': 'removed',
+  '+': 'added'
+};
+
+export function isCompactDiff(diff: unknown): diff is CompactDiff {
+  return !!diff && (diff as CompactDiff).format === 'compact';
+}
+
+/**
+ * Resolve a text reference: 'request.<field>' points into the request, '<field>' into the response
+ */
+function resolveText(text: string | undefined, ref: string | undefined, request: object, response: object): string {
+  if (text !== undefined) return text;
+  if (!ref) return '';
+  const [source, key] = ref.startsWith('request.') ? [request, ref.slice('request.'.length)] : [response, ref];
+  const value = (source as { [key: string]: unknown })[key];
+  return typeof value === 'string' ? value : '';
+}
+
+/**
+ * Expand a compact diff into DiffSegments
+ * @param diff - Compact diff returned by a *-with-diff endpoint
+ * @param request - The request body that produced it (for 'request.*' references)
+ * @param response - The response result holding the diff (for field references)
+ * @returns Segments in the classic { type, text, original, revised } shape
+ */
+export function expandCompactDiff(diff: CompactDiff, request: object, response: object): DiffSegment[] {
+  const original = resolveText(diff.original, diff.original_ref, request, response);
+  const revised = resolveText(diff.revised, diff.revised_ref, request, response);
+  const segments: DiffSegment[] = [];
+
+  for (let index = 0; index < diff.ops.length; index++) {
+    const type = SEGMENT_TYPES[diff.ops[index]];
+    const start = diff.ranges[2 * index];
+    const end = diff.ranges[2 * index + 1];
+    const text = type === 'added' ? revised.slice(start, end) : original.slice(start, end);
+    segments.push({
+      type,
+      text,
+      original: type === 'added' ? '' : text,
+      revised: type === 'removed' ? '' : text
+    });
+  }
+
+  return segments;
+}
+
+/**
+ * Replace a compact diff_segments payload in an API result with expanded segments
+ */
+export function withExpandedDiff<T extends { diff_segments: DiffSegment[] | CompactDiff }>(result: T, request: object): T & { diff_segments: DiffSegment[] } {
+  if (isCompactDiff(result.diff_segments)) {
+    return { ...result, diff_segments: expandCompactDiff(result.diff_segments, request, result) };
+  }
+  return result as T & { diff_segments: DiffSegment[] };
+}